@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Dependencies: the ones of embed_audio_in_video.py
+# Brief: Synchronize many audio/video pairs described in a manifest
+# Usage: python batch_sync.py -m manifest.csv -j 4 -l logs
+
+import sys
+import os
+import json
+from argparse import ArgumentParser
+
+from src.batch import read_manifest, run_jobs
+
+# ----------------------------------------------------------------------------
+
+PROGRAM = os.path.abspath(__file__)
+parser = ArgumentParser(usage="%s [options]" % os.path.basename(PROGRAM),
+                        description="... a script to synchronize many audio "
+                                    "and videos.")
+
+parser.add_argument("-m",
+                    metavar="file",
+                    required=True,
+                    help='Manifest file name (.csv or .json).')
+
+parser.add_argument("-j",
+                    metavar="value",
+                    required=False,
+                    type=int,
+                    default=2,
+                    help='Number of jobs running in parallel (default: 2).')
+
+parser.add_argument("-l",
+                    metavar="folder",
+                    required=False,
+                    default="logs",
+                    help='Directory to store the log of each job '
+                         '(default: logs).')
+
+if len(sys.argv) <= 1:
+    sys.argv.append('-h')
+
+args = parser.parse_args()
+
+# ----------------------------------------------------------------------------
+
+try:
+    jobs = read_manifest(args.m)
+except (IOError, ValueError) as e:
+    print("Invalid manifest {:s}: {:s}".format(args.m, str(e)))
+    sys.exit(1)
+print("{:d} jobs in {:s}".format(len(jobs), args.m))
+
+script = os.path.join(os.path.dirname(PROGRAM), "embed_audio_in_video.py")
+results = run_jobs(jobs, script, args.l, args.j)
+
+summary = os.path.join(args.l, "summary.json")
+with open(summary, "w") as fp:
+    json.dump(results, fp, indent=2)
+
+failed = [r for r in results if r["status"] != "ok"]
+print("")
+print("{:d} jobs done, {:d} failed.".format(len(results), len(failed)))
+for r in failed:
+    print("  - {:s}: see {:s}".format(r["name"], r["log"]))
+print("Summary saved into {:s}".format(summary))
+
+if len(failed) > 0:
+    sys.exit(1)
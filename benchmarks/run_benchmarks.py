@@ -0,0 +1,391 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Dependencies: ffmpeg (with libx264 and libx265), sox, numpy
+# Brief: Benchmark the primitives and the synchronization on synthetic media
+# Usage: python benchmarks/run_benchmarks.py -o results.json [--compare old.json]
+
+# Each case is a synthetic session (see synthetic.py) of a given duration,
+# video size, frame rate and number of audio channels. The time of each
+# primitive of src/ffmpeg_video.py and src/utils_audio.py is measured, and
+# the one of a whole synchronization by embed_audio_in_video.py. The clap
+# and the offset of the synthetic camera are known: the accuracy of their
+# estimation and of the synchronized audio is checked.
+
+import sys
+import os
+import json
+import time
+import shutil
+import platform
+import subprocess
+from argparse import ArgumentParser
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.utils_audio import WaveReader, sync_audio
+from src.ffmpeg_video import probe_media, extract_audio, trim_video_at_frame
+from src.ffmpeg_video import trim_video_parallel, smart_trim
+from src.ffmpeg_video import merge_video_audio, merge_and_compress
+from src.ffmpeg_video import INTERMEDIATE_CODECS, intermediate_codec
+from src.toolchain import has_encoder
+from src.frame_index import FrameIndex
+from benchmarks.synthetic import make_session
+
+# ----------------------------------------------------------------------------
+
+CASES = (
+    {"name": "10s_360p_25fps_mono", "duration": 10., "size": "640x360",
+     "fps": "25", "channels": 1},
+    {"name": "10s_720p_ntsc_stereo", "duration": 10., "size": "1280x720",
+     "fps": "30000/1001", "channels": 2},
+    {"name": "60s_720p_50fps_stereo", "duration": 60., "size": "1280x720",
+     "fps": "50", "channels": 2},
+    {"name": "60s_1080p_25fps_4ch", "duration": 60., "size": "1920x1080",
+     "fps": "25", "channels": 4},
+)
+QUICK_CASES = 2           # number of cases of a quick run
+
+CLAP = 2.5                # time of the clap in the audio (seconds)
+SHIFT = 1.2345            # start of the camera after the recorder (seconds)
+TOLERANCE = 0.002         # max error of a synchronization (seconds)
+SLOWER = 1.2              # ratio of a timing reported as a regression
+
+# ----------------------------------------------------------------------------
+
+
+def timed(timings, name, repeat, function, *args, **kwargs):
+    """Run a function repeat times and store its best time.
+
+    :return: the result of the last run
+
+    """
+    best = None
+    result = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    timings[name] = round(best, 6)
+    return result
+
+# ----------------------------------------------------------------------------
+
+
+def first_clap(audio):
+    """Return the time of the best clap of an audio, or None."""
+    from src.clap_detect import detect_claps
+    claps = detect_claps(audio, nbest=1)
+    if len(claps) == 0:
+        return None
+    return claps[0][0]
+
+# ----------------------------------------------------------------------------
+
+
+def bench_primitives(session, wk, repeat):
+    """Measure the time of each primitive and the accuracy of the analysis.
+
+    :return: (dict, dict) timings and accuracy
+
+    """
+    timings = dict()
+    accuracy = dict()
+    video = session["video"]
+    audio = session["audio"]
+
+    media = timed(timings, "probe_media", repeat, probe_media, video)
+    index = timed(timings, "frame_index", repeat, FrameIndex.from_video, video)
+    video_audio = os.path.join(wk, "camera_mono.wav")
+    timed(timings, "extract_audio", repeat, extract_audio, video,
+          video_audio, mono=True)
+
+    def read_header(filename):
+        with WaveReader(filename) as fa:
+            return fa.get_duration()
+    timed(timings, "read_wav_header", repeat, read_header, audio)
+
+    # analysis of the audio
+    try:
+        from src.audio_align import estimate_offset
+    except ImportError:
+        print("numpy is not installed: the analysis is not benchmarked.")
+    else:
+        clap = timed(timings, "detect_claps", repeat, first_clap, audio)
+        accuracy["audio_clap_error"] = None if clap is None else \
+            round(abs(clap - session["audio_clap"]), 6)
+        clap = first_clap(video_audio)
+        accuracy["video_clap_error"] = None if clap is None else \
+            round(abs(clap - session["video_clap"]), 6)
+        offset, confidence = timed(timings, "estimate_offset", repeat,
+                                   estimate_offset, audio, video_audio)
+        accuracy["offset_error"] = round(abs(offset + SHIFT), 6)
+
+    # synchronization of the audio, with the known claps
+    delta = session["video_clap"] - session["audio_clap"]
+    end = index.get_duration()
+    timed(timings, "sync_audio", repeat, sync_audio, audio, delta, 0., end,
+          os.path.join(wk, "audio_sync.wav"))
+
+    # trimming of the video: from the frame of the clap to the end
+    from_frame = index.time_to_frame(session["video_clap"])
+    to_frame = index.get_nframes()
+    trimmed = os.path.join(wk, "video_trim.mkv")
+    timed(timings, "trim_video_at_frame", repeat, trim_video_at_frame,
+          video, "{:.6f}".format(index.seek_time(from_frame)),
+          from_frame, to_frame, trimmed)
+    timed(timings, "trim_video_parallel", repeat, trim_video_parallel,
+          video, from_frame, to_frame, os.path.join(wk, "video_par.mkv"),
+          wk, None, index)
+    timed(timings, "smart_trim", repeat, smart_trim,
+          video, from_frame, to_frame, os.path.join(wk, "video_smart.mp4"),
+          wk, media, index)
+
+    synced = os.path.join(wk, "audio_sync.wav")
+    timed(timings, "merge_video_audio", repeat, merge_video_audio,
+          trimmed, synced, os.path.join(wk, "merged.mkv"))
+    timed(timings, "merge_and_compress", repeat, merge_and_compress,
+          trimmed, synced, os.path.join(wk, "merged.mp4"))
+
+    return timings, accuracy
+
+# ----------------------------------------------------------------------------
+
+
+def bench_intermediates(session, wk, repeat):
+    """Measure the trimming of the video with each lossless profile.
+
+    The copy profile needs a closed keyframe: it is measured from the first
+    one after the clap, and the other profiles from the clap.
+
+    :return: (dict, dict) timings and sizes of the files (bytes)
+
+    """
+    timings = dict()
+    sizes = dict()
+    video = session["video"]
+    index = FrameIndex.from_video(video)
+    to_frame = index.get_nframes()
+    from_frame = index.time_to_frame(session["video_clap"])
+    keyframes = index.keyframes_between(from_frame, to_frame, closed=True)
+    keyframe = keyframes[0] if len(keyframes) > 0 else None
+
+    for profile in sorted(INTERMEDIATE_CODECS):
+        vcodec = intermediate_codec(profile)[0]
+        if profile != "copy" and has_encoder(vcodec) is False:
+            print("ffmpeg has no {:s} encoder: profile {:s} is not "
+                  "benchmarked.".format(vcodec, profile))
+            continue
+        first = from_frame
+        seek_time = index.seek_time(first)
+        if profile == "copy":
+            if keyframe is None:
+                continue
+            first = keyframe
+            seek_time = index.frame_to_time(first) + \
+                index.frame_duration(first) / 4.
+        filename = os.path.join(wk, "video_{:s}.mkv".format(profile))
+        timed(timings, "trim_" + profile, repeat, trim_video_at_frame,
+              video, "{:.6f}".format(seek_time), first, to_frame, filename,
+              profile=profile)
+        if os.path.exists(filename):
+            sizes["trim_" + profile] = os.path.getsize(filename)
+            print("  - {:s}: {:.3f}s, {:.1f}MB".format(
+                profile, timings["trim_" + profile],
+                sizes["trim_" + profile] / float(1 << 20)))
+    return timings, sizes
+
+# ----------------------------------------------------------------------------
+
+
+def bench_end_to_end(session, wk):
+    """Measure a whole synchronization with the claps searched automatically.
+
+    :return: (dict, dict) timings and accuracy
+
+    """
+    timings = dict()
+    accuracy = dict()
+    workdir = os.path.join(wk, "sync")
+    log = os.path.join(wk, "sync.log")
+    command = [sys.executable, os.path.join(ROOT, "embed_audio_in_video.py"),
+               "-a", session["audio"], "-c", "auto",
+               "-v", session["video"], "-s", "auto",
+               "-w", workdir, "--mkv", "--no-cache"]
+    start = time.perf_counter()
+    with open(log, "w") as fp:
+        returncode = subprocess.call(command, stdin=subprocess.DEVNULL,
+                                     stdout=fp, stderr=subprocess.STDOUT)
+    timings["end_to_end"] = round(time.perf_counter() - start, 6)
+    accuracy["end_to_end_status"] = "ok" if returncode == 0 else "failed"
+    if returncode != 0:
+        print("The synchronization failed, see {:s}".format(log))
+        return timings, accuracy
+
+    # the synchronized audio starts at the first frame of the clap
+    profile = os.path.join(workdir, "profile.json")
+    if os.path.exists(profile):
+        with open(profile, "r") as fp:
+            timings["end_to_end_steps"] = dict(
+                (s["name"], s["wall"]) for s in json.load(fp)["steps"])
+    try:
+        index = FrameIndex.from_video(session["video"])
+        frame_time = index.frame_to_time(
+            index.time_to_frame(session["video_clap"]))
+        clap = first_clap(os.path.join(workdir, "audio_sync.wav"))
+    except ImportError:
+        return timings, accuracy
+    expected = session["video_clap"] - frame_time
+    accuracy["sync_error"] = None if clap is None else \
+        round(abs(clap - expected), 6)
+    return timings, accuracy
+
+# ----------------------------------------------------------------------------
+
+
+def compare(results, reference):
+    """Print the timings of results compared to the ones of a reference.
+
+    :return: (list) Names of the slower timings
+
+    """
+    old = dict((c["name"], c["timings"]) for c in reference["cases"])
+    slower = list()
+    for case in results["cases"]:
+        if case["name"] not in old:
+            continue
+        print("Case {:s}:".format(case["name"]))
+        for name, value in sorted(case["timings"].items()):
+            before = old[case["name"]].get(name)
+            if not isinstance(value, float) or not before:
+                continue
+            ratio = value / before
+            tag = ""
+            if ratio > SLOWER:
+                tag = "  <-- slower"
+                slower.append("{:s}/{:s}".format(case["name"], name))
+            print("  {:24s} {:9.3f}s {:9.3f}s  x{:.2f}{:s}".format(
+                name, before, value, ratio, tag))
+    return slower
+
+# ----------------------------------------------------------------------------
+
+
+def check_accuracy(results):
+    """Return the list of the inaccurate estimations."""
+    errors = list()
+    for case in results["cases"]:
+        for name, value in case["accuracy"].items():
+            if value is None or value == "failed" or \
+                    (isinstance(value, float) and value > TOLERANCE):
+                errors.append("{:s}/{:s}={:s}".format(case["name"], name,
+                                                      str(value)))
+    return errors
+
+# ----------------------------------------------------------------------------
+
+
+def ffmpeg_version():
+    # not with run_command(): it reads the output of ffmpeg as its progress
+    try:
+        result = subprocess.run(["ffmpeg", "-version"], capture_output=True)
+    except OSError:
+        return None
+    lines = result.stdout.decode("utf-8", "replace").splitlines()
+    if result.returncode != 0 or len(lines) == 0:
+        return None
+    return lines[0]
+
+# ----------------------------------------------------------------------------
+# Verify and extract args:
+# ----------------------------------------------------------------------------
+
+PROGRAM = os.path.abspath(__file__)
+parser = ArgumentParser(usage="%s [options]" % os.path.basename(PROGRAM),
+                        description="... a script to benchmark audeo on "
+                                    "synthetic media.")
+
+parser.add_argument("-o",
+                    metavar="file",
+                    default="benchmark.json",
+                    help='Output JSON file of the results '
+                         '(default: benchmark.json).')
+
+parser.add_argument("-w",
+                    metavar="folder",
+                    default="benchmark_media",
+                    help='Directory of the synthetic media and of the outputs '
+                         '(default: benchmark_media, removed at the end).')
+
+parser.add_argument("-r",
+                    metavar="value",
+                    type=int,
+                    default=1,
+                    help='Number of runs of each primitive: the best time '
+                         'is kept (default: 1).')
+
+parser.add_argument("--quick",
+                    action='store_true',
+                    help='Run only the {:d} shortest cases.'.format(QUICK_CASES))
+
+parser.add_argument("--keep",
+                    action='store_true',
+                    help='Do not remove the synthetic media at the end.')
+
+parser.add_argument("--compare",
+                    metavar="file",
+                    help='JSON results of a previous run to compare with.')
+
+args = parser.parse_args()
+
+# ----------------------------------------------------------------------------
+
+cases = CASES[:QUICK_CASES] if args.quick is True else CASES
+results = {"date": time.strftime("%Y-%m-%d %H:%M:%S"),
+           "platform": platform.platform(),
+           "python": platform.python_version(),
+           "cpus": os.cpu_count(),
+           "ffmpeg": ffmpeg_version(),
+           "cases": list()}
+
+for case in cases:
+    print("Case {:s}".format(case["name"]))
+    wk = os.path.join(args.w, case["name"])
+    if os.path.exists(wk):
+        shutil.rmtree(wk)
+    start = time.perf_counter()
+    session = make_session(wk, case["duration"], case["size"], case["fps"],
+                           case["channels"], CLAP, SHIFT)
+    generation = round(time.perf_counter() - start, 6)
+
+    timings, accuracy = bench_primitives(session, wk, args.r)
+    t, sizes = bench_intermediates(session, wk, args.r)
+    timings.update(t)
+    t, a = bench_end_to_end(session, wk)
+    timings.update(t)
+    accuracy.update(a)
+    timings["generate"] = generation
+    results["cases"].append(dict(case, timings=timings, accuracy=accuracy,
+                                 sizes=sizes))
+
+with open(args.o, "w") as fp:
+    json.dump(results, fp, indent=2)
+print("Results saved into {:s}".format(args.o))
+if args.keep is False:
+    shutil.rmtree(args.w, ignore_errors=True)
+
+status = 0
+if args.compare is not None:
+    with open(args.compare, "r") as fp:
+        slower = compare(results, json.load(fp))
+    if len(slower) > 0:
+        print("Slower than the reference: {:s}".format(", ".join(slower)))
+
+errors = check_accuracy(results)
+if len(errors) > 0:
+    print("Inaccurate synchronization: {:s}".format(", ".join(errors)))
+    status = 1
+sys.exit(status)
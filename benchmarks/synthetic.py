@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Generation of synthetic media with the lavfi sources of ffmpeg.
+# Required: ffmpeg
+
+# A synthetic recording session is a "scene" sound heard by a recorder and
+# by a camera which started SHIFT seconds later. The sound is a chirp, which
+# never repeats itself, with a click impulse at CLAP seconds: the clap and
+# the offset of the camera are known exactly.
+# The camera video is the testsrc2 pattern, encoded in H264 with a keyframe
+# every second, and its audio is stored in PCM: no encoder delay.
+
+import os
+import shlex
+
+from src.utils import run_command
+
+# ----------------------------------------------------------------------------
+
+SAMPLE_RATE = 48000
+CLICK_DURATION = 0.001    # seconds
+CHANNEL_GAINS = (1., 0.7, 0.5, 0.3, 0.2, 0.1)
+
+# ----------------------------------------------------------------------------
+
+
+def scene_expression(clap, shift=0., gain=1.):
+    """Return the ffmpeg expression of the scene sound.
+
+    :param clap: (float) Time of the click in the scene (seconds)
+    :param shift: (float) Time of the scene at the beginning of the recording
+    :param gain: (float) Gain of the channel
+    :return: (str) Expression of aevalsrc
+
+    """
+    t = "(t+{:f})".format(shift)
+    chirp = "0.1*sin(2*PI*(200*{t}+25*{t}*{t}))".format(t=t)
+    click = "0.9*lt(abs({t}-{c:f}),{d:f})".format(t=t, c=clap,
+                                                 d=CLICK_DURATION / 2.)
+    return "{:f}*({:s}+{:s})".format(gain, chirp, click)
+
+
+def audio_source(clap, shift, duration, nchannels=1):
+    """Return the lavfi source of a recording of the scene."""
+    exprs = "|".join(scene_expression(clap, shift, CHANNEL_GAINS[c])
+                     for c in range(nchannels))
+    return "aevalsrc=exprs='{:s}':s={:d}:d={:f}".format(
+        exprs, SAMPLE_RATE, duration)
+
+# ----------------------------------------------------------------------------
+
+
+def make_audio(filename, clap, duration, nchannels=1, shift=0.):
+    """Create the WAV file of a recorder.
+
+    :param filename: (str) Output WAV file name
+    :param clap: (float) Time of the click in the scene
+    :param duration: (float) Duration of the recording
+    :param nchannels: (int) Number of channels
+    :param shift: (float) Time of the scene at the beginning of the recording
+
+    """
+    command = "ffmpeg -f lavfi "
+    command += "-i {:s} ".format(shlex.quote(
+        audio_source(clap, shift, duration, nchannels)))
+    command += "-c:a pcm_s16le "
+    command += "'{:s}' -nostdin -y".format(filename)
+    run_command(command)
+    if os.path.exists(filename) is False:
+        raise IOError("{:s} was not created.".format(filename))
+
+
+def make_video(filename, clap, duration, size="640x360", fps="25",
+               shift=0., nchannels=2):
+    """Create the video file of a camera, with its audio.
+
+    :param filename: (str) Output video file name (expect a .mkv)
+    :param clap: (float) Time of the click in the scene
+    :param duration: (float) Duration of the recording
+    :param size: (str) Size of the video, WxH
+    :param fps: (str) Frame rate, ie. "25" or "30000/1001"
+    :param shift: (float) Time of the scene at the beginning of the recording
+    :param nchannels: (int) Number of audio channels
+
+    """
+    command = "ffmpeg "
+    command += "-f lavfi -i testsrc2=size={:s}:rate={:s}:duration={:f} ".format(
+        size, fps, duration)
+    command += "-f lavfi -i {:s} ".format(shlex.quote(
+        audio_source(clap, shift, duration, nchannels)))
+    command += "-c:v libx264 -preset veryfast -pix_fmt yuv420p "
+    command += "-force_key_frames 'expr:gte(t,n_forced)' "
+    command += "-c:a pcm_s16le "
+    command += "'{:s}' -nostdin -y".format(filename)
+    run_command(command)
+    if os.path.exists(filename) is False:
+        raise IOError("{:s} was not created.".format(filename))
+
+# ----------------------------------------------------------------------------
+
+
+def make_session(directory, duration, size="640x360", fps="25", nchannels=2,
+                 clap=2.5, shift=1.2345):
+    """Create the audio of a recorder and the video of a camera.
+
+    The camera starts shift seconds after the recorder: the clap is at
+    clap seconds in the audio and at clap-shift seconds in the video.
+
+    :return: (dict) with keys 'audio', 'video', 'audio_clap', 'video_clap'
+
+    """
+    if os.path.exists(directory) is False:
+        os.makedirs(directory)
+    audio = os.path.join(directory, "recorder.wav")
+    video = os.path.join(directory, "camera.mkv")
+    make_audio(audio, clap, duration, nchannels)
+    make_video(video, clap, duration - shift, size, fps, shift, nchannels)
+    return {"audio": audio, "video": video,
+            "audio_clap": clap, "video_clap": clap - shift}
@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: UTF-8 -*-
 # Brigitte Bigi
-# Dependencies: ffmpeg, sox, sppas
+# Dependencies: ffmpeg, sox, sppas, numpy (if a clap is "auto" or --xcorr)
 
 # Authors notes:
 # Times are given either as:
@@ -16,15 +16,34 @@
 
 import sys
 import os
-import shutil
+import atexit
+from fractions import Fraction
 from argparse import ArgumentParser
 
 from src.utils import file_exists, print_step, time_to_seconds, seconds_to_time
-from src.utils import test_command
-from src.ffmpeg_video import extract_audio, trim_video_at_frame
+from src.toolchain import has_command, has_encoder
+from src.ffmpeg_video import probe_media, extract_audio, trim_video_at_frame
+from src.ffmpeg_video import trim_video_parallel, smart_trim
+from src.ffmpeg_video import add_audio_to_video, SMART_CODECS
 from src.ffmpeg_video import merge_video_audio, merge_and_compress
-from src.utils_audio import audio_duration, trim_audio, add_silence_to_audio
-from src.utils_audio import test_audio, extract_channel
+from src.ffmpeg_video import trim_and_encode, intermediate_codec
+from src.ffmpeg_video import INTERMEDIATE_CODECS, DEFAULT_INTERMEDIATE
+from src.ffmpeg_video import PARALLEL_INTERMEDIATES
+from src.ffmpeg_command import audio_sync_filters
+from src.utils_audio import sync_audio_channels, test_audio, WaveReader
+from src.media_cache import MediaCache
+from src.frame_index import FrameIndex
+from src.pipeline import Pipeline, Step
+from src.output_cache import OutputCache
+from src.profiler import get_profiler
+
+# ----------------------------------------------------------------------------
+
+# File marking a working directory created by this script
+WORKDIR_MARKER = ".audeo"
+
+# Names of the channels of option -C
+CHANNEL_NAMES = {"left": 1, "right": 2}
 
 # ----------------------------------------------------------------------------
 
@@ -35,7 +54,7 @@ def check_command(name):
     :param name: (str) Command name
 
     """
-    result = test_command(name)
+    result = has_command(name)
     if result is False:
         print("'{:s}' is not a valid command of your system.".format(name))
         sys.exit(1)
@@ -45,84 +64,729 @@ def check_command(name):
 # ----------------------------------------------------------------------------
 
 
+def check_encoder(name):
+    """Test the encoder of ffmpeg and exit if not available.
+
+    :param name: (str) Encoder name
+
+    """
+    if has_encoder(name) is False:
+        print("ffmpeg was not built with the '{:s}' encoder.".format(name))
+        sys.exit(1)
+    else:
+        print("'{:s}' encoder is ok.".format(name))
+
+# ----------------------------------------------------------------------------
+
+
 def create_working_dir(wk):
-    """Create the working or exists.
+    """Create the working dir, or re-use one created by a previous run.
+
+    A directory created by this script contains a WORKDIR_MARKER file: a
+    run can be resumed into it. Other existing directories are not used.
 
     :param wk: (str) Directory name.
 
     """
+    marker = os.path.join(wk, WORKDIR_MARKER)
     if os.path.exists(wk):
-        print("The working directory {:s} is already existing.".format(wk))
-        sys.exit(1)
+        if os.path.exists(marker) is False:
+            print("The working directory {:s} is already existing.".format(wk))
+            sys.exit(1)
+        print("Working directory: {:s} (resumed)".format(wk))
+        return wk
     os.mkdir(wk)
     os.chmod(wk, 0o777)
+    open(marker, "w").close()
     print("Working directory: {:s}".format(wk))
     return wk
 
 # ----------------------------------------------------------------------------
 
 
-def adjust_audio_at_clap(audio_in, audio_clap, expected_clap, audio_out):
-    """Create an audio file starting at the appropriate clap position.
+def search_clap(audio, start=0., end=None, offset=0.):
+    """Search for the clap in an audio file and return its time value.
+
+    :param audio: (str) Input audio file name
+    :param start: (float) Start time of the search (in seconds)
+    :param end: (float) End time of the search (in seconds), or None
+    :param offset: (float) Time of the beginning of the audio file in the
+    media it was extracted from
+    :return: (float) Time of the most probable clap (in seconds)
+
+    """
+    # numpy is required only for the automatic detection
+    from src.clap_detect import detect_claps
+
+    print("Search for the clap in {:s}".format(audio))
+    candidates = detect_claps(audio, start, end)
+    if len(candidates) == 0:
+        print("No clap was found in {:s}. Give its time value manually."
+              "".format(audio))
+        sys.exit(1)
+    for t, score in candidates:
+        print("  - candidate: {:s} (score={:.2f})"
+              "".format(seconds_to_time(t + offset), score))
+    return candidates[0][0] + offset
+
+# ----------------------------------------------------------------------------
+
+
+def search_window(value, window):
+    """Return the window in which a clap "auto@time" is searched, or None.
+
+    :param value: (str) Time value of the clap given as argument
+    :param window: (float) Max delay between the given time and the clap
+    :return: (float, float) Start and end time of the search
+
+    """
+    if value.startswith("auto@") is False:
+        return None
+    t = time_value(value[len("auto@"):])
+    return max(0., t - window), t + window
+
+# ----------------------------------------------------------------------------
+
+
+def time_value(value):
+    """Return a time given as argument, in seconds or HH:MM:SS.mmm."""
+    if ":" in value:
+        return time_to_seconds(value)
+    return float(value)
+
+# ----------------------------------------------------------------------------
+
+
+def clap_time(value, audio, window=None, offset=None):
+    """Return the time of a clap given as argument.
+
+    :param value: (str) Time value, in seconds or HH:MM:SS.mmm, or "auto",
+    or "auto@time" to search for it around the given time
+    :param audio: (str) Audio file in which the clap is searched if "auto"
+    :param window: (float) Max delay between the time of "auto@time" and
+    the clap
+    :param offset: (float) Time of the beginning of the audio file if it
+    was extracted around the time of "auto@time", or None if it is complete
+    :return: (float) Time of the clap (in seconds)
+
+    """
+    if value == "auto":
+        return search_clap(audio)
+    if value.startswith("auto@"):
+        if offset is not None:
+            return search_clap(audio, offset=offset)
+        start, end = search_window(value, window)
+        return search_clap(audio, start, end)
+    return time_value(value)
+
+# ----------------------------------------------------------------------------
+
+
+def estimate_sync(audio, audios_video):
+    """Estimate pairs of synchronized time values by cross-correlation.
+
+    The returned values can be used like the times of a clap: the first one
+    in the audio and the second one in the video.
+
+    :param audio: (str) Input audio file name
+    :param audios_video: (list) Audio of each video (file names)
+    :return: (list) Time values in the audio and in the video, for each video
+
+    """
+    # numpy is required only for the cross-correlation
+    from src.audio_align import estimate_offsets, MIN_CONFIDENCE
+
+    print("Cross-correlate {:s} with {:s}".format(audio, ", ".join(audios_video)))
+    pairs = list()
+    for offset, confidence in estimate_offsets(audio, audios_video):
+        print("  - offset: {:.6f} seconds (confidence={:.2f})"
+              "".format(offset, confidence))
+        if confidence < MIN_CONFIDENCE:
+            print("The correlation has no clear peak (confidence < {:.0f}): "
+                  "the offset is not reliable. Give the time values of the "
+                  "clap instead of --xcorr.".format(MIN_CONFIDENCE))
+            sys.exit(1)
+        # time 0 of the video or time 0 of the audio, whichever comes last
+        audio_time = max(0., -offset)
+        pairs.append((audio_time, audio_time + offset))
+    return pairs
+
+# ----------------------------------------------------------------------------
+
+
+def per_video(values, nb, default, name):
+    """Return the list of the values of an option, one for each video.
+
+    :param values: (list) Values given as arguments, or None
+    :param nb: (int) Number of videos
+    :param default: (str) Value if the option was not given
+    :param name: (str) Name of the option
+
+    """
+    if values is None:
+        return [default] * nb
+    if len(values) == 1:
+        return values * nb
+    if len(values) != nb:
+        print("Option {:s} must be given once or once per video.".format(name))
+        sys.exit(1)
+    return values
+
+# ----------------------------------------------------------------------------
+
+
+def test_video(video, cache=None, fps=None):
+    """Return the description of a video, and its frame rate.
+
+    :param video: (str) Input video file name
+    :param cache: (MediaCache) Cache of the media, or None
+    :param fps: (float) Frame rate given as argument, or None
+    :return: (dict) with keys of probe_media() and 'frame_rate'
+
+    """
+    if cache is not None:
+        media = cache.probe_media(video)
+    else:
+        media = probe_media(video)
+    if media["video"] is None:
+        print("No video stream in {:s}.".format(video))
+        sys.exit(1)
+    print("Test video file: {:s}".format(video))
+    print("  - codec: {:s}".format(str(media["video"]["codec"])))
+    print("  - size: {:d}x{:d}".format(media["video"]["width"],
+                                       media["video"]["height"]))
+    print("  - fps: {:s}".format(str(media["video"]["fps"])))
+    if fps is not None:
+        media["frame_rate"] = Fraction(fps).limit_denominator(1001)
+    else:
+        media["frame_rate"] = media["video"]["fps"]
+        if media["frame_rate"] is None:
+            print("The frame rate of the video is unknown. Use option -FPS.")
+            sys.exit(1)
+    return media
+
+# ----------------------------------------------------------------------------
+
+
+def index_video(video, media, cache=None, fps=None):
+    """Return the index of the frames of a video.
+
+    The time of each frame is read from the video, except if the frame rate
+    is given as argument: the frame rate of the video is then assumed to be
+    constant, and the keyframes are unknown. The times are read from the
+    video if its duration is unknown.
+
+    :param video: (str) Input video file name
+    :param media: (dict) Description of the video, see test_video()
+    :param cache: (MediaCache) Cache of the media, or None
+    :param fps: (float) Frame rate given as argument, or None
+    :return: (FrameIndex)
+
+    """
+    duration = media["video"]["duration"] or media["duration"]
+    if fps is not None and duration is None:
+        print("The duration of the video is unknown: the frame times are "
+              "read from the video instead of option -FPS.")
+    try:
+        if fps is not None and duration is not None:
+            index = FrameIndex.from_fps(media["frame_rate"], duration)
+        elif cache is not None:
+            index = cache.frame_index(video)
+        else:
+            index = FrameIndex.from_video(video)
+    except IOError as e:
+        print("The frames of the video can't be indexed: {:s}".format(str(e)))
+        sys.exit(1)
+    print("  - frames: {:d}".format(index.get_nframes()))
+    print("  - keyframes: {:d}".format(len(index.get_keyframes())))
+    return index
+
+# ----------------------------------------------------------------------------
+
+
+def estimate_begin(camera, audio_clap, priority):
+    """Estimate the time values to synchronize at the beginning.
+
+    :param camera: (dict) The video, updated with the estimated values
+    :param audio_clap: (float) Time of the clap in the audio
+    :param priority: (str) audio or video
+
+    """
+    index = camera["index"]
+    video_clap = camera["clap"]
+
+    # get the frame in which the clap is occurring
+    camera["clap_frame_pos"] = index.time_to_frame(video_clap)
+    camera["clap_frame_time"] = index.frame_to_time(camera["clap_frame_pos"])
+    frame_dur = index.frame_duration(camera["clap_frame_pos"])
+    print("Estimated beginning of the frame with the clap: {:.3f} seconds"
+          "".format(camera["clap_frame_time"]))
+
+    # adjust the position of the clap in this frame but
+    # by default, keep the real value for the audio clap of the video
+    estimated_video_clap = video_clap
+    if priority == "video":
+        # the clap of the audio is forced to be at the middle of the frame in
+        # which the clap is occurring
+        estimated_video_clap = camera["clap_frame_time"] + (frame_dur / 2.)
+    print("Estimated clap position for the output: {:.3f} seconds"
+          "".format(estimated_video_clap))
+
+    # print more details about the synchronization...
+    print("* * * Delta among the real clap position in the video and the "
+          "beginning of the first frame of the video = {:.3f} * * *"
+          "".format(video_clap - camera["clap_frame_time"]))
+    if estimated_video_clap != video_clap:
+        print("* * * Audio is shifted at the middle of the frame in which the "
+              "clap is occurring. This shifted position = {:.3f} * * *"
+              "".format(estimated_video_clap - camera["clap_frame_time"]))
+
+    # The expected clap is before (delta<0) or after (delta>0) the one of the
+    # audio: the beginning of the audio is trimmed or silence is inserted.
+    camera["delta"] = estimated_video_clap - audio_clap
+
+# ----------------------------------------------------------------------------
+
+
+def estimate_end(camera, expected_duration):
+    """Estimate the time value to synchronize at the end.
 
-    :param audio_in: (str) Input audio file name
-    :param audio_clap: (float) Time of the start clap in the audio 
-    :param expected_clap: (float) Time of the start clap in the video
-    :param audio_out: (str) Output audio file name
+    :param camera: (dict) The video, updated with the estimated values
+    :param expected_duration: (float) Duration of the outputs or None
 
     """
-    delta = expected_clap - audio_clap
+    index = camera["index"]
+    print("Get the exact duration of the video:")
+    # the end of the last frame: the container duration can be the one of
+    # a longer stream
+    video_dur = index.get_duration()
+    print("Duration of the video: {:.3f} seconds".format(video_dur))
+
+    if expected_duration is not None:
+        # Cut the video at the given end frame
+        # but given argument is the expected duration (end = clap + duration))
+        real_end_time = camera["clap"] + expected_duration
+        print("Expected end time: {:.3f} seconds"
+              "".format(real_end_time))
+        try:
+            end_frame_pos = index.end_frame(real_end_time)
+        except ValueError:
+            print("Error: Given expected duration is too high. Expected end = "
+                  "{:.3f} is higher than the video duration."
+                  "".format(real_end_time))
+            sys.exit(1)
+        end_frame_time = index.frame_to_time(end_frame_pos)
+    else:
+        # Cut at the end (actually do not cut!)
+        end_frame_pos = index.get_nframes()
+        end_frame_time = index.frame_to_time(end_frame_pos)
+
+    print("Estimated end time: {:.3f} seconds"
+          "".format(end_frame_time))
+    camera["end_frame_pos"] = end_frame_pos
+    camera["end_frame_time"] = end_frame_time
+
+# ----------------------------------------------------------------------------
+
+
+def parse_channels(value, nchannels):
+    """Return the channels of the audio given by option -C.
+
+    :param value: (str) "none" to keep all the channels in a single track,
+    or a comma-separated list of channels: "left", "right", an index (1 is
+    the first channel) or "all" for each channel of the audio
+    :param nchannels: (int) Number of channels of the audio
+    :return: (list) Name and channel (1-based, or None for all) of each
+    track
+    :raise: ValueError if a channel is invalid
+
+    """
+    if value == "none":
+        return [("", None)]
+    channels = list()
+    for name in value.split(","):
+        name = name.strip().lower()
+        if name == "all":
+            channels.extend((str(c), c) for c in range(1, nchannels + 1))
+            continue
+        if name in CHANNEL_NAMES:
+            c = CHANNEL_NAMES[name]
+        elif name.isdigit():
+            c = int(name)
+        else:
+            raise ValueError("'{:s}' is not a valid audio channel.".format(name))
+        if c < 1 or c > nchannels:
+            raise ValueError("Invalid channel {:s}: the audio has {:d} "
+                             "channels.".format(name, nchannels))
+        channels.append((name, c))
+
+    # each channel only once, in the given order
+    tracks = list()
+    for name, c in channels:
+        if c not in [t[1] for t in tracks]:
+            tracks.append((name, c))
+    return tracks
+
+# ----------------------------------------------------------------------------
+
+
+def print_audio_sync(camera):
+    """Print the synchronization of the audio of a camera.
+
+    :param camera: (dict) The video, with the estimated time values
+    :return: (list) The channel of each track (1-based) or None for all
+
+    """
+    print("  - shift of the audio: {:f} seconds".format(camera["delta"]))
+    print("  - expected start time: {:.3f}".format(camera["clap_frame_time"]))
+    print("  - expected end time: {:.3f}".format(camera["end_frame_time"]))
+
+    for name, channel in camera["channels"]:
+        if channel is not None:
+            print("  - select audio channel: {:s}".format(name))
+    return [channel for name, channel in camera["channels"]]
+
+# ----------------------------------------------------------------------------
+
+
+def sync_camera_audio(camera, audio, audio_out):
+    """Shift, trim and select the channels of the audio for a camera.
+
+    All the tracks are created while reading the audio once.
+
+    :param camera: (dict) The video, with the estimated time values
+    :param audio: (str) Input audio file name
+    :param audio_out: (list) Output audio file name of each track
+
+    """
+    channels = print_audio_sync(camera)
+    sync_audio_channels(audio, camera["delta"],
+                        camera["clap_frame_time"], camera["end_frame_time"],
+                        list(zip(channels, audio_out)))
+    for filename in audio_out:
+        file_exists(filename)
+
+# ----------------------------------------------------------------------------
 
-    if delta == 0:
-        shutil.copy(audio_in, audio_out)
-        print("Already matching. Nothing to do.")
 
-    elif delta < 0:
-        # The expected clap is before the one of the audio
-        print("Trim the beginning of the audio of {:f} seconds"
-              "".format(-delta))
-        trim_audio(audio_in, -delta, audio_out, begin=True)
+def describe_profile(profile):
+    """Return the encoder and the options of a profile of lossless video."""
+    vcodec, options = intermediate_codec(profile)
+    if len(options) == 0:
+        return vcodec
+    return "{:s} ({:s})".format(vcodec, " ".join(options))
 
+# ----------------------------------------------------------------------------
+
+
+def trim_camera_video(camera, video_out, jobs=1,
+                      profile=DEFAULT_INTERMEDIATE):
+    """Trim the video of a camera into a lossless video without audio.
+
+    :param camera: (dict) The video, with the estimated time values
+    :param video_out: (str) Output video file name
+    :param jobs: (int) Number of parallel encodings of the video
+    :param profile: (str) Profile of the lossless video, see
+    INTERMEDIATE_CODECS
+
+    """
+    index = camera["index"]
+    from_frame = camera["clap_frame_pos"]
+    to_frame = camera["end_frame_pos"]
+    print("  - start frame: {:d}".format(from_frame))
+    print("  - end frame: {:d}".format(to_frame))
+    if profile == "copy":
+        # the packets are copied in decoding order: both ends must be closed
+        # keyframes, or the end of the video, for a frame-exact cut
+        def closed(frame):
+            return index.is_keyframe(frame) and not index.is_open(frame)
+        reason = None
+        if closed(from_frame) is False:
+            reason = "the start frame"
+        elif to_frame < index.get_nframes() and closed(to_frame) is False:
+            reason = "the end frame"
+        if reason is not None:
+            print("  - {:s} is not a keyframe of a closed GOP: the video "
+                  "can't be copied, it is encoded with {:s}"
+                  "".format(reason, DEFAULT_INTERMEDIATE))
+            profile = DEFAULT_INTERMEDIATE
+    if jobs > 1 and profile not in PARALLEL_INTERMEDIATES:
+        print("  - no parallel encoding with {:s}".format(profile))
+        jobs = 1
+
+    if jobs > 1:
+        print("  - parallel encoding of {:d} segments".format(jobs))
+        trim_video_parallel(camera["video"],
+                            from_frame,
+                            to_frame,
+                            video_out,
+                            camera["workdir"], jobs, index, profile)
     else:
-        # The expected clap is after the one of the audio
-        print("Add {:f} seconds of silence at the beginning of the audio"
-              "".format(delta))
-        add_silence_to_audio(audio_in, delta, audio_out, begin=True)
+        if profile == "copy":
+            # a copy starts at the keyframe at or before the seek position
+            seek_time = index.frame_to_time(from_frame) + \
+                index.frame_duration(from_frame) / 4.
+        else:
+            # seek half a frame before, to not depend on rounded frame times
+            seek_time = index.seek_time(from_frame)
+        trim_video_at_frame(camera["video"],
+                            seconds_to_time(seek_time),
+                            from_frame,
+                            to_frame,
+                            video_out, profile=profile)
+    file_exists(video_out)
+    print("  - video container: Mastroska")
+    print("  - video codec: {:s}".format(describe_profile(profile)))
+    print("  - no audio")
+
+# ----------------------------------------------------------------------------
+
+
+def smart_trim_camera(camera, audio_sync, video_out):
+    """Trim the original video of a camera and add the synchronized audio.
+
+    :param camera: (dict) The video, with the estimated time values
+    :param audio_sync: (list) Synchronized audio file name of each track
+    :param video_out: (str) Output video file name (expect a .mp4)
+
+    """
+    file_video_smart = os.path.join(camera["workdir"], "video_smart.mp4")
+    print("Create a video embedding a compressed audio (MP4): ")
+    print("  - video codec: {:s}, re-encoded only at both ends"
+          "".format(camera["media"]["video"]["codec"]))
+    print("  - audio code: aac")
+    smart_trim(camera["video"],
+               camera["clap_frame_pos"],
+               camera["end_frame_pos"],
+               file_video_smart, camera["workdir"],
+               camera["media"], camera["index"])
+    file_exists(file_video_smart)
+    add_audio_to_video(file_video_smart, audio_sync, video_out)
+    file_exists(video_out)
+    os.remove(file_video_smart)
 
 # ----------------------------------------------------------------------------
 
 
-def audio_with_duration(audio_in, expected_duration, audio_out):
-    """Create an audio file during the same than the other one.
+def compress_camera(video_sync, audio_sync, video_out):
+    """Merge and compress the synchronized video and audio of a camera."""
+    print("Create a compressed video embedding a compressed audio (MP4): ")
+    print("  - video container: H264")
+    print("  - video codec: libx264 (crf=18)")
+    print("  - audio code: aac")
+    merge_and_compress(video_sync, audio_sync, video_out, crf=18)
+    file_exists(video_out)
+
+# ----------------------------------------------------------------------------
+
+
+def merge_camera(video_sync, audio_sync, video_out):
+    """Merge the synchronized video and audio of a camera, losslessly."""
+    print("Create a video embedding the audio (MKV)")
+    merge_video_audio(video_sync, audio_sync, video_out)
+    file_exists(video_out)
+
+# ----------------------------------------------------------------------------
 
-    :param audio_in: (str) Input audio file name
-    :param expected_duration: (str) The expected duration
-    :param audio_out: (str) Output audio file name
+
+def encode_camera(camera, audio, lossless, lossy, proxy, proxy_height,
+                  align=False, profile=DEFAULT_INTERMEDIATE):
+    """Trim the video of a camera into all its merged files at once.
+
+    :param camera: (dict) The video, with the estimated time values
+    :param audio: (list) Synchronized audio file names, or the input audio
+    file name if align is True
+    :param lossless: (str) Output lossless file name, or None
+    :param lossy: (str) Output lossy file name, or None
+    :param proxy: (str) Output proxy file name, or None
+    :param proxy_height: (int) Height of the frames of the proxy
+    :param align: (bool) Synchronize the audio in the same ffmpeg process
+    :param profile: (str) Profile of the lossless file, except "copy"
 
     """
-    # Get the current audio duration
-    cur_dur = audio_duration(audio_in)
-    print("Duration of the audio is {:f} seconds".format(cur_dur))
+    audio_filters = None
+    if align is True:
+        print("Synchronize the audio in the filter graph: ")
+        channels = print_audio_sync(camera)
+        if len(channels) != 1:
+            raise ValueError("Only a single audio track can be synchronized "
+                             "in the filter graph.")
+        channel = channels[0]
+        with WaveReader(audio[0]) as fa:
+            framerate = fa.get_framerate()
+        audio_filters = audio_sync_filters(camera["delta"],
+                                           camera["clap_frame_time"],
+                                           camera["end_frame_time"],
+                                           framerate, channel)
+    print("Decode the video once and encode: ")
+    print("  - start frame: {:d}".format(camera["clap_frame_pos"]))
+    print("  - end frame: {:d}".format(camera["end_frame_pos"]))
+    if lossless is not None:
+        print("  - MKV: {:s}, audio: wav".format(describe_profile(profile)))
+    if lossy is not None:
+        print("  - MP4: libx264 (crf=18), audio: aac")
+    if proxy is not None:
+        print("  - proxy MP4: libx264 (crf=28), height={:d}, audio: aac"
+              "".format(proxy_height))
+    seek_time = camera["index"].seek_time(camera["clap_frame_pos"])
+    trim_and_encode(camera["video"], audio,
+                    seconds_to_time(seek_time),
+                    camera["clap_frame_pos"], camera["end_frame_pos"],
+                    lossless, lossy, proxy, proxy_height,
+                    audio_filters=audio_filters, profile=profile)
+    for filename in (lossless, lossy, proxy):
+        if filename is not None:
+            file_exists(filename)
 
-    # Make the difference
-    delta = expected_duration - cur_dur
+# ----------------------------------------------------------------------------
 
-    if delta == 0:
-        shutil.copy(audio_in, audio_out)
-        print("Already matching. Nothing to do.")
 
-    elif delta > 0:
-        # The expected duration is higher than the one we already have.
-        print("Add {:f} seconds of silence at the end of the audio"
-              "".format(delta))
-        add_silence_to_audio(audio_in, delta, audio_out, begin=False)
+def add_camera_steps(pipeline, camera, audio, mp4=False, mkv=False, jobs=1,
+                     smart_cut=False, single_decode=False, proxy=None,
+                     single_pass=False, profile=DEFAULT_INTERMEDIATE):
+    """Add the steps creating the synchronized files of a camera.
+
+    The audio and the video are synchronized concurrently, then both
+    merged files are created concurrently. With single_decode, the merged
+    files are instead encoded by a single step directly from the original
+    video, as soon as the audio is synchronized: the lossless video
+    "video_sync.mkv" is not created. With single_pass, this step also
+    synchronizes the audio: "audio_sync.wav" is not created either, except
+    for the smart cut. The smart cut doesn't need "video_sync.mkv" either:
+    it is created only if the lossless merged file is expected.
+
+    :param pipeline: (Pipeline) The pipeline to add the steps into
+    :param camera: (dict) The video, with the estimated time values
+    :param audio: (str) Input audio file name
+    :param mp4: (bool) Create a merged audio+video lossy file
+    :param mkv: (bool) Create a merged audio+video lossless file
+    :param jobs: (int) Number of parallel encodings of the video
+    :param smart_cut: (bool) Create the lossy file from the original video,
+    re-encoded only at both ends
+    :param single_decode: (bool) Decode the video once for all the outputs
+    :param proxy: (int) Height of a low-resolution proxy file, or None. The
+    proxy is created only with single_decode.
+    :param single_pass: (bool) Synchronize the audio while encoding the
+    outputs, with single_decode
+    :param profile: (str) Profile of the lossless videos, see
+    INTERMEDIATE_CODECS. The lossless merged file of single_decode can't
+    be copied: it is then encoded with the default profile.
 
+    """
+    wk = camera["workdir"]
+    name = camera["name"]
+    # a file for each track of the audio
+    if len(camera["channels"]) == 1:
+        audio_files = [os.path.join(wk, "audio_sync.wav")]
     else:
-        # The expected duration is less than the one we already have.
-        print("Trim the end of the audio of {:f} seconds"
-              "".format(-delta))
-        trim_audio(audio_in, -delta, audio_out, begin=False)
+        audio_files = [os.path.join(wk, "audio_sync_{:s}.wav".format(n))
+                       for n, c in camera["channels"]]
+    file_video_final = os.path.join(wk, "video_sync.mkv")
+    file_video_lossy = os.path.join(wk, "merged_lossy.mp4")
+    file_video_lossless = os.path.join(wk, "merged_lossless.mkv")
+
+    # the time values and encoder settings each output depends on: they
+    # make the steps of a previous run out of date when they change, and
+    # they are part of the key of the outputs in the shared cache
+    audio_params = {"delta": camera["delta"],
+                    "start": camera["clap_frame_time"],
+                    "end": camera["end_frame_time"],
+                    "channel": camera["channel"]}
+    encode_profile = profile if profile != "copy" else DEFAULT_INTERMEDIATE
+    vcodec, options = intermediate_codec(profile)
+    video_params = {"from_frame": camera["clap_frame_pos"],
+                    "to_frame": camera["end_frame_pos"],
+                    "vcodec": vcodec, "options": options}
+    smart_params = {"from_frame": camera["clap_frame_pos"],
+                    "to_frame": camera["end_frame_pos"],
+                    "vcodec": camera["media"]["video"]["codec"],
+                    "acodec": "aac"}
+
+    lossless = lossy = file_proxy = None
+    if single_decode is True:
+        # the smart cut of the lossy file copies the video: no decoding
+        lossless = file_video_lossless if mkv is True else None
+        lossy = file_video_lossy if mp4 is True and not smart_cut else None
+        if proxy is not None:
+            file_proxy = os.path.join(wk, "proxy.mp4")
+    outputs = [f for f in (lossless, lossy, file_proxy) if f is not None]
+    # the filter graph aligns a single track
+    single_pass = single_pass is True and len(outputs) > 0 and \
+        len(audio_files) == 1
+
+    if single_pass is False or (mp4 is True and smart_cut is True):
+        pipeline.add(Step("Synchronize audio of {:s}".format(name),
+                          sync_camera_audio, (camera, audio, audio_files),
+                          [audio], audio_files, audio_params))
+
+    if single_decode is True and (len(outputs) > 0 or mp4 is True):
+        if len(outputs) > 0:
+            params = {"from_frame": camera["clap_frame_pos"],
+                      "to_frame": camera["end_frame_pos"],
+                      "vcodec": intermediate_codec(encode_profile)[0],
+                      "options": intermediate_codec(encode_profile)[1],
+                      "lossy_vcodec": "libx264", "lossy_crf": 18,
+                      "acodec": "aac", "proxy": proxy}
+            audio_in = audio_files
+            if single_pass is True:
+                params.update(audio_params)
+                audio_in = [audio]
+            pipeline.add(Step("Trim and encode video-audio of {:s}"
+                              "".format(name),
+                              encode_camera,
+                              (camera, audio_in, lossless, lossy,
+                               file_proxy, proxy, single_pass,
+                               encode_profile),
+                              [camera["video"]] + audio_in,
+                              outputs, params))
+        if mp4 is True and smart_cut is True:
+            pipeline.add(Step("Smart trim and merge video-audio of {:s}"
+                              "".format(name),
+                              smart_trim_camera,
+                              (camera, audio_files, file_video_lossy),
+                              [camera["video"]] + audio_files,
+                              [file_video_lossy], smart_params))
+        return
+
+    # the smart cut doesn't need the lossless video
+    if mkv is True or mp4 is False or smart_cut is False:
+        pipeline.add(Step("Trim video of {:s}".format(name),
+                          trim_camera_video,
+                          (camera, file_video_final, jobs, profile),
+                          [camera["video"]], [file_video_final],
+                          video_params))
+
+    if mp4 is True and smart_cut is True:
+        pipeline.add(Step("Smart trim and merge video-audio of {:s}"
+                          "".format(name),
+                          smart_trim_camera,
+                          (camera, audio_files, file_video_lossy),
+                          [camera["video"]] + audio_files,
+                          [file_video_lossy], smart_params))
+    elif mp4 is True:
+        pipeline.add(Step("Merge and compress video-audio of {:s}".format(name),
+                          compress_camera,
+                          (file_video_final, audio_files, file_video_lossy),
+                          [file_video_final] + audio_files,
+                          [file_video_lossy],
+                          {"vcodec": "libx264", "crf": 18, "acodec": "aac"}))
+
+    if mkv is True:
+        pipeline.add(Step("Merge video-audio of {:s}".format(name),
+                          merge_camera,
+                          (file_video_final, audio_files,
+                           file_video_lossless),
+                          [file_video_final] + audio_files,
+                          [file_video_lossless]))
+
+# ----------------------------------------------------------------------------
+
 
+def save_profile(profiler, wk):
+    """Save the profile of the run into the working directory."""
+    summary, trace = profiler.save(wk)
+    print("Profile of the run: {:s}".format(summary))
+    print("Trace of the run: {:s}".format(trace))
 
 # ----------------------------------------------------------------------------
 # Verify and extract args:
@@ -143,20 +807,42 @@ parser.add_argument(
     metavar="time",
     required=False,
     default="0",
-    help='Time of the start clap in the audio (default: 00:00).')
+    help='Time of the start clap in the audio (default: 00:00), or "auto" '
+         'to search for it automatically, or "auto@time" to search for it '
+         'around the given time.')
 
 parser.add_argument(
     "-v",
     metavar="file",
     required=True,
-    help='Input video file name.')
+    action="append",
+    help='Input video file name. Repeat -v, -s and -C to synchronize the '
+         'audio with several videos.')
 
 parser.add_argument(
     "-s",
     metavar="time",
     required=False,
-    default="0",
-    help='Time of the start clap in the video (default: 00:00).')
+    action="append",
+    help='Time of the start clap in the video (default: 00:00), or "auto" '
+         'to search for it automatically, or "auto@time" to search for it '
+         'around the given time: only this part of the audio of the video '
+         'is decoded.')
+
+parser.add_argument(
+    "--window",
+    metavar="time",
+    required=False,
+    type=float,
+    default=30.,
+    help='Max delay in seconds between the time of "auto@time" and the '
+         'clap (default: 30).')
+
+parser.add_argument(
+    "--xcorr",
+    action='store_true',
+    help='Estimate the offset between the audio and the audio of the video '
+         'by cross-correlation. No clap is needed: -c and -s are ignored.')
 
 parser.add_argument(
     "-d",
@@ -169,22 +855,26 @@ parser.add_argument(
     metavar="value",
     required=False,
     type=float,
-    default=25,
-    help='Frames per seconds of the video (default=25)')
+    default=None,
+    help='Frames per seconds of the video (default: read from the video)')
 
 parser.add_argument(
     "-w",
     metavar="folder",
     required=False,
     default="tmp",
-    help='Working directory to store the resulting files (default: tmp)')
+    help='Working directory to store the resulting files (default: tmp). '
+         'With several videos, the files of each one are stored into a '
+         'sub-directory "camera1", "camera2", ...')
 
 parser.add_argument(
     "-C",
     metavar="value",
     required=False,
-    default="none",
-    help='Audio channel left|right|none (default=none=keep original)')
+    action="append",
+    help='Audio channel left|right|none (default=none=keep original), or '
+         'a list of channels like "1,3,4", "left,right" or "all": a track '
+         'is created for each one. Given once, it applies to all the videos.')
 
 parser.add_argument(
     "-P",
@@ -197,10 +887,72 @@ parser.add_argument(
          'given to the video, the clap of the audio will be time-aligned with '
          'the middle of the frame containing the clap of the video.')
 
+parser.add_argument(
+    "--jobs",
+    metavar="value",
+    required=False,
+    type=int,
+    default=1,
+    help='Number of segments of the video encoded in parallel (default: 1). '
+         'Segments start at keyframes and are joined losslessly.')
+
+parser.add_argument(
+    "--intermediate",
+    metavar="profile",
+    default=os.getenv("AUDEO_INTERMEDIATE", DEFAULT_INTERMEDIATE),
+    help='Profile of the lossless video: {:s} (default: '
+         '$AUDEO_INTERMEDIATE or {:s}). x265 creates the smallest files, '
+         'ffv1 and x264 are faster to encode, copy does not encode if the '
+         'clap is at a keyframe.'.format(
+             "|".join(sorted(INTERMEDIATE_CODECS)), DEFAULT_INTERMEDIATE))
+
+parser.add_argument(
+    "--smart-cut",
+    action='store_true',
+    help='Create the lossy file (--mp4) from the original H264 or H265 video: '
+         'only the frames before its first keyframe and after its last '
+         'keyframe are re-encoded.')
+
+parser.add_argument(
+    "--single-decode",
+    action='store_true',
+    help='Decode the video once and encode all the merged files (--mkv, '
+         '--mp4, --proxy) in a single ffmpeg process, without the lossless '
+         'intermediate video. --jobs is then ignored.')
+
+parser.add_argument(
+    "--single-pass",
+    action='store_true',
+    help='Synchronize the audio while encoding the merged files (--mkv, '
+         '--mp4, --proxy): the audio is an input of the ffmpeg process '
+         'which trims the video, and no WAV file is created. Implies '
+         '--single-decode.')
+
+parser.add_argument(
+    "--proxy",
+    metavar="height",
+    type=int,
+    default=None,
+    help='Also create a low-resolution lossy file "proxy.mp4" of the given '
+         'height, ie. 360. Implies --single-decode.')
+
+parser.add_argument(
+    "--no-cache",
+    action='store_true',
+    help='Do not use the cache of the metadata and of the audio of the media.')
+
+parser.add_argument(
+    "--shared-cache",
+    metavar="dir",
+    default=os.getenv("AUDEO_SHARED_CACHE"),
+    help='Directory of a cache of the output files, shared by runs and users '
+         '(default: $AUDEO_SHARED_CACHE, disabled if not set).')
+
 parser.add_argument(
     "--mkv",
     action='store_true',
-    help='Create a merged audio+video lossless file (H265+WAV).')
+    help='Create a merged audio+video lossless file (MKV): the video is '
+         'encoded with the profile of --intermediate, the audio is WAV.')
 
 parser.add_argument(
     "--mp4",
@@ -218,26 +970,104 @@ step = 1
 # Check and get things...
 # ----------------------------------------------------------------------------
 print_step(step, "Check given arguments")
+profiler = get_profiler()
+span = profiler.begin("Check given arguments")
 
 # Test the commands this script will need and create the working dir
 check_command("sox")
 check_command("ffmpeg")
+if args.intermediate not in INTERMEDIATE_CODECS:
+    print("'{:s}' is not a valid profile of the lossless video."
+          "".format(args.intermediate))
+    sys.exit(1)
+if args.intermediate != "copy":
+    check_encoder(intermediate_codec(args.intermediate)[0])
+else:
+    # the video is encoded if the clap is not at a keyframe
+    check_encoder(intermediate_codec(DEFAULT_INTERMEDIATE)[0])
+if args.mp4 is True or args.proxy is not None:
+    check_encoder("libx264")
 file_exists(args.a)
-file_exists(args.v)
+for video in args.v:
+    file_exists(video)
 if args.P not in ('audio', 'video'):
     print("'{:s}' is not a valid value for argument -P.".format(args.P))
 wk = create_working_dir(args.w)
+# the profile is saved even if the run is halted
+atexit.register(save_profile, profiler, wk)
 
-# Test the given audio
+# Test the given audio, only once for all the videos
 input_audio = test_audio(args.a, wk)
 
-# Test the given video
-# TODO: GET fps FROM THE GIVEN VIDEO.
-input_video = args.v
-fname, input_video_ext = os.path.splitext(input_video)
-input_video_ext = input_video_ext.lower()
-input_video_fps = args.FPS
-input_video_frame_dur = 1. / input_video_fps
+cache = None
+if args.no_cache is False:
+    cache = MediaCache()
+    print("Cache directory: {:s}".format(cache.get_directory()))
+
+# Test the given videos
+video_claps = per_video(args.s, len(args.v), "0", "-s")
+channels = per_video(args.C, len(args.v), "none", "-C")
+with WaveReader(input_audio) as fa:
+    nchannels = fa.get_nchannels()
+cameras = list()
+for i, video in enumerate(args.v):
+    camera = {"name": video, "video": video, "channel": channels[i]}
+    try:
+        camera["channels"] = parse_channels(channels[i], nchannels)
+    except ValueError as e:
+        print("Invalid argument -C: {:s}".format(str(e)))
+        sys.exit(1)
+    camera["media"] = test_video(video, cache, args.FPS)
+    camera["index"] = index_video(video, camera["media"], cache, args.FPS)
+    camera["workdir"] = wk
+    if len(args.v) > 1:
+        camera["workdir"] = create_working_dir(
+            os.path.join(wk, "camera{:d}".format(i + 1)))
+    camera["audio"] = os.path.join(camera["workdir"], "audio_from_video.wav")
+    camera["audio_offset"] = None
+    window = search_window(video_claps[i], args.window)
+    if window is not None and args.xcorr is False:
+        # only the audio around the clap is needed to search for it
+        start, end = window
+        camera["audio_offset"] = start
+        print("Extract the audio of the video from {:s} to {:s}"
+              "".format(seconds_to_time(start), seconds_to_time(end)))
+        if cache is not None:
+            camera["audio"] = cache.mono_audio(video, start=start,
+                                               duration=end - start)
+        else:
+            extract_audio(video, camera["audio"], mono=True, start=start,
+                          duration=end - start)
+        file_exists(camera["audio"])
+    elif video_claps[i] == "auto" or args.xcorr is True:
+        if cache is not None:
+            # a mono audio is enough to search for the clap or to correlate
+            camera["audio"] = cache.mono_audio(video)
+        else:
+            extract_audio(video, camera["audio"])
+        file_exists(camera["audio"])
+    cameras.append(camera)
+
+smart_cut = False
+if args.smart_cut is True:
+    smart_cut = all(camera["media"]["video"]["codec"] in SMART_CODECS
+                    for camera in cameras)
+    if smart_cut is False:
+        print("Smart cut is supported only for H264 and H265 videos. "
+              "It is disabled.")
+
+single_decode = args.single_decode is True or args.proxy is not None or \
+    args.single_pass is True
+if args.single_pass is True and args.mkv is False and args.mp4 is False \
+        and args.proxy is None:
+    print("Option --single-pass needs a merged file (--mkv, --mp4 or "
+          "--proxy): it is ignored.")
+if args.single_pass is True and \
+        any(len(camera["channels"]) > 1 for camera in cameras):
+    print("Option --single-pass synchronizes a single audio track: it is "
+          "ignored for the videos with several channels given by -C.")
+if single_decode is True and args.jobs > 1:
+    print("The video is decoded once: option --jobs is ignored.")
 
 # convert given times in float (time in seconds)
 expected_duration = None
@@ -247,185 +1077,71 @@ if args.d:
     else:
         expected_duration = float(args.d)
     print("Given duration for the output video: {:.3f}".format(expected_duration))
-if ":" in args.s:
-    input_video_clap = time_to_seconds(args.s)
-else:
-    input_video_clap = float(args.s)
-print("Given clap position in the input video: {:.3f} seconds"
-      "".format(input_video_clap))
-if ":" in args.c:
-    input_audio_clap = time_to_seconds(args.c)
+
+if args.xcorr is True:
+    pairs = estimate_sync(input_audio, [camera["audio"] for camera in cameras])
+    for camera, (audio_clap, video_clap) in zip(cameras, pairs):
+        camera["audio_clap"] = audio_clap
+        camera["clap"] = video_clap
 else:
-    input_audio_clap = float(args.c)
-print("Given clap position in the input audio: {:.3f} seconds"
-      "".format(input_audio_clap))
+    input_audio_clap = clap_time(args.c, input_audio, args.window)
+    for camera, value in zip(cameras, video_claps):
+        camera["audio_clap"] = input_audio_clap
+        camera["clap"] = clap_time(value, camera["audio"], args.window,
+                                   camera["audio_offset"])
+
+for camera in cameras:
+    print("Given clap position in the input video {:s}: {:.3f} seconds"
+          "".format(camera["name"], camera["clap"]))
+    print("Given clap position in the input audio: {:.3f} seconds"
+          "".format(camera["audio_clap"]))
+profiler.end(span)
 step += 1
 
 # ----------------------------------------------------------------------------
 # STEP 1: Estimate time values to synchronize (start pos)
 # ----------------------------------------------------------------------------
 print_step(step, "Estimate begin time values to synchronize")
-
-# get the frame in which the clap is occurring
-clap_frame_pos = int(input_video_clap / input_video_frame_dur)
-clap_frame_time = float(clap_frame_pos) * input_video_frame_dur
-print("Estimated beginning of the frame with the clap: {:.3f} seconds"
-      "".format(clap_frame_time))
-
-# adjust the position of the clap in this frame but
-# by default, keep the real value for the audio clap of the video
-estimated_video_clap = input_video_clap
-if args.P == "video":
-    # the clap of the audio is forced to be at the middle of the frame in which
-    # the clap is occurring
-    estimated_video_clap = clap_frame_time + (input_video_frame_dur / 2.)
-print("Estimated clap position for the output: {:.3f} seconds"
-      "".format(estimated_video_clap))
-
-# print more details about the synchronization...
-print("* * * Delta among the real clap position in the video and the beginning "
-      "of the first frame of the video = {:.3f} * * *"
-      "".format(input_video_clap - clap_frame_time))
-if estimated_video_clap != input_video_clap:
-    print("* * * Audio is shifted at the middle of the frame in which the clap "
-          "is occurring. This shifted position = {:.3f} * * *"
-          "".format(estimated_video_clap - clap_frame_time))
+with profiler.span("Estimate begin time values to synchronize"):
+    for camera in cameras:
+        print("Video {:s}:".format(camera["name"]))
+        estimate_begin(camera, camera["audio_clap"], args.P)
 step += 1
 
 # ----------------------------------------------------------------------------
 # STEP 2: Estimate time values to synchronize (end pos)
 # ----------------------------------------------------------------------------
 print_step(step, "Estimate end time value to synchronize")
-
-print("Get the exact duration of the video:")
-file_audiov = os.path.join(wk, "audio_from_video.wav")
-extract_audio(input_video, file_audiov)
-file_exists(file_audiov)
-file_audiov = test_audio(file_audiov, wk)
-video_dur = audio_duration(file_audiov)
-
-if expected_duration is not None:
-    # Cut the video at the given end frame
-    # but given argument is the expected duration (end = clap + duration))
-    real_end_time = input_video_clap + expected_duration
-    print("Expected end time: {:.3f} seconds"
-          "".format(real_end_time))
-    end_frame_pos = int(round(real_end_time / input_video_frame_dur))
-    end_frame_time = float(end_frame_pos) * input_video_frame_dur
-    if end_frame_time > video_dur:
-        print("Error: Given expected duration is too high. Expected end = "
-              "{:.3f} is higher than the video duration.".format(end_frame_time))
-        sys.exit(1)
-else:
-    # Cut at the end (actually do not cut!)
-    end_frame_time = video_dur
-    end_frame_pos = int(round(end_frame_time / input_video_frame_dur))
-
-print("Estimated end time: {:.3f} seconds"
-      "".format(end_frame_time))
+with profiler.span("Estimate end time value to synchronize"):
+    for camera in cameras:
+        print("Video {:s}:".format(camera["name"]))
+        estimate_end(camera, expected_duration)
 step += 1
 
 # ----------------------------------------------------------------------------
-# Step 3: Shift the audio to the expected clap position
+# Next steps: create the synchronized files of all the videos, each step
+# as soon as its inputs are created
 # ----------------------------------------------------------------------------
-print_step(step, "Shift audio to expected clap position in the video")
-file_audio_clap = os.path.join(wk, "audio_clap.wav")
-adjust_audio_at_clap(
-    input_audio,
-    input_audio_clap,       # position of the clap in the audio file
-    estimated_video_clap,   # expected position of the clap in the video
-    file_audio_clap)
-file_exists(file_audio_clap)
-step += 1
-
-
-# ----------------------------------------------------------------------------
-# Step 4: Trim audio
-# ----------------------------------------------------------------------------
-print_step(step, "Trim audio")
-file_audio_endtrim = os.path.join(wk, "audio_trim_end.wav")
-file_audio_trim = os.path.join(wk, "audio_trim.wav")
-
-print("  - expected end time: {:.3f}".format(end_frame_time))
-audio_with_duration(file_audio_clap, end_frame_time, file_audio_endtrim)
-file_exists(file_audio_endtrim)
-
-print("  - expected start time: {:.3f}".format(clap_frame_time))
-trim_audio(file_audio_endtrim, clap_frame_time, file_audio_trim)
-file_exists(file_audio_trim)
-step += 1
-
-
-# ----------------------------------------------------------------------------
-# Step 5: Mix audio channels
-# ----------------------------------------------------------------------------
-print_step(step, "Audio channels")
-file_audio_final = os.path.join(wk, "audio_sync.wav")
-
-if args.C in ['left', 'right']:
-    print("Select audio channel: {:s}".format(args.C))
-    c = 1
-    if args.C == "right":
-        c += 1
-    extract_channel(file_audio_trim, c, file_audio_final)
-else:
-    print("Nothing to do.")
-    shutil.copy2(file_audio_trim, file_audio_final)
-
-file_exists(file_audio_final)
-step += 1
-
-# ----------------------------------------------------------------------------
-# Step 6: Trim the video
-# ----------------------------------------------------------------------------
-print_step(step, "Trim video")
-file_video_final = os.path.join(wk, "video_sync.mkv")
-
-print("  - start frame: {:d}".format(clap_frame_pos))
-print("  - end frame: {:d}".format(end_frame_pos))
-trim_video_at_frame(input_video,
-                    seconds_to_time(clap_frame_time),
-                    clap_frame_pos,
-                    end_frame_pos,
-                    file_video_final)
-file_exists(file_video_final)
-print("  - video container: Mastroska")
-print("  - video codec: libx265 (crf=0)")
-print("  - no audio")
-step += 1
-
-
-# ----------------------------------------------------------------------------
-# Embed the audio into the video
-# ----------------------------------------------------------------------------
-
-if args.mp4 is True:
-    print_step(step, "Merge and compress video-audio")
-    file_video_lossy = os.path.join(wk, "merged_lossy.mp4")
-    print("Create a compressed video embedding a compressed audio (MP4): ")
-    print("  - video container: H264")
-    print("  - video codec: libx264 (crf=18)")
-    print("  - audio code: aac")
-    merge_and_compress(file_video_final,
-                       file_audio_final,
-                       file_video_lossy, crf=18)
-    file_exists(file_video_lossy)
-    step += 1
-
-if args.mkv is True:
-    print_step(step, "Merge video-audio")
-    print("Create a video embedding the audio (MKV)")
-    file_video_lossless = os.path.join(wk, "merged_lossless.mkv")
-    merge_video_audio(file_video_final, file_audio_final, file_video_lossless)
-    file_exists(file_video_lossless)
-    step += 1
-
+output_cache = None
+if args.shared_cache:
+    output_cache = OutputCache(args.shared_cache)
+    print("Shared cache of the outputs: {:s}".format(args.shared_cache))
+pipeline = Pipeline(first_step=step, cache=output_cache)
+for camera in cameras:
+    add_camera_steps(pipeline, camera, input_audio,
+                     args.mp4, args.mkv, args.jobs, smart_cut,
+                     single_decode, args.proxy, args.single_pass,
+                     args.intermediate)
+pipeline.run()
 
 # ----------------------------------------------------------------------------
 # Remove temporary files
 # ----------------------------------------------------------------------------
 
-os.remove(file_audio_clap)
-os.remove(file_audio_endtrim)
-os.remove(file_audio_trim)
-os.remove(file_audiov)
+for camera in cameras:
+    if cache is None and os.path.exists(camera["audio"]):
+        os.remove(camera["audio"])
+
+# the entries used by this run can now be evicted from the media cache
+if cache is not None:
+    cache.release()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Run commands as asyncio sub-processes, with the progress of ffmpeg.
+
+# The errors and messages of a command are streamed line by line instead
+# of being buffered. ffmpeg is given the options "-progress pipe:1 -nostats":
+# it writes blocks of key=value lines on its standard output, parsed into
+# progress events with the keys 'frame', 'fps', 'speed', 'out_time' (in
+# seconds), 'total_size', 'status' ("continue" or "end"), and 'percent'
+# and 'eta' if the expected duration of the output is known.
+# A command is killed when it exceeds its timeout or when it is cancelled,
+# and several commands can run concurrently in a single event loop. A
+# command which fails raises an error with the last lines of its errors.
+# The resource usage of each command is sampled while it runs, and added to
+# the profiler of the run.
+
+import os
+import sys
+import time
+import asyncio
+from collections import deque
+
+from .profiler import get_profiler, read_proc_usage, children_usage
+from .profiler import usage_delta, SAMPLE_PERIOD
+
+# ----------------------------------------------------------------------------
+
+KILL_DELAY = 5.    # seconds between the end request and the kill of a process
+TAIL_LINES = 20    # lines of the errors of a failed command in its exception
+
+# ----------------------------------------------------------------------------
+
+
+def _seconds(value):
+    """Return a time of ffmpeg progress ("HH:MM:SS.micro") in seconds."""
+    try:
+        h, m, s = value.split(":")
+        return int(h) * 3600 + int(m) * 60 + float(s)
+    except (ValueError, AttributeError):
+        return None
+
+
+def _number(value, cast=float):
+    try:
+        return cast(value.rstrip("x"))
+    except (ValueError, AttributeError):
+        return None
+
+# ----------------------------------------------------------------------------
+
+
+class ProgressParser(object):
+    """Parse the -progress output of ffmpeg into progress events.
+
+    >>> parser = ProgressParser(duration=120.)
+    >>> for line in lines:
+    >>>     event = parser.feed(line)
+    >>>     if event is not None:
+    >>>         print(event["out_time"], event["eta"])
+
+    """
+
+    def __init__(self, duration=None):
+        """Create a parser.
+
+        :param duration: (float) Expected duration of the output, or None
+
+        """
+        self._duration = duration
+        self._values = dict()
+
+    def feed(self, line):
+        """Add a line and return an event if it ends a block, or None."""
+        line = line.strip()
+        if "=" not in line:
+            return None
+        key, value = line.split("=", 1)
+        self._values[key] = value
+        if key != "progress":
+            return None
+
+        values = self._values
+        self._values = dict()
+        event = {"frame": _number(values.get("frame"), int),
+                 "fps": _number(values.get("fps")),
+                 "speed": _number(values.get("speed")),
+                 "out_time": _seconds(values.get("out_time")),
+                 "total_size": _number(values.get("total_size"), int),
+                 "status": value}
+        if self._duration and event["out_time"] is not None:
+            event["percent"] = min(100., 100. * event["out_time"] / self._duration)
+            event["eta"] = None
+            if event["speed"]:
+                event["eta"] = max(0., self._duration - event["out_time"]) / \
+                    event["speed"]
+        return event
+
+# ----------------------------------------------------------------------------
+
+
+def format_progress(event):
+    """Return a progress event as a one-line message."""
+    msg = "frame={:s} fps={:s} speed={:s}x time={:s}".format(
+        str(event["frame"]), str(event["fps"]), str(event["speed"]),
+        "{:.2f}".format(event["out_time"]) if event["out_time"] is not None
+        else "?")
+    if event.get("percent") is not None:
+        msg += " {:.1f}%".format(event["percent"])
+    if event.get("eta") is not None:
+        msg += " eta={:.0f}s".format(event["eta"])
+    return msg
+
+
+def print_progress(event):
+    """Default progress handler: write the event to stderr."""
+    sys.stderr.write(format_progress(event) + "\n")
+    sys.stderr.flush()
+
+
+def print_line(line):
+    """Default output handler: write the line to stderr."""
+    sys.stderr.write(line + "\n")
+    sys.stderr.flush()
+
+# ----------------------------------------------------------------------------
+
+
+def is_ffmpeg(args):
+    return os.path.basename(args[0]) == "ffmpeg"
+
+# ----------------------------------------------------------------------------
+
+
+async def _terminate(process):
+    """Ask a process to end, and kill it if it doesn't."""
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        await asyncio.wait_for(process.wait(), KILL_DELAY)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+    except ProcessLookupError:
+        pass
+
+# ----------------------------------------------------------------------------
+
+
+async def _sample_usage(pid, usage):
+    """Update usage with the last sample of the usage of a process."""
+    while True:
+        sample = read_proc_usage(pid)
+        if sample is None:
+            return
+        usage.update(sample)
+        await asyncio.sleep(SAMPLE_PERIOD)
+
+# ----------------------------------------------------------------------------
+
+
+async def run_process(args, timeout=None, duration=None,
+                      on_progress=print_progress, on_line=print_line,
+                      check=False):
+    """Run a command and stream its output.
+
+    The standard output is returned, except for ffmpeg: it is parsed into
+    progress events given to on_progress.
+
+    :param args: (list) The command and its arguments
+    :param timeout: (float) Max duration of the command in seconds, or None
+    :param duration: (float) Expected duration of the output of ffmpeg
+    :param on_progress: (callable) Function given each progress event
+    :param on_line: (callable) Function given each line of the errors
+    :param check: (bool) Raise an error if the return code is not 0
+    :return: (int, bytes) Return code and standard output
+    :raise: TimeoutError if the command exceeds the timeout. The process
+    is also killed if the coroutine is cancelled.
+    :raise: IOError if check is True and the command failed
+
+    """
+    progress = is_ffmpeg(args) and on_progress is not None
+    if progress is True:
+        args = [args[0], "-progress", "pipe:1", "-nostats"] + list(args[1:])
+
+    start = time.time()
+    before = children_usage()
+    process = await asyncio.create_subprocess_exec(
+        *args,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE)
+    usage = dict()
+    sampler = asyncio.ensure_future(_sample_usage(process.pid, usage))
+
+    output = list()
+    errors = deque(maxlen=TAIL_LINES)
+
+    async def read_stdout():
+        if progress is False:
+            output.append(await process.stdout.read())
+            return
+        parser = ProgressParser(duration)
+        async for line in process.stdout:
+            event = parser.feed(line.decode("utf-8", "replace"))
+            if event is not None:
+                on_progress(event)
+
+    async def read_stderr():
+        async for line in process.stderr:
+            line = line.decode("utf-8", "replace").rstrip()
+            errors.append(line)
+            if on_line is not None:
+                on_line(line)
+
+    try:
+        await asyncio.wait_for(
+            asyncio.gather(read_stdout(), read_stderr(), process.wait()),
+            timeout)
+    except asyncio.TimeoutError:
+        await _terminate(process)
+        raise TimeoutError("Command {:s} exceeded {:g} seconds."
+                           "".format(args[0], timeout))
+    except asyncio.CancelledError:
+        await _terminate(process)
+        raise
+    finally:
+        sampler.cancel()
+        if len(usage) == 0:
+            # no /proc: usage of all the children terminated meanwhile
+            usage = usage_delta(before, children_usage())
+        get_profiler().add_command(os.path.basename(args[0]), process.pid,
+                                   start, time.time(), usage, " ".join(args))
+
+    if check is True and process.returncode != 0:
+        raise IOError("Command {:s} failed with return code {:d}:\n{:s}"
+                      "".format(args[0], process.returncode, "\n".join(errors)))
+    return process.returncode, b"".join(output)
+
+# ----------------------------------------------------------------------------
+
+
+async def run_processes(commands, max_jobs=None, timeout=None, **kwargs):
+    """Run commands concurrently, at most max_jobs at a time.
+
+    If a command fails with an exception, the other ones are cancelled.
+
+    :param commands: (list) List of argument lists
+    :param max_jobs: (int) Max number of processes at a time, or None
+    :param timeout: (float) Max duration of each command in seconds
+    :return: (list) Return code and standard output of each command
+
+    """
+    semaphore = asyncio.Semaphore(max_jobs or len(commands) or 1)
+
+    async def run_one(args):
+        async with semaphore:
+            return await run_process(args, timeout, **kwargs)
+
+    tasks = [asyncio.ensure_future(run_one(args)) for args in commands]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
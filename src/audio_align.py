@@ -0,0 +1,236 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Estimation of the time offset between two recordings of the same event.
+# Required: numpy
+
+# The offset is estimated with a generalized cross-correlation (GCC-PHAT)
+# computed with FFTs, in two stages:
+#   1. coarse: both signals are decimated to COARSE_RATE and correlated on
+#      their whole duration, at most max_duration seconds;
+#   2. fine: a window of the reference at full rate is correlated with the
+#      other signal only around the coarse offset, and the peak is
+#      interpolated to get a sub-sample precision.
+# Only the decimated signals and the windows of the fine stage are loaded.
+
+import numpy
+
+from .utils_signal import pcm_memmap, iter_mono
+
+# ----------------------------------------------------------------------------
+
+COARSE_RATE = 1000.     # sample rate of the coarse stage (Hz)
+FINE_WINDOW = 10.       # duration of the window of the fine stage (seconds)
+# confidence below which the peak of the correlation is not reliable: the
+# highest peak of two unrelated signals is about 9 times the deviation
+MIN_CONFIDENCE = 15.
+
+# ----------------------------------------------------------------------------
+
+
+def _next_pow2(n):
+    return 1 << int(numpy.ceil(numpy.log2(max(2, n))))
+
+# ----------------------------------------------------------------------------
+
+
+def _decimate(data, header, rate, nframes):
+    """Decimate the mono signal by averaging blocks of samples.
+
+    :param data: (numpy.ndarray) Samples as returned by pcm_memmap
+    :param header: (dict) Header of the file
+    :param rate: (float) Expected sample rate
+    :param nframes: (int) Number of frames to decimate
+    :return: (numpy.ndarray) Samples at the given rate
+
+    """
+    framerate = header["framerate"]
+    factor = max(1, int(round(framerate / rate)))
+    blocks = list()
+    for pos, mono in iter_mono(data, header, 0, nframes,
+                               blocksize=factor * 65536):
+        n = (len(mono) // factor) * factor
+        blocks.append(mono[:n].reshape(-1, factor).mean(axis=1))
+    if len(blocks) == 0:
+        return numpy.zeros(0, dtype=numpy.float32)
+    signal = numpy.concatenate(blocks)
+
+    # the decimated rate is not exactly the expected one
+    real_rate = float(framerate) / factor
+    if real_rate != rate:
+        grid = numpy.arange(int(len(signal) * rate / real_rate)) / rate
+        signal = numpy.interp(grid, numpy.arange(len(signal)) / real_rate,
+                              signal).astype(numpy.float32)
+    return signal
+
+# ----------------------------------------------------------------------------
+
+
+def gcc_phat(reference, other, size):
+    """Return the phase-transform weighted cross-correlation of two signals.
+
+    Value at index k is the correlation of other[t+k] with reference[t].
+    Negative lags are at the end of the array.
+
+    :param reference: (numpy.ndarray) Reference signal
+    :param other: (numpy.ndarray) Other signal
+    :param size: (int) Size of the FFT, at least the sum of both lengths
+    :return: (numpy.ndarray) Correlation values
+
+    """
+    spec = numpy.fft.rfft(other, size) * numpy.conj(
+        numpy.fft.rfft(reference, size))
+    spec /= numpy.abs(spec) + 1e-12
+    return numpy.fft.irfft(spec, size)
+
+# ----------------------------------------------------------------------------
+
+
+def _resample(signal, from_rate, to_rate):
+    """Linear interpolation of a signal to another sample rate."""
+    if from_rate == to_rate:
+        return signal
+    n = int(len(signal) * float(to_rate) / from_rate)
+    return numpy.interp(numpy.arange(n) / float(to_rate),
+                        numpy.arange(len(signal)) / float(from_rate),
+                        signal)
+
+# ----------------------------------------------------------------------------
+
+
+def coarse_offset(ref, data, header, max_duration=None):
+    """Estimate the offset of a signal at COARSE_RATE.
+
+    :param ref: (numpy.ndarray) Reference signal decimated at COARSE_RATE
+    :param data: (numpy.ndarray) Samples as returned by pcm_memmap
+    :param header: (dict) Header of the file
+    :param max_duration: (float) Max duration of the signal to correlate
+    :return: (float, float) Offset (seconds) and confidence
+
+    """
+    n = len(data)
+    if max_duration is not None:
+        n = min(n, int(max_duration * header["framerate"]))
+
+    sig = _decimate(data, header, COARSE_RATE, n)
+    if len(ref) == 0 or len(sig) == 0:
+        raise ValueError("Empty signal: the offset can't be estimated.")
+    size = _next_pow2(len(ref) + len(sig))
+    corr = gcc_phat(ref - ref.mean(), sig - sig.mean(), size)
+
+    # lags are in range [-len(ref); len(sig)]
+    corr = numpy.concatenate((corr[size - len(ref) + 1:], corr[:len(sig)]))
+    # the polarity of the microphones can be inverted
+    corr = numpy.abs(corr)
+    best = int(numpy.argmax(corr))
+    confidence = float(corr[best] / (numpy.std(corr) + 1e-12))
+    lag = best - len(ref) + 1
+    return float(lag) / COARSE_RATE, confidence
+
+# ----------------------------------------------------------------------------
+
+
+def fine_offset(ref_data, ref_header, data, header, offset, coarse_ref,
+                window=FINE_WINDOW):
+    """Refine an offset at the sample rate of the reference.
+
+    :param offset: (float) Offset estimated by the coarse stage (seconds)
+    :param coarse_ref: (numpy.ndarray) Decimated reference signal
+    :param window: (float) Duration of the correlated window (seconds)
+    :return: (float) Offset in seconds
+
+    """
+    rate = ref_header["framerate"]
+    other_rate = header["framerate"]
+    margin = int(4. * rate / COARSE_RATE)
+    ref_len = len(ref_data)
+    other_len = int(len(data) * float(rate) / other_rate)
+    shift = int(round(offset * rate))
+
+    # the window of the reference must have its counterpart in the other
+    low = max(0, -shift) + margin
+    high = min(ref_len, other_len - shift) - margin
+    win = min(int(window * rate), high - low)
+    if win <= margin:
+        return offset
+
+    # choose the loudest window of the reference
+    step = int(COARSE_RATE * window / 2.) or 1
+    lo_c = int(low * COARSE_RATE / rate)
+    hi_c = max(lo_c + 1, int((high - win) * COARSE_RATE / rate))
+    energies = [(numpy.sum(coarse_ref[i:i + step * 2] ** 2), i)
+                for i in range(lo_c, hi_c, step)]
+    start = max(low, int(max(energies)[1] * rate / COARSE_RATE))
+    start = min(start, high - win)
+
+    ref = next(iter_mono(ref_data, ref_header, start, start + win,
+                         blocksize=win))[1]
+    o_start = int((start + shift - margin) * float(other_rate) / rate)
+    o_end = int((start + shift + win + margin) * float(other_rate) / rate) + 1
+    sig = next(iter_mono(data, header, o_start, o_end,
+                         blocksize=o_end - o_start))[1]
+    sig = _resample(sig, other_rate, rate)
+
+    size = _next_pow2(len(ref) + len(sig))
+    corr = gcc_phat(ref - ref.mean(), sig - sig.mean(), size)[:2 * margin + 1]
+    best = int(numpy.argmax(numpy.abs(corr)))
+    if corr[best] < 0.:
+        corr = -corr
+
+    # parabolic interpolation of the peak
+    delta = 0.
+    if 0 < best < len(corr) - 1:
+        a, b, c = corr[best - 1], corr[best], corr[best + 1]
+        denominator = a - 2. * b + c
+        if denominator != 0.:
+            delta = 0.5 * (a - c) / denominator
+
+    # o_start was truncated: use its exact value in the reference time
+    o_start_ref = o_start * float(rate) / other_rate
+    return float(o_start_ref + best + delta - start) / rate
+
+# ----------------------------------------------------------------------------
+
+
+def estimate_offset(reference, audio, max_duration=None):
+    """Estimate the time offset of an audio compared to a reference one.
+
+    A time t in the reference corresponds to t + offset in the audio.
+
+    :param reference: (str) Reference audio file name (WAV)
+    :param audio: (str) Other audio file name (WAV)
+    :param max_duration: (float) Max duration of the signals to correlate
+    :return: (float, float) Offset (seconds) and confidence of the estimation
+
+    """
+    return estimate_offsets(reference, [audio], max_duration)[0]
+
+# ----------------------------------------------------------------------------
+
+
+def estimate_offsets(reference, audios, max_duration=None):
+    """Estimate the time offsets of several audios compared to a reference.
+
+    The reference is read and decimated only once.
+
+    :param reference: (str) Reference audio file name (WAV)
+    :param audios: (list) Other audio file names (WAV)
+    :param max_duration: (float) Max duration of the signals to correlate
+    :return: (list) Offset (seconds) and confidence of each audio
+
+    """
+    ref_data, ref_header = pcm_memmap(reference)
+    ref_n = len(ref_data)
+    if max_duration is not None:
+        ref_n = min(ref_n, int(max_duration * ref_header["framerate"]))
+    coarse_ref = _decimate(ref_data, ref_header, COARSE_RATE, ref_n)
+
+    results = list()
+    for audio in audios:
+        data, header = pcm_memmap(audio)
+        offset, confidence = coarse_offset(coarse_ref, data, header,
+                                           max_duration)
+        offset = fine_offset(ref_data, ref_header, data, header,
+                             offset, coarse_ref)
+        results.append((offset, confidence))
+    return results
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Run many synchronizations described in a manifest file.
+
+# A manifest is either a CSV file with a header line, or a JSON file with a
+# list of objects. Each row describes the options of a synchronization:
+#     audio, audio_clap, video, video_clap, duration, fps, channel, priority,
+#     workdir, outputs
+# Only 'audio', 'video' and 'workdir' are required. 'outputs' is a list of
+# merged files to create, separated by '+' in a CSV file, ie. "mkv+mp4".
+
+import os
+import sys
+import csv
+import json
+import time
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# ----------------------------------------------------------------------------
+
+# Column of the manifest -> option of embed_audio_in_video.py
+OPTIONS = (
+    ("audio", "-a"),
+    ("audio_clap", "-c"),
+    ("video", "-v"),
+    ("video_clap", "-s"),
+    ("duration", "-d"),
+    ("fps", "-FPS"),
+    ("channel", "-C"),
+    ("priority", "-P"),
+    ("workdir", "-w"),
+)
+OUTPUTS = ("mkv", "mp4")
+
+# ----------------------------------------------------------------------------
+
+
+def read_manifest(filename):
+    """Read the jobs of a manifest file.
+
+    :param filename: (str) A .json or a .csv file
+    :return: (list) List of dict, one per job, with a 'name' key added
+    :raise: ValueError if a job is invalid or if two jobs share a workdir
+
+    """
+    if filename.lower().endswith(".json"):
+        with open(filename, "r") as fp:
+            rows = json.load(fp)
+    else:
+        with open(filename, "r", newline="") as fp:
+            rows = [row for row in csv.DictReader(fp)]
+
+    if isinstance(rows, list) is False:
+        raise ValueError("Expected a list of jobs.")
+
+    jobs = list()
+    workdirs = dict()
+    for i, row in enumerate(rows):
+        if isinstance(row, dict) is False:
+            raise ValueError("Job {:d}: expected an object of options, got "
+                             "{:s}.".format(i + 1, type(row).__name__))
+        job = dict((k.strip(), v) for k, v in row.items()
+                   if k is not None and v not in (None, ""))
+        for key in ("audio", "video", "workdir"):
+            if key not in job:
+                raise ValueError("Job {:d}: missing '{:s}'.".format(i + 1, key))
+
+        outputs = job.get("outputs", list())
+        if isinstance(outputs, str):
+            outputs = [o.strip() for o in outputs.split("+") if o.strip()]
+        if isinstance(outputs, list) is False:
+            raise ValueError("Job {:d}: 'outputs' is not a list."
+                             "".format(i + 1))
+        for o in outputs:
+            if o not in OUTPUTS:
+                raise ValueError("Job {:d}: unknown output '{:s}'."
+                                 "".format(i + 1, str(o)))
+        job["outputs"] = outputs
+
+        # two jobs writing into the same directory would mix their files
+        wk = os.path.realpath(job["workdir"])
+        if wk in workdirs:
+            raise ValueError("Jobs {:d} and {:d} have the same working "
+                             "directory {:s}.".format(workdirs[wk], i + 1, wk))
+        workdirs[wk] = i + 1
+
+        job["name"] = "{:03d}_{:s}".format(
+            i + 1, os.path.basename(os.path.normpath(job["workdir"])))
+        jobs.append(job)
+
+    return jobs
+
+# ----------------------------------------------------------------------------
+
+
+def job_command(job, script):
+    """Return the command line of a job.
+
+    :param job: (dict) A job of the manifest
+    :param script: (str) Path of embed_audio_in_video.py
+    :return: (list) Arguments
+
+    """
+    command = [sys.executable, script]
+    for key, option in OPTIONS:
+        if key in job:
+            command.extend([option, str(job[key])])
+    for o in job["outputs"]:
+        command.append("--" + o)
+    return command
+
+# ----------------------------------------------------------------------------
+
+
+def run_job(job, script, logdir):
+    """Run a job in a new process and save its output into a log file.
+
+    :return: (dict) Status of the job, with the wall time of its steps if
+    the job saved its profile
+
+    """
+    log = os.path.join(logdir, job["name"] + ".log")
+    status = {"name": job["name"], "workdir": job["workdir"], "log": log}
+    start = time.time()
+    with open(log, "w") as fp:
+        try:
+            p = subprocess.Popen(job_command(job, script),
+                                 stdin=subprocess.DEVNULL,
+                                 stdout=fp, stderr=subprocess.STDOUT)
+            status["returncode"] = p.wait()
+        except OSError as e:
+            fp.write(str(e))
+            status["returncode"] = -1
+    status["duration"] = round(time.time() - start, 3)
+    status["status"] = "ok" if status["returncode"] == 0 else "failed"
+
+    # wall time of each step, to compare the jobs
+    profile = os.path.join(job["workdir"], "profile.json")
+    if os.path.exists(profile):
+        with open(profile, "r") as fp:
+            summary = json.load(fp)
+        status["profile"] = profile
+        status["steps"] = [(s["name"], s["wall"]) for s in summary["steps"]]
+    return status
+
+# ----------------------------------------------------------------------------
+
+
+def run_jobs(jobs, script, logdir, nb_workers=2):
+    """Run all the jobs, with at most nb_workers processes at a time.
+
+    :param jobs: (list) Jobs of a manifest
+    :param script: (str) Path of embed_audio_in_video.py
+    :param logdir: (str) Directory of the log files
+    :param nb_workers: (int) Max number of jobs running in parallel
+    :return: (list) Status of each job, in the order of the manifest
+
+    """
+    if os.path.exists(logdir) is False:
+        os.makedirs(logdir)
+
+    results = dict()
+    with ThreadPoolExecutor(max_workers=max(1, nb_workers)) as pool:
+        futures = dict((pool.submit(run_job, job, script, logdir), job)
+                       for job in jobs)
+        for future in as_completed(futures):
+            status = future.result()
+            results[status["name"]] = status
+            tag = "  OK  " if status["status"] == "ok" else "FAILED"
+            print("[{:s}] {:s} ({:.1f}s) {:s}".format(
+                tag, status["name"], status["duration"], status["log"]))
+            sys.stdout.flush()
+
+    return [results[job["name"]] for job in jobs]
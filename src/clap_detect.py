@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Automatic detection of a clap (or any other sound indicator) in an audio.
+# Required: numpy
+
+# A clap is a short broadband impulse: both the energy and the spectral
+# content of the signal change suddenly. The onset detection function is
+# the sum of the normalized energy rise and of the normalized spectral flux,
+# computed on short frames. Its highest peaks are the clap candidates, and
+# the onset of each one is then searched at the sample level.
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .utils_signal import pcm_memmap, to_float, iter_mono
+
+# ----------------------------------------------------------------------------
+
+FRAME_DURATION = 0.020      # duration of an analysis frame (seconds)
+HOP_DURATION = 0.005        # shift between two analysis frames (seconds)
+THRESHOLD = 6.              # min value of the onset function for a candidate
+
+# ----------------------------------------------------------------------------
+
+
+def _normalize(values):
+    """Center and scale values with the median and the median deviation."""
+    median = numpy.median(values)
+    scale = numpy.median(numpy.abs(values - median)) * 1.4826
+    if scale == 0.:
+        # mostly constant values, ie. a rise of the energy
+        scale = numpy.std(values)
+    return (values - median) / (scale + 1e-9)
+
+# ----------------------------------------------------------------------------
+
+
+def _local_maxima(values, distance):
+    """Return the indexes of the maxima of values in a +/- distance window."""
+    padded = numpy.pad(values, distance, mode="constant",
+                       constant_values=-numpy.inf)
+    window_max = sliding_window_view(padded, 2 * distance + 1).max(axis=1)
+    return numpy.flatnonzero(values >= window_max)
+
+# ----------------------------------------------------------------------------
+
+
+def onset_function(data, header, first, last):
+    """Estimate the onset detection function of a part of an audio.
+
+    :param data: (numpy.ndarray) Samples as returned by pcm_memmap
+    :param header: (dict) Header of the file
+    :param first: (int) First frame to analyze
+    :param last: (int) Last frame to analyze (excluded)
+    :return: (int, int, numpy.ndarray) The hop and frame sizes (in samples)
+    and the onset value of each analysis frame
+
+    """
+    framerate = header["framerate"]
+    size = 1 << int(numpy.ceil(numpy.log2(FRAME_DURATION * framerate)))
+    hop = max(1, int(HOP_DURATION * framerate))
+    if last - first < size:
+        return hop, size, numpy.zeros(0)
+
+    # frames of each block are aligned on the hop of the whole signal
+    nb_frames = 1 + (last - first - size) // hop
+    per_block = max(1, (10 * framerate) // hop)
+    window = numpy.hanning(size).astype(numpy.float32)
+
+    flux = numpy.zeros(nb_frames)
+    energy = numpy.zeros(nb_frames)
+    prev_spectrum = None
+    k = 0
+    for pos, samples in iter_mono(data, header, first, last,
+                                  blocksize=per_block * hop + size - hop,
+                                  overlap=size - hop):
+        frames = sliding_window_view(samples, size)[::hop]
+        frames = frames[:nb_frames - k]
+        if len(frames) == 0:
+            break
+        spectrum = numpy.log1p(numpy.abs(numpy.fft.rfft(frames * window)))
+        if prev_spectrum is None:
+            prev_spectrum = spectrum[0]
+        diff = numpy.diff(spectrum, axis=0, prepend=prev_spectrum[None, :])
+        flux[k:k + len(frames)] = numpy.maximum(diff, 0.).sum(axis=1)
+        energy[k:k + len(frames)] = 10. * numpy.log10(
+            (frames * frames).mean(axis=1) + 1e-10)
+        prev_spectrum = spectrum[-1]
+        k += len(frames)
+
+    rise = numpy.maximum(numpy.diff(energy, prepend=energy[0]), 0.)
+    return hop, size, _normalize(flux) + _normalize(rise)
+
+# ----------------------------------------------------------------------------
+
+
+def refine_onset(data, header, frame):
+    """Search the exact sample at which the impulse starts near a frame.
+
+    :param data: (numpy.ndarray) Samples as returned by pcm_memmap
+    :param header: (dict) Header of the file
+    :param frame: (int) Approximate position of the onset (in samples)
+    :return: (int) Position of the onset (in samples)
+
+    """
+    framerate = header["framerate"]
+    margin = int(FRAME_DURATION * framerate)
+    noise_dur = int(0.1 * framerate)
+    begin = max(0, frame - margin - noise_dur)
+    end = min(len(data), frame + 2 * margin)
+    if end - begin <= noise_dur:
+        return frame
+
+    # out-of-phase channels cancel each other in a mix: max of each one
+    env = numpy.abs(to_float(data[begin:end], header)).max(axis=1)
+    noise = numpy.median(env[:noise_dur])
+    peak_pos = noise_dur + int(numpy.argmax(env[noise_dur:]))
+    threshold = noise + 0.1 * (env[peak_pos] - noise)
+
+    # the onset is the first sample above the threshold before the peak
+    search_from = max(0, peak_pos - margin)
+    above = numpy.flatnonzero(env[search_from:peak_pos + 1] > threshold)
+    if above.size == 0:
+        # a flat window: no impulse
+        return frame
+    return begin + search_from + int(above[0])
+
+# ----------------------------------------------------------------------------
+
+
+def detect_claps(audio, start=0., end=None, nbest=5, min_gap=0.5):
+    """Search for the claps of an audio file.
+
+    :param audio: (str) Input audio file name (WAV)
+    :param start: (float) Start time of the search (in seconds)
+    :param end: (float) End time of the search (in seconds), default is the end
+    :param nbest: (int) Max number of candidates
+    :param min_gap: (float) Min delay between two candidates (in seconds)
+    :return: (list) Candidates (time in seconds rounded at 1ms, score), by
+    decreasing score
+
+    """
+    data, header = pcm_memmap(audio)
+    framerate = header["framerate"]
+    first = max(0, int(start * framerate))
+    last = len(data)
+    if end is not None:
+        last = min(last, int(end * framerate))
+
+    hop, size, odf = onset_function(data, header, first, last)
+    if len(odf) == 0:
+        return list()
+
+    distance = max(1, int(min_gap * framerate) // hop)
+    peaks = [p for p in _local_maxima(odf, distance) if odf[p] > THRESHOLD]
+    peaks = sorted(peaks, key=lambda p: odf[p], reverse=True)[:nbest]
+
+    candidates = list()
+    for p in peaks:
+        onset = refine_onset(data, header, first + p * hop + size // 2)
+        candidates.append((round(float(onset) / framerate, 3), float(odf[p])))
+
+    return candidates
+
+# ----------------------------------------------------------------------------
+
+
+def find_clap(audio, start=0., end=None):
+    """Return the time of the most probable clap of an audio file.
+
+    :param audio: (str) Input audio file name (WAV)
+    :param start: (float) Start time of the search (in seconds)
+    :param end: (float) End time of the search (in seconds)
+    :return: (float) Time in seconds or None if no clap was found
+
+    """
+    candidates = detect_claps(audio, start, end, nbest=1)
+    if len(candidates) == 0:
+        return None
+    return candidates[0][0]
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Builder of the command lines of ffmpeg, with their filter graph.
+# Required: ffmpeg
+
+# A command is made of inputs, of a filter graph and of outputs, and it is
+# turned into the list of its arguments: no shell parsing, so file names
+# never need to be quoted. The filter graph is made of chains of filters,
+# connected by labels: several operations (frame rate, trim, audio delay...)
+# are then applied by the same ffmpeg process, with a single decoding.
+#
+# >>> cmd = FFmpegCommand()
+# >>> v = cmd.add_input("video.mp4", seek=10.02)
+# >>> a = cmd.add_input("audio.wav")
+# >>> out = cmd.filter(["{:d}:v".format(v)], [fps(25), trim(end_frame=1500)])
+# >>> cmd.add_output("out.mkv", [out[0], "{:d}:a".format(a)],
+# >>>                vcodec="libx265", options=["-crf", "0"])
+# >>> run_command(cmd.get_args())
+
+import shlex
+
+# ----------------------------------------------------------------------------
+
+# A value is parsed twice by ffmpeg: by the parser of the filter graph,
+# then by the parser of the options of its filter. It is escaped for the
+# options first ('=' has a meaning only in the name of an option), then
+# for the filter graph.
+OPTION_CHARS = "\\':"
+GRAPH_CHARS = "\\'[],;"
+
+# ----------------------------------------------------------------------------
+
+
+def escape_value(value):
+    """Return the value of a filter option escaped for the filter graph."""
+    if isinstance(value, float):
+        value = "{:f}".format(value)
+    value = str(value)
+    # the backslash is the first special character: it is escaped first
+    for chars in (OPTION_CHARS, GRAPH_CHARS):
+        for c in chars:
+            value = value.replace(c, "\\" + c)
+    return value
+
+
+def _label(name):
+    """Return a stream name as a label of the filter graph: [name]."""
+    if name.startswith("["):
+        return name
+    return "[{:s}]".format(name)
+
+# ----------------------------------------------------------------------------
+
+
+class Filter(object):
+    """A filter of ffmpeg and its options.
+
+    >>> str(Filter("trim", end_frame=25))
+    'trim=end_frame=25'
+    >>> str(Filter("pan", "mono|c0=c1"))
+    'pan=mono|c0=c1'
+
+    """
+
+    def __init__(self, name, *args, **options):
+        """Create a filter.
+
+        :param name: (str) Name of the filter
+        :param args: Values of the options given by their position
+        :param options: Values of the options given by their name. None
+        values are ignored.
+
+        """
+        self._name = name
+        self._args = args
+        self._options = [(k, v) for k, v in options.items() if v is not None]
+
+    def get_name(self):
+        return self._name
+
+    def __str__(self):
+        values = [escape_value(v) for v in self._args]
+        values += ["{:s}={:s}".format(k, escape_value(v))
+                   for k, v in self._options]
+        if len(values) == 0:
+            return self._name
+        return "{:s}={:s}".format(self._name, ":".join(values))
+
+    def __repr__(self):
+        return "Filter({:s})".format(str(self))
+
+# ----------------------------------------------------------------------------
+# Filters used by audeo
+# ----------------------------------------------------------------------------
+
+
+def fps(rate):
+    """Return the filter changing the frame rate of a video."""
+    return Filter("fps", fps=rate)
+
+
+def trim(start_frame=None, end_frame=None):
+    """Return the filter keeping the frames from start_frame to end_frame."""
+    return Filter("trim", start_frame=start_frame, end_frame=end_frame)
+
+
+def setpts(expr="PTS-STARTPTS"):
+    """Return the filter changing the timestamps of the frames."""
+    return Filter("setpts", expr)
+
+
+def scale(width=-2, height=-1):
+    """Return the filter resizing the frames (-2 keeps the aspect ratio)."""
+    return Filter("scale", width, height)
+
+
+def split(nb):
+    """Return the filter duplicating a video stream into nb streams."""
+    return Filter("split", nb)
+
+
+def asplit(nb):
+    """Return the filter duplicating an audio stream into nb streams."""
+    return Filter("asplit", nb)
+
+
+def adelay(samples):
+    """Return the filter inserting silence at the beginning of all channels.
+
+    :param samples: (int) Number of samples of silence
+
+    """
+    return Filter("adelay", delays="{:d}S".format(samples), all=1)
+
+
+def atrim(start_sample=None, end_sample=None):
+    """Return the filter keeping the samples from start to end."""
+    return Filter("atrim", start_sample=start_sample, end_sample=end_sample)
+
+
+def asetpts(expr="PTS-STARTPTS"):
+    """Return the filter changing the timestamps of the samples."""
+    return Filter("asetpts", expr)
+
+
+def apad(whole_len):
+    """Return the filter appending silence up to a number of samples."""
+    return Filter("apad", whole_len=whole_len)
+
+
+def pan_channel(channel):
+    """Return the filter selecting a channel (1-based) into a mono audio."""
+    return Filter("pan", "mono|c0=c{:d}".format(channel - 1))
+
+# ----------------------------------------------------------------------------
+
+
+def audio_sync_filters(shift, start, end, sample_rate, channel=None):
+    """Return the filters of sync_audio() for the filter graph of ffmpeg.
+
+    The output is the part [start;end] of the input audio shifted by the
+    given delay, with silence where the input has no sample. Positions are
+    rounded to samples like in sync_audio().
+
+    :param shift: (float) Delay (in seconds) to add to the input
+    :param start: (float) Start time of the output in the shifted audio
+    :param end: (float) End time of the output in the shifted audio
+    :param sample_rate: (int) Sample rate of the input audio
+    :param channel: (int) Channel to select (1-based) or None for all
+    :return: (list) List of Filter
+
+    """
+    first = int(round(start * sample_rate)) - int(round(shift * sample_rate))
+    nframes = int(round(end * sample_rate)) - int(round(start * sample_rate))
+    nframes = max(0, nframes)
+
+    filters = list()
+    if channel is not None:
+        filters.append(pan_channel(channel))
+    if first > 0:
+        filters.append(atrim(start_sample=first))
+        filters.append(asetpts())
+    elif first < 0:
+        filters.append(adelay(-first))
+    filters.append(apad(nframes))
+    filters.append(atrim(end_sample=nframes))
+    return filters
+
+# ----------------------------------------------------------------------------
+
+
+class FilterGraph(object):
+    """A filter graph: chains of filters connected by labels."""
+
+    def __init__(self):
+        self._chains = list()
+        self._count = 0
+
+    def new_label(self, prefix="s"):
+        """Return a label not used in the graph."""
+        self._count += 1
+        return "[{:s}{:d}]".format(prefix, self._count)
+
+    def add_chain(self, inputs, filters, nb_outputs=1):
+        """Add a chain of filters.
+
+        :param inputs: (list) Input streams, ie. "0:v" or labels of chains
+        :param filters: (list) Filters applied in sequence
+        :param nb_outputs: (int) Number of output streams of the chain
+        :return: (list) Labels of the output streams
+
+        """
+        if len(filters) == 0:
+            raise ValueError("A chain of the filter graph needs a filter.")
+        outputs = [self.new_label() for i in range(nb_outputs)]
+        self._chains.append(("".join(_label(i) for i in inputs),
+                             ",".join(str(f) for f in filters),
+                             "".join(outputs)))
+        return outputs
+
+    def is_empty(self):
+        return len(self._chains) == 0
+
+    def __str__(self):
+        return ";".join(i + f + o for i, f, o in self._chains)
+
+# ----------------------------------------------------------------------------
+
+
+class FFmpegCommand(object):
+    """The arguments of a command of ffmpeg."""
+
+    def __init__(self, program="ffmpeg"):
+        self._program = program
+        self._inputs = list()
+        self._outputs = list()
+        self._graph = FilterGraph()
+
+    # -----------------------------------------------------------------------
+
+    def add_input(self, filename, seek=None, fmt=None, options=None):
+        """Add an input file.
+
+        :param filename: (str) File name or source of the input
+        :param seek: (float) Time to seek the input to, in seconds, or as a
+        string like "00:10.02", or None
+        :param fmt: (str) Format of the input, or None to guess it
+        :param options: (list) Other input options
+        :return: (int) Index of the input
+
+        """
+        args = list(options or [])
+        if seek is not None:
+            if isinstance(seek, str) is False:
+                seek = "{:.6f}".format(seek)
+            args += ["-ss", seek]
+        if fmt is not None:
+            args += ["-f", fmt]
+        args += ["-i", filename]
+        self._inputs.append(args)
+        return len(self._inputs) - 1
+
+    def filter(self, inputs, filters, nb_outputs=1):
+        """Add a chain of filters to the filter graph.
+
+        :return: (list) Labels of its output streams, see FilterGraph
+
+        """
+        return self._graph.add_chain(inputs, filters, nb_outputs)
+
+    def add_output(self, filename, maps=None, fmt=None, vcodec=None,
+                   acodec=None, options=None):
+        """Add an output file.
+
+        :param filename: (str) Output file name
+        :param maps: (list) Streams of the output: labels of the filter graph
+        or stream specifiers like "1:a", or None for the default streams
+        :param fmt: (str) Format of the output, or None to guess it
+        :param vcodec: (str) Video encoder, "copy", or None
+        :param acodec: (str) Audio encoder, "copy", or None
+        :param options: (list) Other output options, ie. ["-crf", "0"]
+
+        """
+        args = list()
+        for m in (maps or []):
+            args += ["-map", m]
+        if vcodec is not None:
+            args += ["-c:v", vcodec]
+        if acodec is not None:
+            args += ["-c:a", acodec]
+        args += list(options or [])
+        if fmt is not None:
+            args += ["-f", fmt]
+        args.append(filename)
+        self._outputs.append(args)
+
+    # -----------------------------------------------------------------------
+
+    def get_args(self):
+        """Return the list of the arguments of the command."""
+        if len(self._outputs) == 0:
+            raise ValueError("The ffmpeg command has no output file.")
+        args = [self._program, "-hide_banner", "-nostdin", "-y"]
+        for i in self._inputs:
+            args += i
+        if self._graph.is_empty() is False:
+            args += ["-filter_complex", str(self._graph)]
+        for o in self._outputs:
+            args += o
+        return args
+
+    def __str__(self):
+        return " ".join(shlex.quote(a) for a in self.get_args())
@@ -6,25 +6,233 @@
 # ffmpeg needs to be built with the --enable-gpl --enable-libx265 
 # configuration flag and requires x265 to be installed on your system.
 
+import os
+import json
+from fractions import Fraction
 
-from .utils import run_command
+from .utils import run_command, run_commands
+from .frame_index import FrameIndex
+from .utils_audio import WaveReader, WAVE_FORMAT_IEEE_FLOAT
+from . import ffmpeg_command as filters
+from .ffmpeg_command import FFmpegCommand
 
 # ----------------------------------------------------------------------------
 
+# Encoder and options of each profile of the lossless videos:
+#   - x265: the smallest files, but the slowest encoding;
+#   - ffv1: intra-only, encoded by slices with all the CPUs;
+#   - x264: the fastest encoding, but the largest files;
+#   - copy: the frames are copied, if the first one is a keyframe.
+INTERMEDIATE_CODECS = {
+    "x265": ("libx265", ["-crf", "0", "-pix_fmt", "yuv420p"]),
+    "ffv1": ("ffv1", ["-level", "3", "-slices", "16", "-slicecrc", "1",
+                      "-g", "1"]),
+    "x264": ("libx264", ["-qp", "0", "-preset", "ultrafast"]),
+    "copy": ("copy", []),
+}
+DEFAULT_INTERMEDIATE = "x265"
+
+# Options of the encoders of the outputs
+AAC_OPTIONS = ["-strict", "-2"]
 
-def extract_audio(video, audio):
+# ----------------------------------------------------------------------------
+
+
+def intermediate_codec(profile):
+    """Return the encoder and the options of a profile of lossless videos.
+
+    :param profile: (str) A key of INTERMEDIATE_CODECS
+    :return: (str, list)
+    :raise: ValueError if the profile is unknown
+
+    """
+    if profile not in INTERMEDIATE_CODECS:
+        raise ValueError("Unknown profile {:s} of the lossless videos. "
+                         "Expected one of: {:s}".format(
+                             profile, ", ".join(sorted(INTERMEDIATE_CODECS))))
+    return INTERMEDIATE_CODECS[profile]
+
+
+def _threads_options(profile):
+    """Return the options to encode a lossless video with all the CPUs.
+
+    They depend on the machine, so they are added to the commands and not
+    to INTERMEDIATE_CODECS, which are in the keys of the cached outputs.
+
+    """
+    if profile == "ffv1":
+        return ["-threads", str(os.cpu_count() or 1)]
+    return list()
+
+
+def _add_lossless_output(cmd, video_out, maps=None, fmt="matroska",
+                         options=None, profile=DEFAULT_INTERMEDIATE):
+    """Add a lossless output without audio to a command."""
+    vcodec, codec_options = intermediate_codec(profile)
+    cmd.add_output(video_out, maps, fmt=fmt, vcodec=vcodec,
+                   options=list(options or []) + codec_options +
+                   _threads_options(profile) + ["-an"])
+
+
+def _add_audio_inputs(cmd, audio):
+    """Add audio files to the inputs of a command.
+
+    :param cmd: (FFmpegCommand)
+    :param audio: (str or list) An audio file name, a list of audio file
+    names each one in its own audio stream, or None
+    :return: (list) Stream specifiers of the audio streams
+
+    """
+    if audio is None:
+        return list()
+    if isinstance(audio, str):
+        audio = [audio]
+    return ["{:d}:a".format(cmd.add_input(a)) for a in audio]
+
+
+def _pcm_encoder(audio):
+    """Return the PCM encoder keeping the sample format of a WAV file."""
+    with WaveReader(audio) as fa:
+        sampwidth = fa.get_sampwidth()
+        fmt = fa.get_format()
+    if fmt == WAVE_FORMAT_IEEE_FLOAT:
+        return "pcm_f64le" if sampwidth == 8 else "pcm_f32le"
+    if sampwidth == 3:
+        return "pcm_s24le"
+    if sampwidth == 4:
+        return "pcm_s32le"
+    return "pcm_s16le"
+
+
+def _lossy_options(crf, preset="slow"):
+    """Return the options of libx264 to create a lossy MP4 video."""
+    return ["-crf", str(crf), "-preset", preset,
+            "-profile:v", "main", "-pix_fmt", "yuv420p"]
+
+# ----------------------------------------------------------------------------
+
+
+def _fraction(value):
+    """Return a rational "num/den" string as a Fraction or None."""
+    try:
+        f = Fraction(value)
+    except (ValueError, ZeroDivisionError, TypeError):
+        return None
+    if f <= 0:
+        return None
+    return f
+
+# ----------------------------------------------------------------------------
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+# ----------------------------------------------------------------------------
+
+
+def probe_media(media):
+    """Return the description of a media file from its container.
+
+    Only the metadata are read with a single call to ffprobe: nothing is
+    decoded, whatever the size of the file.
+
+    :param media: (str) Input filename of the video or of the audio
+    :return: (dict) with keys:
+        - 'duration': (float) duration of the media in seconds
+        - 'format': (str) name of the container
+        - 'video': (dict) the first video stream, or None
+        - 'audio': (list) the audio streams
+    A video stream has keys 'index', 'codec', 'width', 'height', 'pix_fmt',
+    'profile', 'level', 'bit_rate', 'fps' (Fraction), 'nb_frames',
+    'duration', 'start_time'.
+    An audio stream has keys 'index', 'codec', 'sample_rate', 'channels',
+    'channel_layout', 'duration', 'start_time'.
+
+    """
+    output = run_command(["ffprobe", "-v", "error", "-print_format", "json",
+                          "-show_format", "-show_streams", media])
+    if output is None or len(output[0]) == 0:
+        raise IOError("ffprobe can't read the file {:s}".format(media))
+    info = json.loads(output[0].decode("utf-8"))
+
+    fmt = info.get("format", dict())
+    result = {"duration": _float(fmt.get("duration")),
+              "format": fmt.get("format_name"),
+              "video": None,
+              "audio": list()}
+
+    for stream in info.get("streams", list()):
+        common = {"index": stream.get("index"),
+                  "codec": stream.get("codec_name"),
+                  "duration": _float(stream.get("duration")),
+                  "start_time": _float(stream.get("start_time"))}
+        if stream.get("codec_type") == "video" and result["video"] is None:
+            # images attached to audio files are not videos
+            if stream.get("disposition", dict()).get("attached_pic") == 1:
+                continue
+            # the average rate is the real one of interlaced videos
+            fps = _fraction(stream.get("avg_frame_rate"))
+            if fps is None:
+                fps = _fraction(stream.get("r_frame_rate"))
+            nb_frames = stream.get("nb_frames")
+            common.update({
+                "width": stream.get("width"),
+                "height": stream.get("height"),
+                "pix_fmt": stream.get("pix_fmt"),
+                "profile": stream.get("profile"),
+                "level": stream.get("level"),
+                "bit_rate": int(stream["bit_rate"]) if stream.get("bit_rate") else None,
+                "fps": fps,
+                "nb_frames": int(nb_frames) if nb_frames else None})
+            result["video"] = common
+        elif stream.get("codec_type") == "audio":
+            common.update({
+                "sample_rate": int(stream.get("sample_rate", 0)),
+                "channels": stream.get("channels"),
+                "channel_layout": stream.get("channel_layout")})
+            result["audio"].append(common)
+
+    if result["duration"] is None and result["video"] is not None:
+        result["duration"] = result["video"]["duration"]
+
+    return result
+
+# ----------------------------------------------------------------------------
+
+
+def extract_audio(video, audio, mono=False, acodec="pcm_s16le",
+                  start=None, duration=None, sample_rate=None):
     """Extract the audio of the video and re-encode into wav.
 
+    With a start time, the input is seeked: only the packets of the window
+    [start;start+duration] are read and decoded, not the whole file.
+
     :param video: (str) Input video file name
     :param audio: (str) Output audio file name
+    :param mono: (bool) Mix all the channels into a single one
+    :param acodec: (str) PCM codec: pcm_s16le or pcm_f32le
+    :param start: (float) Start time of the extracted audio, or None
+    :param duration: (float) Duration of the extracted audio, or None
+    :param sample_rate: (int) Sample rate of the output, or None to keep
+    the one of the video
     
     """
-    command = "ffmpeg "
-    command += "-i '{:s}' ".format(video)
-    command += "-vn -acodec pcm_s16le "
-    command += "'{:s}' ".format(audio)
-    command += "-nostdin -y"   # override if existing
-    run_command(command)
+    cmd = FFmpegCommand()
+    options = None
+    if duration is not None:
+        options = ["-t", "{:.6f}".format(duration)]
+    cmd.add_input(video, seek=start, options=options)
+    options = ["-vn"]
+    if mono is True:
+        options += ["-ac", "1"]
+    if sample_rate is not None:
+        options += ["-ar", str(sample_rate)]
+    cmd.add_output(audio, acodec=acodec, options=options)
+    run_command(cmd.get_args())
 
 # ----------------------------------------------------------------------------
 
@@ -36,11 +244,10 @@ def remove_audio_of_video(video, video_out):
     :param video_out: (str) Output filename of the video
 
     """
-    command = "ffmpeg -i '{:s}' ".format(video)
-    command += "-c:v copy "
-    command += "-an '{:s}' -hide_banner ".format(video_out)
-    command += "-nostdin -y"   # override if existing
-    run_command(command)
+    cmd = FFmpegCommand()
+    cmd.add_input(video)
+    cmd.add_output(video_out, vcodec="copy", options=["-an"])
+    run_command(cmd.get_args())
 
 # ----------------------------------------------------------------------------
 
@@ -49,7 +256,8 @@ def add_audio_to_video(video, audio, video_out):
     """Add the audio to the given video.
 
     :param video: (str) Input filename of the video 
-    :param audio: (str) Input audio file name
+    :param audio: (str or list) Input audio file name, or list of file
+    names of the audio tracks
     :param video_out: (str) Output filename of the video
 
     Video stream is copied.
@@ -57,45 +265,39 @@ def add_audio_to_video(video, audio, video_out):
     with the video container.
 
     """
-    command = "ffmpeg "
-    command += "-i '{:s}' ".format(video)
-    command += "-i '{:s}' ".format(audio)
-    command += "-c:v copy "
-    command += "-c:a aac -strict -2 "
-    command += "'{:s}' ".format(video_out)
-    command += "-nostdin -y"   # override if existing
-    run_command(command)
+    cmd = FFmpegCommand()
+    cmd.add_input(video)
+    maps = ["0:v"] + _add_audio_inputs(cmd, audio)
+    cmd.add_output(video_out, maps, vcodec="copy", acodec="aac",
+                   options=AAC_OPTIONS)
+    run_command(cmd.get_args())
 
 # ----------------------------------------------------------------------------
 
 
-def mult_fps_video(video, fps, video_out):
+def mult_fps_video(video, fps, video_out, profile=DEFAULT_INTERMEDIATE):
     """Modify the frame-per-seconds rate of the video.
 
     :param video: (str) Input filename of the video 
     :param fps: (int) Expected framerate (expected 15-100)
     :param video_out: (str) Output filename of the video (expect a .mkv)
+    :param profile: (str) Profile of the lossless encoding, except "copy"
 
     A re-encoding is required. No compression rate applied.
     Audio is removed of the video (if it was existing).
     
     """
-    fps = int(fps)
-    command = "ffmpeg "
-    command += "-i '{:s}' ".format(video)
-    command += "-f matroska "
-    command += "-filter:v fps=fps={:d} ".format(fps)
-    command += "-vcodec libx265 "
-    command += "-crf 0 "
-    command += "-pix_fmt yuv420p "
-    command += "-an {:s} ".format(video_out)
-    command += "-nostdin -y"
-    run_command(command)
+    cmd = FFmpegCommand()
+    v = cmd.add_input(video)
+    out = cmd.filter(["{:d}:v".format(v)], [filters.fps(int(fps))])
+    _add_lossless_output(cmd, video_out, out, profile=profile)
+    run_command(cmd.get_args())
 
 # ----------------------------------------------------------------------------
 
 
-def trim_video_at_frame(video, from_time, from_frame, to_frame, video_out):
+def trim_video_at_frame(video, from_time, from_frame, to_frame, video_out,
+                        fps=None, profile=DEFAULT_INTERMEDIATE):
     """Trim a video with the highest precision as possible.
 
     :param video: (str) Input filename of the video 
@@ -103,21 +305,301 @@ def trim_video_at_frame(video, from_time, from_frame, to_frame, video_out):
     :param from_frame: (int) Frame position to start to trim
     :param to_frame: (int) Frame position to end to trim
     :param video_out: (str) Output filename of the video (expect a .mkv)
+    :param fps: (int) Frame rate of the output, or None to keep the one of
+    the video. The frame rate is changed by the same ffmpeg process.
+    :param profile: (str) Profile of the lossless encoding, see
+    INTERMEDIATE_CODECS
 
     A re-encoding is required. No compression rate applied.
+    The input is seeked: ffmpeg starts to decode at the keyframe preceding
+    from_time instead of the beginning of the video, and drops the frames
+    before from_time. from_time must then be between the time of from_frame
+    and the time of the previous frame: half a frame before is safe. The
+    first frame is at time (frame time - from_time): the timestamps are
+    shifted to start at 0.
+    With the "copy" profile, nothing is decoded: from_frame must be a
+    keyframe and from_time must be between the time of from_frame and the
+    time of the next frame. The packets are counted in decoding order: the
+    cut is frame-exact only if both from_frame and to_frame are closed
+    keyframes (see FrameIndex), or to_frame is the end of the video.
     
     """
-    command = "ffmpeg "
-    command += "-i '{:s}' ".format(video)
-    command += "-f matroska "
-    command += "-ss {:s} ".format(from_time)
-    command += "-vf trim=start_frame={:d}:end_frame={:d} ".format(from_frame, to_frame)
-    command += "-vcodec libx265 "
-    command += "-crf 0 "
-    command += "-pix_fmt yuv420p "
-    command += "-an {:s} ".format(video_out)
-    command += "-nostdin -y"
-    run_command(command)
+    cmd = FFmpegCommand()
+    v = cmd.add_input(video, seek=from_time)
+    if profile == "copy":
+        if fps is not None:
+            raise ValueError("The frame rate of a copied video can't be "
+                             "changed.")
+        cmd.add_output(video_out, ["{:d}:v".format(v)], fmt="matroska",
+                       vcodec="copy",
+                       options=["-frames:v", str(to_frame - from_frame),
+                                "-an"])
+        run_command(cmd.get_args())
+        return
+    chain = [filters.trim(end_frame=to_frame - from_frame), filters.setpts()]
+    if fps is not None:
+        chain.append(filters.fps(fps))
+    out = cmd.filter(["{:d}:v".format(v)], chain)
+    _add_lossless_output(cmd, video_out, out, profile=profile)
+    run_command(cmd.get_args())
+
+# Profiles of the lossless videos which can be stored in MPEG-TS segments:
+# FFV1 can't, but it encodes slices in parallel by itself
+PARALLEL_INTERMEDIATES = ("x265", "x264")
+
+# ----------------------------------------------------------------------------
+
+
+def split_at_keyframes(from_frame, to_frame, keyframes, nb):
+    """Split a range of frames into nb segments starting at keyframes.
+
+    :param from_frame: (int) First frame of the range
+    :param to_frame: (int) Last frame of the range (excluded)
+    :param keyframes: (list) Frame positions of the keyframes
+    :param nb: (int) Expected number of segments
+    :return: (list) List of (first frame, last frame excluded)
+
+    """
+    inside = [k for k in keyframes if from_frame < k < to_frame]
+    bounds = [from_frame]
+    for i in range(1, nb):
+        if len(inside) == 0:
+            break
+        ideal = from_frame + (i * (to_frame - from_frame)) // nb
+        nearest = min(inside, key=lambda k: abs(k - ideal))
+        if nearest > bounds[-1]:
+            bounds.append(nearest)
+    bounds.append(to_frame)
+    return [(bounds[i], bounds[i+1]) for i in range(len(bounds) - 1)]
+
+# ----------------------------------------------------------------------------
+
+
+def trim_video_parallel(video, from_frame, to_frame, video_out,
+                        workdir, jobs=None, index=None,
+                        profile=DEFAULT_INTERMEDIATE):
+    """Trim a video by encoding segments in parallel.
+
+    The range of frames is split at closed keyframes into segments. Each
+    segment is encoded by its own ffmpeg process, which starts to decode at
+    its keyframe, and all segments are then concatenated without
+    re-encoding. The result is frame-exact, like trim_video_at_frame().
+
+    :param video: (str) Input filename of the video
+    :param from_frame: (int) Frame position to start to trim
+    :param to_frame: (int) Frame position to end to trim
+    :param video_out: (str) Output filename of the video (expect a .mkv)
+    :param workdir: (str) Directory for the segments
+    :param jobs: (int) Number of parallel encodings, default is nb of CPUs
+    :param index: (FrameIndex) Index of the frames of the video
+    :param profile: (str) Profile of the lossless encoding: x265 or x264,
+    the encoders supported by the segments
+
+    """
+    if profile not in PARALLEL_INTERMEDIATES:
+        raise ValueError("The segments can't be encoded with the profile "
+                         "{:s}.".format(profile))
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+    if index is None:
+        index = FrameIndex.from_video(video)
+    key_frames = index.keyframes_between(from_frame + 1, to_frame - 1,
+                                         closed=True)
+    segments = split_at_keyframes(from_frame, to_frame, key_frames, jobs)
+    start = index.frame_to_time(from_frame)
+
+    # the encoder of each process gets its share of the CPUs
+    pools = max(1, (os.cpu_count() or 1) // len(segments))
+    threads = ["-x265-params", "pools={:d}".format(pools)]
+    if profile == "x264":
+        threads = ["-threads", str(pools)]
+    files = list()
+    commands = list()
+    for i, (first, last) in enumerate(segments):
+        ts = os.path.join(workdir, "segment_{:04d}.ts".format(i))
+        cmd = FFmpegCommand()
+        if index.is_keyframe(first) is True and index.is_open(first) is False:
+            # decode from the keyframe itself, not from the previous one: no
+            # frame is dropped, like for a copy
+            seek = index.frame_to_time(first) + index.frame_duration(first) / 4.
+            v = cmd.add_input(video, seek=seek, options=["-noaccurate_seek"])
+        else:
+            seek = index.seek_time(first)
+            v = cmd.add_input(video, seek=seek)
+        out = cmd.filter(["{:d}:v".format(v)],
+                         [filters.trim(end_frame=last - first)])
+        # timestamps of each segment follow the ones of the previous segment:
+        # its first frame is at time (frame time - seek)
+        _add_lossless_output(cmd, ts, out, "mpegts", threads + [
+            "-output_ts_offset", "{:.6f}".format(seek - start)],
+            profile)
+        files.append(ts)
+        commands.append(cmd.get_args())
+
+    run_commands(commands)
+    for ts in files:
+        if os.path.exists(ts) is False:
+            raise IOError("Segment {:s} was not created.".format(ts))
+
+    concat_mpegts_to_video(files, video_out)
+    for ts in files:
+        os.remove(ts)
+
+# ----------------------------------------------------------------------------
+
+# Encoder and bitstream filter to re-encode parts of a video of a codec
+SMART_CODECS = {
+    "h264": ("libx264", "h264_mp4toannexb"),
+    "hevc": ("libx265", "hevc_mp4toannexb"),
+}
+
+# ----------------------------------------------------------------------------
+
+
+def _level(stream):
+    """Return the level of a H264 or H265 video stream, ie. "4.1", or None.
+
+    ffprobe gives the level_idc of the stream: 10 times the level in H264
+    and 30 times the level in H265.
+
+    """
+    level = stream.get("level")
+    if level is None or level <= 0:
+        return None
+    if stream.get("codec") == "hevc":
+        return "{:.1f}".format(level / 30.)
+    # level 1b of H264 (level_idc 9) is not an option of libx264
+    if level < 10:
+        return None
+    return "{:.1f}".format(level / 10.)
+
+
+def _encoder_options(stream):
+    """Return ffmpeg options to encode like the given video stream.
+
+    The parameter sets are repeated before each keyframe: the ones of the
+    copied frames differ from the ones of the re-encoded frames.
+
+    """
+    options = list()
+    profile = (stream.get("profile") or "").lower()
+    if profile == "constrained baseline":
+        profile = "baseline"
+    profile = profile.replace(" ", "")
+    if profile in ("baseline", "main", "high", "main10", "high10"):
+        options += ["-profile:v", profile]
+    if stream.get("pix_fmt") is not None:
+        options += ["-pix_fmt", stream["pix_fmt"]]
+    if stream.get("bit_rate") is not None:
+        options += ["-b:v", str(stream["bit_rate"])]
+    else:
+        options += ["-crf", "18"]
+
+    level = _level(stream)
+    if stream.get("codec") == "hevc":
+        params = ["repeat-headers=1"]
+        if level is not None:
+            params.insert(0, "level-idc={:s}".format(level))
+        options += ["-x265-params", ":".join(params)]
+    else:
+        if level is not None:
+            options += ["-level", level]
+        options += ["-x264-params", "repeat-headers=1"]
+    return options
+
+# ----------------------------------------------------------------------------
+
+
+def smart_trim(video, from_frame, to_frame, video_out, workdir,
+               media=None, index=None):
+    """Trim a video by re-encoding only the partial GOPs at both ends.
+
+    The frames from from_frame to the first keyframe after it, and from the
+    last keyframe before to_frame to to_frame, are re-encoded with the codec
+    parameters of the video. All the frames between both keyframes are
+    copied without re-encoding, up to the end of the video if to_frame is
+    its end. The result is frame-exact.
+
+    The copy starts and ends at closed keyframes only (see FrameIndex): the
+    whole range is re-encoded if the video has only open GOPs.
+
+    The re-encoded parts have the profile, the level, the pixel format and
+    the bit rate of the video, but not all its encoding parameters: the
+    output switches between the parameter sets of the encoder and of the
+    video. They are repeated in the stream before each keyframe, but some
+    hardware players only read the ones of the MP4 header.
+
+    :param video: (str) Input filename of the video (H264 or H265)
+    :param from_frame: (int) Frame position to start to trim
+    :param to_frame: (int) Frame position to end to trim
+    :param video_out: (str) Output filename of the video (expect a .mp4)
+    :param workdir: (str) Directory for the parts
+    :param media: (dict) Description of the video, see probe_media()
+    :param index: (FrameIndex) Index of the frames of the video
+    :raise: ValueError if the codec of the video is not supported
+
+    """
+    if media is None:
+        media = probe_media(video)
+    stream = media["video"]
+    if stream is None or stream["codec"] not in SMART_CODECS:
+        raise ValueError("Smart trim is not supported for the codec of {:s}"
+                         "".format(video))
+    encoder, bsf = SMART_CODECS[stream["codec"]]
+    if index is None:
+        index = FrameIndex.from_video(video)
+    inside = index.keyframes_between(from_frame, to_frame, closed=True)
+    start = index.frame_to_time(from_frame)
+
+    # the copy ends at a closed keyframe, or at the end of the video
+    end = inside[-1] if len(inside) > 0 else None
+    if to_frame >= index.get_nframes():
+        end = to_frame
+
+    # (first frame, last frame, copied or re-encoded)
+    if len(inside) == 0 or end <= inside[0]:
+        parts = [(from_frame, to_frame, False)]
+    else:
+        parts = [(from_frame, inside[0], False),
+                 (inside[0], end, True),
+                 (end, to_frame, False)]
+    parts = [p for p in parts if p[1] > p[0]]
+
+    files = list()
+    for i, (first, last, copy) in enumerate(parts):
+        ts = os.path.join(workdir, "part_{:d}.ts".format(i))
+        cmd = FFmpegCommand()
+        options = ["-frames:v", str(last - first)]
+        input_options = None
+        if copy is True or (index.is_keyframe(first) is True and
+                            index.is_open(first) is False):
+            # a copy starts at the keyframe at or before the seek position;
+            # the tail is decoded from its keyframe, not from the previous one
+            seek = index.frame_to_time(first) + index.frame_duration(first) / 4.
+            if copy is False:
+                input_options = ["-noaccurate_seek"]
+        else:
+            seek = index.seek_time(first)
+        if copy is True:
+            options += ["-bsf:v", bsf]
+            vcodec = "copy"
+        else:
+            options += _encoder_options(stream)
+            vcodec = encoder
+        cmd.add_input(video, seek=seek, options=input_options)
+        # the first frame of the part is at time (frame time - seek): it is
+        # shifted to its time in the output, whatever the seek position
+        options += ["-output_ts_offset", "{:.6f}".format(seek - start),
+                    "-an"]
+        cmd.add_output(ts, fmt="mpegts", vcodec=vcodec, options=options)
+        run_command(cmd.get_args())
+        if os.path.exists(ts) is False:
+            raise IOError("Part {:s} was not created.".format(ts))
+        files.append(ts)
+
+    concat_mpegts_to_video(files, video_out)
+    for ts in files:
+        os.remove(ts)
 
 # ----------------------------------------------------------------------------
 
@@ -125,16 +607,15 @@ def trim_video_at_frame(video, from_time, from_frame, to_frame, video_out):
 def convert_to_mpegts(video, video_out):
     """Convert the video to mpegts.
 
-    :param video: (str) Input filename of the video 
+    :param video: (str) Input filename of the video (H264)
     :param video_out: (str) Output filename of the video
-    
-    """    
-    command = "ffmpeg "
-    command += "-i '{:s}' ".format(video)
-    command += "-c copy "
-    command += "-bsf:v h264_mp4toannexb -f mpegts "
-    command += "{:s}".format(video_out)
-    run_command(command)
+
+    """
+    cmd = FFmpegCommand()
+    cmd.add_input(video)
+    cmd.add_output(video_out, fmt="mpegts", vcodec="copy", acodec="copy",
+                   options=["-bsf:v", "h264_mp4toannexb"])
+    run_command(cmd.get_args())
 
 # ----------------------------------------------------------------------------
 
@@ -146,12 +627,10 @@ def concat_mpegts_to_video(videos, video_out):
     :param video_out: (str) Output filename of the video
 
     """
-    mpegts = "|".join(videos)
-    command = "ffmpeg "
-    command += "-i 'concat:{:s}' ".format(mpegts)
-    command += "-c copy "
-    command += "{:s}".format(video_out)
-    run_command(command)
+    cmd = FFmpegCommand()
+    cmd.add_input("concat:{:s}".format("|".join(videos)))
+    cmd.add_output(video_out, vcodec="copy", acodec="copy")
+    run_command(cmd.get_args())
 
 # ----------------------------------------------------------------------------
 
@@ -160,18 +639,16 @@ def merge_video_audio(video, audio, video_out):
     """Merge audio and video without re-encoding.
 
     :param video: (str) Input filename of the video 
-    :param audio: (str) Input filename of the audio
+    :param audio: (str or list) Input filename of the audio, or list of
+    file names of the audio tracks
     :param video_out: (str) Output filename of the video (expect a .mkv)
 
     """
-    command = "ffmpeg "
-    command += "-i '{:s}' ".format(video)
-    command += "-i '{:s}' ".format(audio)
-    command += "-c:v copy "
-    command += "-c:a copy "
-    command += "'{:s}' -hide_banner ".format(video_out)
-    command += "-nostdin -y"   # override if existing
-    run_command(command)
+    cmd = FFmpegCommand()
+    cmd.add_input(video)
+    maps = ["0:v"] + _add_audio_inputs(cmd, audio)
+    cmd.add_output(video_out, maps, vcodec="copy", acodec="copy")
+    run_command(cmd.get_args())
 
 # ----------------------------------------------------------------------------
 
@@ -180,7 +657,8 @@ def merge_and_compress(video, audio, video_out, crf=18):
     """Merge audio and video and convert to the MP4 lossy file format.
 
     :param video: (str) Input filename of the video 
-    :param audio: (str) Input filename of the audio
+    :param audio: (str or list) Input filename of the audio, or list of
+    file names of the audio tracks, or None
     :param video_out: (str) Output filename of the video (expect a .mp4)
     :param crf: (int) Compression rate between 0 and 51.
 
@@ -191,18 +669,97 @@ def merge_and_compress(video, audio, video_out, crf=18):
     Audio is converted to AAC.
 
     """
-    command = "ffmpeg "
-    command += "-i '{:s}' ".format(video)
-    if audio is not None:
-        command += "-i '{:s}' ".format(audio)
-    command += "-f mp4 "
-    command += "-vcodec libx264 "
-    command += "-crf {:d} ".format(crf)
-    command += "-preset slow "    # to keep a good quality
-    command += "-profile:v main "
-    command += "-pix_fmt yuv420p "
-    command += "-c:a aac -strict -2 "
-    command += "'{:s}' -hide_banner ".format(video_out)
-    command += "-nostdin -y"   # override if existing
-    run_command(command)
+    cmd = FFmpegCommand()
+    cmd.add_input(video)
+    maps = ["0:v"] + _add_audio_inputs(cmd, audio)
+    cmd.add_output(video_out, maps, fmt="mp4", vcodec="libx264", acodec="aac",
+                   options=_lossy_options(crf) + AAC_OPTIONS)
+    run_command(cmd.get_args())
+
+# ----------------------------------------------------------------------------
+
+
+def trim_and_encode(video, audio, from_time, from_frame, to_frame,
+                    lossless=None, lossy=None, proxy=None, proxy_height=360,
+                    crf=18, audio_filters=None,
+                    profile=DEFAULT_INTERMEDIATE):
+    """Trim a video and encode it into several files with a single decoding.
 
+    The frames are decoded once, trimmed like in trim_video_at_frame(), and
+    split by the filter graph into one stream for each output file: all the
+    files are encoded by the same ffmpeg process, without any intermediate
+    video. Each output embeds the audio.
+
+    :param video: (str) Input filename of the video
+    :param audio: (str or list) Input filename of the audio, or list of
+    file names of the audio tracks, or None
+    :param from_time: (str) Time position to start to trim
+    :param from_frame: (int) Frame position to start to trim
+    :param to_frame: (int) Frame position to end to trim
+    :param lossless: (str) Output lossless file with WAV (expect a .mkv)
+    :param lossy: (str) Output lossy file H264+AAC (expect a .mp4)
+    :param proxy: (str) Output low-resolution file H264+AAC (expect a .mp4)
+    :param proxy_height: (int) Height of the frames of the proxy
+    :param crf: (int) Compression rate of the lossy file
+    :param audio_filters: (list) Filters applied to the audio by the same
+    process, ie. the ones of audio_sync_filters(), or None. They need a
+    single audio file.
+    :param profile: (str) Profile of the lossless file, except "copy"
+
+    """
+    outputs = [o for o in (lossless, lossy, proxy) if o is not None]
+    if len(outputs) == 0:
+        raise ValueError("No output file to encode {:s}.".format(video))
+    if profile == "copy":
+        raise ValueError("The lossless file of {:s} can't be copied: its "
+                         "frames are decoded for the other files."
+                         "".format(video))
+
+    cmd = FFmpegCommand()
+    v = cmd.add_input(video, seek=from_time)
+    # the audio inputs start at 0: so does the video after the seek
+    chain = [filters.trim(end_frame=to_frame - from_frame), filters.setpts()]
+    if len(outputs) > 1:
+        chain.append(filters.split(len(outputs)))
+    streams = cmd.filter(["{:d}:v".format(v)], chain, len(outputs))
+    if proxy is not None:
+        # the proxy is the last stream of the split
+        streams[-1] = cmd.filter([streams[-1]],
+                                 [filters.scale(-2, proxy_height)])[0]
+
+    # the audio streams of each output
+    tracks = _add_audio_inputs(cmd, audio)
+    audios = [tracks] * len(outputs)
+    if audio_filters and len(tracks) > 0:
+        if len(tracks) > 1:
+            raise ValueError("The audio filters apply to a single audio file.")
+        chain = list(audio_filters)
+        if len(outputs) > 1:
+            chain.append(filters.asplit(len(outputs)))
+        audios = [[a] for a in cmd.filter(tracks, chain, len(outputs))]
+
+    def maps(i):
+        return [streams[i]] + audios[i]
+
+    i = 0
+    if lossless is not None:
+        # a filtered audio can't be copied: it is stored with the sample
+        # format of the input
+        acodec = "copy"
+        if audio_filters and len(tracks) > 0:
+            acodec = _pcm_encoder(audio if isinstance(audio, str) else audio[0])
+        vcodec, codec_options = intermediate_codec(profile)
+        cmd.add_output(lossless, maps(i), fmt="matroska", vcodec=vcodec,
+                       acodec=acodec,
+                       options=codec_options + _threads_options(profile))
+        i += 1
+    if lossy is not None:
+        cmd.add_output(lossy, maps(i), fmt="mp4", vcodec="libx264",
+                       acodec="aac", options=_lossy_options(crf) + AAC_OPTIONS)
+        i += 1
+    if proxy is not None:
+        cmd.add_output(proxy, maps(i), fmt="mp4", vcodec="libx264",
+                       acodec="aac",
+                       options=_lossy_options(28, "veryfast") + AAC_OPTIONS +
+                       ["-b:a", "96k"])
+    run_command(cmd.get_args())
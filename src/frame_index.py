@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Index of the timestamps of the frames of a video.
+# Required: ffprobe
+
+# Phones and action cameras record with a variable frame rate (VFR): the
+# position of a frame can't be computed from its time and a frame rate.
+# The index stores the presentation time of each frame and the positions of
+# the keyframes. They are read from the packets of the video stream with
+# a demux-only pass of ffprobe (nothing is decoded), and can be saved into
+# a compact binary sidecar file.
+#
+# A keyframe is "open" when frames displayed before it follow it in the
+# decoding order (open GOP: leading B-frames of AVCHD, RASL frames of the
+# CRA of HEVC). These frames can reference the previous GOP: a stream
+# copied from an open keyframe has broken or extra frames at its start.
+#
+# Times are relative to the start of the container, not to the first video
+# frame: it is the origin of the seek times of ffmpeg and of the audio
+# extracted from the video. The first frame is after 0 when the video starts
+# after the audio.
+
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+
+from .utils import run_command
+
+# ----------------------------------------------------------------------------
+
+MAGIC = b"AUDEOIDX"
+VERSION = 3
+
+# ----------------------------------------------------------------------------
+
+
+def read_packets(video):
+    """Return the timestamps and the keyframe flags of the video packets.
+
+    The decoding time is used when the presentation time is unknown, ie.
+    in AVI files, and None when both are unknown, ie. in raw streams.
+
+    :param video: (str) Input filename of the video
+    :return: (list) List of (time, is_keyframe) in decoding order
+
+    """
+    command = ["ffprobe", "-v", "error", "-select_streams", "v:0",
+               "-show_entries", "packet=pts_time,dts_time,flags",
+               "-of", "csv=p=0", video]
+    output = run_command(command)
+    if output is None:
+        return list()
+
+    packets = list()
+    for line in output[0].decode("utf-8").splitlines():
+        values = line.strip().split(",")
+        if len(values) < 3:
+            continue
+        t = None
+        for value in values[:2]:
+            if value not in ("", "N/A"):
+                t = float(value)
+                break
+        packets.append((t, "K" in values[2]))
+    return packets
+
+# ----------------------------------------------------------------------------
+
+
+def read_start_time(video):
+    """Return the start time of the container of a video.
+
+    :param video: (str) Input filename of the video
+    :return: (float) Time in seconds, or None if unknown
+
+    """
+    command = ["ffprobe", "-v", "error", "-show_entries", "format=start_time",
+               "-of", "csv=p=0", video]
+    output = run_command(command)
+    if output is None:
+        return None
+    value = output[0].decode("utf-8").strip()
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+# ----------------------------------------------------------------------------
+
+
+def _fill_times(packets):
+    """Give a time to the packets without timestamp, from the packet order.
+
+    A missing time is extrapolated from the previous known one, or from the
+    next one, with the average duration of the packets.
+
+    :param packets: (list) List of (time or None, is_keyframe)
+    :return: (list) List of (time, is_keyframe)
+    :raise: IOError if less than two packets have a time
+
+    """
+    known = [(i, p[0]) for i, p in enumerate(packets) if p[0] is not None]
+    if len(known) < 2 or known[-1][0] == known[0][0]:
+        raise IOError("The video packets have no timestamps: give the frame "
+                      "rate instead.")
+    step = (known[-1][1] - known[0][1]) / (known[-1][0] - known[0][0])
+
+    filled = list()
+    ref = known[0]
+    for i, (t, key) in enumerate(packets):
+        if t is None:
+            t = ref[1] + (i - ref[0]) * step
+        else:
+            ref = (i, t)
+        filled.append((t, key))
+    return filled
+
+# ----------------------------------------------------------------------------
+
+
+class FrameIndex(object):
+    """Time and keyframe index of the frames of a video.
+
+    Times are relative to the start of the container, see module notes:
+    they are the ones of a seek with ffmpeg. All queries are in O(log n).
+
+    >>> index = FrameIndex.from_video("video.mp4")
+    >>> frame = index.time_to_frame(7.64)
+    >>> start = index.frame_to_time(frame)
+    >>> key = index.keyframe_before(frame)
+
+    """
+
+    def __init__(self, times, keyframes, open_keyframes=()):
+        """Create an index.
+
+        :param times: (list) Sorted presentation time of each frame
+        :param keyframes: (list) Sorted positions of the keyframes
+        :param open_keyframes: (list) Sorted positions of the keyframes
+        followed by frames displayed before them
+
+        """
+        self._times = array("d", times)
+        self._keyframes = array("l", keyframes)
+        self._open = array("l", open_keyframes)
+
+    # -----------------------------------------------------------------------
+
+    @classmethod
+    def from_video(cls, video):
+        """Create the index of a video from its packets."""
+        packets = read_packets(video)
+        if len(packets) == 0:
+            raise IOError("No video packets in {:s}.".format(video))
+        if any(p[0] is None for p in packets):
+            packets = _fill_times(packets)
+
+        # leading frames of a keyframe follow it in decoding order
+        open_times = set()
+        key_time = None
+        for t, key in packets:
+            if key is True:
+                key_time = t
+            elif key_time is not None and t < key_time:
+                open_times.add(key_time)
+
+        # packets are in decoding order: sort them in presentation order
+        packets = sorted(packets)
+        start = read_start_time(video)
+        if start is None:
+            start = packets[0][0]
+        times = [p[0] - start for p in packets]
+        keyframes = [i for i, p in enumerate(packets) if p[1] is True]
+        open_keyframes = [i for i in keyframes if packets[i][0] in open_times]
+        return cls(times, keyframes, open_keyframes)
+
+    @classmethod
+    def from_fps(cls, fps, duration):
+        """Create the index of a constant frame rate, without keyframes.
+
+        :param fps: (Fraction) Frame rate
+        :param duration: (float) Duration of the video in seconds
+
+        """
+        nb = int(round(duration * fps))
+        return cls([float(i / fps) for i in range(nb)], list())
+
+    # -----------------------------------------------------------------------
+
+    @classmethod
+    def load(cls, filename):
+        """Load an index from a sidecar file.
+
+        :raise: IOError or EOFError if the file is not a complete index
+
+        """
+        with open(filename, "rb") as fp:
+            head = fp.read(len(MAGIC) + 16)
+            magic = head[:len(MAGIC)]
+            try:
+                version, nb_times, nb_keys, nb_open = struct.unpack(
+                    "<IIII", head[len(MAGIC):])
+            except struct.error:
+                raise IOError("{:s} is truncated.".format(filename))
+            if magic != MAGIC or version != VERSION:
+                raise IOError("{:s} is not a frame index.".format(filename))
+            index = cls(list(), list())
+            index._times.fromfile(fp, nb_times)
+            index._keyframes.fromfile(fp, nb_keys)
+            index._open.fromfile(fp, nb_open)
+        return index
+
+    def save(self, filename):
+        """Save the index into a sidecar file.
+
+        Arrays are stored in native byte order: the file is a cache for the
+        current machine.
+
+        """
+        with open(filename, "wb") as fp:
+            fp.write(MAGIC)
+            fp.write(struct.pack("<IIII", VERSION, len(self._times),
+                                 len(self._keyframes), len(self._open)))
+            self._times.tofile(fp)
+            self._keyframes.tofile(fp)
+            self._open.tofile(fp)
+
+    # -----------------------------------------------------------------------
+
+    def get_nframes(self):
+        """Return the number of frames."""
+        return len(self._times)
+
+    def get_keyframes(self):
+        """Return the positions of the keyframes."""
+        return list(self._keyframes)
+
+    def get_duration(self):
+        """Return the end time of the last frame."""
+        return self.frame_to_time(len(self._times))
+
+    def frame_duration(self, frame):
+        """Return the duration of a frame (in seconds)."""
+        return self.frame_to_time(frame + 1) - self.frame_to_time(frame)
+
+    # -----------------------------------------------------------------------
+
+    def frame_to_time(self, frame):
+        """Return the start time of a frame.
+
+        The end time of the last frame is returned for frame=nb of frames.
+
+        :param frame: (int) Frame position
+        :return: (float) Time in seconds
+
+        """
+        n = len(self._times)
+        if n == 0:
+            return 0.
+        if frame < n:
+            return self._times[max(0, frame)]
+        # the last frame lasts like the previous ones on average
+        last = self._times[-1]
+        if n > 1:
+            last += (self._times[-1] - self._times[0]) / (n - 1)
+        return last
+
+    def time_to_frame(self, time_value, nearest=False):
+        """Return the frame displayed at a time, or the nearest frame start.
+
+        :param time_value: (float) Time in seconds
+        :param nearest: (bool) Return the frame which starts the nearest to
+        the time instead of the one displayed at this time
+        :return: (int) Frame position, in range [0;nb of frames]
+
+        """
+        n = len(self._times)
+        if nearest is False:
+            return max(0, min(n - 1, bisect_right(self._times, time_value) - 1))
+
+        i = bisect_left(self._times, time_value)
+        if i > 0 and (i == n or
+                      time_value - self._times[i-1] < self._times[i] - time_value):
+            i -= 1
+        # the end of the last frame is nearer than its start
+        if i == n - 1 and time_value > self.frame_to_time(n - 1) + \
+                self.frame_duration(n - 1) / 2.:
+            i = n
+        return i
+
+    def end_frame(self, time_value):
+        """Return the frame at which to cut a video ending at a time.
+
+        :param time_value: (float) End time in seconds
+        :return: (int) Frame position, in range [0;nb of frames]
+        :raise: ValueError if the time is after the end of the last frame,
+        more than half a frame after
+
+        """
+        n = len(self._times)
+        if n > 0 and time_value > self.get_duration() + \
+                self.frame_duration(n - 1) / 2.:
+            raise ValueError("End time {:.3f} is after the end of the video "
+                             "{:.3f}.".format(time_value, self.get_duration()))
+        return self.time_to_frame(time_value, nearest=True)
+
+    # -----------------------------------------------------------------------
+
+    def keyframe_before(self, frame):
+        """Return the position of the keyframe at or before a frame, or 0."""
+        i = bisect_right(self._keyframes, frame)
+        if i == 0:
+            return 0
+        return self._keyframes[i - 1]
+
+    def keyframe_after(self, frame):
+        """Return the position of the keyframe at or after a frame, or None."""
+        i = bisect_left(self._keyframes, frame)
+        if i == len(self._keyframes):
+            return None
+        return self._keyframes[i]
+
+    def keyframes_between(self, first, last, closed=False):
+        """Return the keyframes in range [first;last].
+
+        :param closed: (bool) Return only the keyframes which are not open:
+        a stream copied or decoded from them starts exactly at them
+
+        """
+        keyframes = self._keyframes[bisect_left(self._keyframes, first):
+                                    bisect_right(self._keyframes, last)]
+        if closed is True:
+            return [k for k in keyframes if self.is_open(k) is False]
+        return list(keyframes)
+
+    def is_keyframe(self, frame):
+        """Return True if the frame is a keyframe."""
+        i = bisect_left(self._keyframes, frame)
+        return i < len(self._keyframes) and self._keyframes[i] == frame
+
+    def is_open(self, frame):
+        """Return True if the frame is an open keyframe, see module notes."""
+        i = bisect_left(self._open, frame)
+        return i < len(self._open) and self._open[i] == frame
+
+    def seek_time(self, frame):
+        """Return a time to seek a frame: half-way from the previous one.
+
+        Frame times are rounded in the containers: seeking exactly at the
+        time of a frame could start at the previous one or at the next one.
+
+        """
+        if frame <= 0:
+            return 0.
+        return (self.frame_to_time(frame - 1) + self.frame_to_time(frame)) / 2.
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Persistent cache of the metadata and of the decoded audio of media files.
+# Required: ffmpeg
+
+# The same audio is synchronized with several cameras, and the same camera
+# file with several takes. A media file is identified by its path, size,
+# modification time and a hash of its first and last bytes: its probe
+# result, its frame index and its decoded mono audio are stored once, and
+# any later job gets them with a lookup. The least recently used entries are removed
+# when the total size of the cache exceeds its limit, except the ones used
+# by the current run: a later step can still read them. They are released
+# at the end of the run.
+
+import os
+import json
+import hashlib
+from fractions import Fraction
+
+from .utils import get_cache_dir
+from .ffmpeg_video import probe_media, extract_audio
+from .frame_index import FrameIndex
+
+# ----------------------------------------------------------------------------
+
+HASH_SIZE = 1 << 20                 # bytes hashed at both ends of a file
+DEFAULT_MAX_SIZE = 10 * (1 << 30)   # 10GB
+
+# ----------------------------------------------------------------------------
+
+
+def file_identity(filename):
+    """Return a key identifying a file and its content.
+
+    Reading the whole file would be as long as decoding it: only HASH_SIZE
+    bytes at the beginning and at the end of the file are hashed.
+
+    :param filename: (str) Input file name
+    :return: (str) Hexadecimal digest
+
+    """
+    st = os.stat(filename)
+    h = hashlib.sha1()
+    h.update(os.path.abspath(filename).encode("utf-8"))
+    h.update("{:d} {:d}".format(st.st_size, st.st_mtime_ns).encode("ascii"))
+    with open(filename, "rb") as fp:
+        h.update(fp.read(HASH_SIZE))
+        if st.st_size > 2 * HASH_SIZE:
+            fp.seek(-HASH_SIZE, 2)
+            h.update(fp.read(HASH_SIZE))
+    return h.hexdigest()
+
+# ----------------------------------------------------------------------------
+
+
+class MediaCache(object):
+    """Cache of probe results and decoded mono audio of media files.
+
+    >>> cache = MediaCache()
+    >>> info = cache.probe_media("video.mts")
+    >>> wav = cache.mono_audio("video.mts")
+
+    """
+
+    def __init__(self, directory=None, max_size=None):
+        """Create a cache in the given directory.
+
+        :param directory: (str) Default is 'media' in the audeo cache dir
+        :param max_size: (int) Max size of the cache in bytes, default is
+        $AUDEO_CACHE_SIZE or 10GB
+
+        """
+        if directory is None:
+            directory = get_cache_dir("media")
+        else:
+            os.makedirs(directory, exist_ok=True)
+        if max_size is None:
+            max_size = int(os.getenv("AUDEO_CACHE_SIZE", DEFAULT_MAX_SIZE))
+        self._directory = directory
+        self._max_size = max_size
+        self._keys = dict()
+        self._pinned = set()
+
+    # -----------------------------------------------------------------------
+
+    def get_directory(self):
+        return self._directory
+
+    def key(self, filename):
+        """Return the identity of a file, computed once per file."""
+        if filename not in self._keys:
+            self._keys[filename] = file_identity(filename)
+        return self._keys[filename]
+
+    def entry(self, filename, suffix):
+        """Return the name of the file storing a data of a media file."""
+        return os.path.join(self._directory, self.key(filename) + suffix)
+
+    # -----------------------------------------------------------------------
+
+    def lookup(self, entry):
+        """Return True if an entry exists, and mark it as recently used."""
+        if os.path.exists(entry) is False:
+            return False
+        os.utime(entry, None)
+        self._pinned.add(entry)
+        return True
+
+    def store(self, tmp, entry):
+        """Move a file into the cache, then evict old entries if needed."""
+        os.replace(tmp, entry)
+        self._pinned.add(entry)
+        self.evict(keep=entry)
+
+    def release(self):
+        """End of the run: its entries can be evicted, then evict if needed."""
+        self._pinned = set()
+        self.evict()
+
+    # -----------------------------------------------------------------------
+
+    def probe_media(self, media):
+        """Return the description of a media file, see probe_media().
+
+        :param media: (str) Input filename of the video or of the audio
+
+        """
+        entry = self.entry(media, ".probe.json")
+        if self.lookup(entry) is True:
+            with open(entry, "r") as fp:
+                info = json.load(fp)
+            if info["video"] is not None and info["video"]["fps"] is not None:
+                info["video"]["fps"] = Fraction(info["video"]["fps"])
+            return info
+
+        info = probe_media(media)
+        tmp = "{:s}.{:d}.tmp".format(entry, os.getpid())
+        with open(tmp, "w") as fp:
+            json.dump(info, fp, default=str)
+        self.store(tmp, entry)
+        return info
+
+    # -----------------------------------------------------------------------
+
+    def frame_index(self, video):
+        """Return the index of the frames of a video, see FrameIndex.
+
+        :param video: (str) Input filename of the video
+
+        """
+        entry = self.entry(video, ".frames.idx")
+        if self.lookup(entry) is True:
+            try:
+                return FrameIndex.load(entry)
+            except (IOError, EOFError):
+                pass
+
+        index = FrameIndex.from_video(video)
+        tmp = "{:s}.{:d}.tmp".format(entry, os.getpid())
+        index.save(tmp)
+        self.store(tmp, entry)
+        return index
+
+    # -----------------------------------------------------------------------
+
+    def mono_audio(self, media, acodec="pcm_s16le", start=None,
+                   duration=None, sample_rate=None):
+        """Return a WAV file with the audio of a media mixed down to mono.
+
+        The returned file is in the cache: it must not be modified. It can
+        be memory-mapped for analysis.
+
+        :param media: (str) Input filename of the video or of the audio
+        :param acodec: (str) pcm_s16le (compact) or pcm_f32le (accurate)
+        :param start: (float) Start time of a window of the audio, or None
+        :param duration: (float) Duration of the window, or None
+        :param sample_rate: (int) Sample rate of the output, or None
+        :return: (str) WAV file name
+
+        """
+        suffix = ".mono.{:s}".format(acodec)
+        if start is not None or duration is not None:
+            suffix += ".{:.3f}+{:s}".format(
+                start or 0., "{:.3f}".format(duration) if duration else "end")
+        if sample_rate is not None:
+            suffix += ".{:d}Hz".format(sample_rate)
+        entry = self.entry(media, suffix + ".wav")
+        if self.lookup(entry) is True:
+            return entry
+
+        # the extension is the one of a WAV file for ffmpeg
+        tmp = "{:s}.{:d}.tmp.wav".format(entry[:-4], os.getpid())
+        extract_audio(media, tmp, mono=True, acodec=acodec, start=start,
+                      duration=duration, sample_rate=sample_rate)
+        if os.path.exists(tmp) is False:
+            raise IOError("The audio of {:s} can't be extracted.".format(media))
+        self.store(tmp, entry)
+        return entry
+
+    # -----------------------------------------------------------------------
+
+    def evict(self, keep=None):
+        """Remove the least recently used entries until the cache fits.
+
+        The entries used since the cache was created are not removed, until
+        they are released.
+
+        :param keep: (str) An entry to never remove
+
+        """
+        entries = list()
+        total = 0
+        for name in os.listdir(self._directory):
+            if ".tmp" in name:
+                continue
+            filename = os.path.join(self._directory, name)
+            try:
+                st = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, filename))
+            total += st.st_size
+
+        for mtime, size, filename in sorted(entries):
+            if total <= self._max_size:
+                break
+            if filename == keep or filename in self._pinned:
+                continue
+            try:
+                os.remove(filename)
+                total -= size
+            except OSError:
+                pass
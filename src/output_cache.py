@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Content-addressed cache of the output files of the steps, shared by runs.
+
+# The outputs of a step only depend on its function, its parameters and its
+# inputs: a digest of them is the key of the outputs in the cache. A step
+# whose key is in the cache is not run: its outputs are linked into the
+# working directory. The cache directory can be shared by several users
+# working on the same media files.
+# Each entry is a directory named by the key, with the output files named
+# by their base name. The least recently used entries are removed when the
+# total size of the cache exceeds its limit.
+
+import os
+import shutil
+import fcntl
+
+# ----------------------------------------------------------------------------
+
+DEFAULT_MAX_SIZE = 100 * (1 << 30)   # 100GB
+FICLONE = 0x40049409                 # ioctl to reflink a file on Linux
+
+# ----------------------------------------------------------------------------
+
+
+def link_file(src, dst):
+    """Create dst with the content of src, without copying it if possible.
+
+    dst is a hard link of src if both are on the same file system, or a
+    reflink (copy-on-write clone) if the file system supports it, or a copy.
+    src and dst must never be modified: they can share their data.
+
+    :param src: (str) Existing file name
+    :param dst: (str) File to create, removed if existing
+
+    """
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    try:
+        with open(src, "rb") as fs, open(dst, "wb") as fd:
+            fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+        return
+    except (OSError, IOError):
+        pass
+    shutil.copy2(src, dst)
+
+# ----------------------------------------------------------------------------
+
+
+class OutputCache(object):
+    """Cache of the output files of steps, indexed by a digest.
+
+    >>> cache = OutputCache("/shared/audeo")
+    >>> if cache.fetch(key, ["tmp/audio_sync.wav"]) is False:
+    >>>     ...
+    >>>     cache.store(key, ["tmp/audio_sync.wav"])
+
+    """
+
+    def __init__(self, directory, max_size=None):
+        """Create a cache in the given directory.
+
+        :param directory: (str) Directory of the cache, created if needed
+        :param max_size: (int) Max size of the cache in bytes, default is
+        $AUDEO_SHARED_CACHE_SIZE or 100GB
+
+        """
+        # shared by several users and runs starting at the same time
+        os.makedirs(directory, exist_ok=True)
+        if max_size is None:
+            max_size = int(os.getenv("AUDEO_SHARED_CACHE_SIZE",
+                                     DEFAULT_MAX_SIZE))
+        self._directory = directory
+        self._max_size = max_size
+
+    # -----------------------------------------------------------------------
+
+    def get_directory(self):
+        return self._directory
+
+    def entry(self, key):
+        """Return the directory of the outputs of a key."""
+        return os.path.join(self._directory, key)
+
+    # -----------------------------------------------------------------------
+
+    def fetch(self, key, outputs):
+        """Link the cached outputs of a key into the given files.
+
+        :param key: (str) Digest of the step
+        :param outputs: (list) Output file names of the step
+        :return: (bool) False if the outputs of the key are not all cached
+
+        """
+        entry = self.entry(key)
+        cached = [os.path.join(entry, os.path.basename(f)) for f in outputs]
+        if all(os.path.exists(f) for f in cached) is False:
+            return False
+        try:
+            for src, dst in zip(cached, outputs):
+                link_file(src, dst)
+        except OSError:
+            # the entry was evicted by another process meanwhile
+            return False
+        os.utime(entry, None)
+        return True
+
+    def store(self, key, outputs):
+        """Add the outputs of a key into the cache.
+
+        The entry is prepared in a temporary directory and renamed: other
+        processes never see an incomplete entry.
+
+        :param key: (str) Digest of the step
+        :param outputs: (list) Output file names of the step
+
+        """
+        entry = self.entry(key)
+        if os.path.exists(entry):
+            return
+        tmp = "{:s}.{:d}.tmp".format(entry, os.getpid())
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+        try:
+            for filename in outputs:
+                link_file(filename, os.path.join(tmp, os.path.basename(filename)))
+            os.rename(tmp, entry)
+        except OSError:
+            # another process stored the same key meanwhile
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+        self.evict(keep=entry)
+
+    # -----------------------------------------------------------------------
+
+    def evict(self, keep=None):
+        """Remove the least recently used entries until the cache fits.
+
+        :param keep: (str) An entry to never remove
+
+        """
+        entries = list()
+        total = 0
+        for name in os.listdir(self._directory):
+            if ".tmp" in name:
+                continue
+            entry = os.path.join(self._directory, name)
+            try:
+                size = sum(os.path.getsize(os.path.join(entry, f))
+                           for f in os.listdir(entry))
+                mtime = os.path.getmtime(entry)
+            except OSError:
+                continue
+            entries.append((mtime, size, entry))
+            total += size
+
+        for mtime, size, entry in sorted(entries):
+            if total <= self._max_size:
+                break
+            if entry == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
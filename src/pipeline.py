@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# A pipeline of steps scheduled from their input and output files.
+
+# Each step declares the files it reads and the files it creates. A step
+# depends on the steps creating its inputs, and it starts as soon as all of
+# them are finished: independent steps, like the synchronization of the
+# audio and the trimming of the video, run concurrently.
+# Like with make, a step is skipped if it is up to date: a stamp file is
+# written next to each of its outputs with a hash of its function, of its
+# parameters and of the identity of its inputs. A run interrupted by a crash
+# can then be resumed, and changing a parameter recomputes only the steps
+# it is given to, and the ones depending on their outputs.
+# With an OutputCache, the outputs of a step are also stored with a key
+# independent of the working directory: the inputs created by other steps
+# are identified by the keys of these steps. A step with a known key is
+# not run, its outputs are linked from the cache.
+
+import os
+import sys
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .utils import print_step
+from .media_cache import file_identity
+from .profiler import get_profiler
+
+# ----------------------------------------------------------------------------
+
+
+def stamp_filename(output):
+    """Return the name of the stamp file of an output file."""
+    directory, name = os.path.split(output)
+    return os.path.join(directory, ".{:s}.audeo".format(name))
+
+# ----------------------------------------------------------------------------
+
+
+class Step(object):
+    """A step of a pipeline: a function creating output files from inputs.
+
+    >>> step = Step("Trim video", trim, (video, out), [video], [out],
+    >>>             params={"from": 120, "to": 4520})
+
+    """
+
+    def __init__(self, title, function, args=(), inputs=(), outputs=(),
+                 params=None):
+        """Create a step.
+
+        :param title: (str) Title printed when the step starts
+        :param function: (callable) Function to run
+        :param args: (tuple) Arguments of the function
+        :param inputs: (list) Files read by the function
+        :param outputs: (list) Files created by the function
+        :param params: (dict) Values of the arguments changing the outputs,
+        serializable in JSON
+
+        """
+        self._title = title
+        self._function = function
+        self._args = tuple(args)
+        self._inputs = list(inputs)
+        self._outputs = list(outputs)
+        self._params = params if params is not None else dict()
+        self._number = 0
+
+    # -----------------------------------------------------------------------
+
+    def get_title(self):
+        return self._title
+
+    def get_inputs(self):
+        return self._inputs
+
+    def get_outputs(self):
+        return self._outputs
+
+    def get_number(self):
+        return self._number
+
+    def set_number(self, number):
+        self._number = number
+
+    # -----------------------------------------------------------------------
+
+    def digest(self):
+        """Return the hash of the function, parameters and inputs.
+
+        An input which doesn't exist makes the digest unique: the step is
+        never up to date.
+
+        """
+        h = hashlib.sha1()
+        h.update(self._function.__name__.encode("utf-8"))
+        h.update(json.dumps(self._params, sort_keys=True,
+                            default=str).encode("utf-8"))
+        for filename in self._inputs:
+            if os.path.exists(filename) is False:
+                h.update(os.urandom(16))
+            else:
+                h.update(file_identity(filename).encode("ascii"))
+        for filename in self._outputs:
+            h.update(os.path.abspath(filename).encode("utf-8"))
+        return h.hexdigest()
+
+    def is_up_to_date(self, digest):
+        """Return True if all outputs exist with the given digest."""
+        if len(self._outputs) == 0:
+            return False
+        for filename in self._outputs:
+            stamp = stamp_filename(filename)
+            if os.path.exists(filename) is False or \
+                    os.path.exists(stamp) is False:
+                return False
+            with open(stamp, "r") as fp:
+                if fp.read().strip() != digest:
+                    return False
+        return True
+
+    def key(self, input_keys):
+        """Return the hash of the function, parameters and inputs.
+
+        Unlike digest(), the key doesn't depend on the working directory.
+
+        :param input_keys: (dict) Key of the steps creating the inputs
+
+        """
+        h = hashlib.sha1()
+        h.update(self._function.__name__.encode("utf-8"))
+        h.update(json.dumps(self._params, sort_keys=True,
+                            default=str).encode("utf-8"))
+        for filename in self._inputs:
+            if filename in input_keys:
+                h.update(input_keys[filename].encode("ascii"))
+            else:
+                h.update(file_identity(filename).encode("ascii"))
+        for filename in self._outputs:
+            h.update(os.path.basename(filename).encode("utf-8"))
+        return h.hexdigest()
+
+    # -----------------------------------------------------------------------
+
+    def run(self, cache=None, key=None):
+        """Print the header of the step and run its function if needed.
+
+        :param cache: (OutputCache) Shared cache of the outputs, or None
+        :param key: (str) Key of the step in the cache
+
+        """
+        print_step(self._number, self._title)
+        digest = self.digest()
+        if self.is_up_to_date(digest) is True:
+            print("Up to date: skipped.")
+            sys.stdout.flush()
+            return None
+        sys.stdout.flush()
+
+        # outputs are stamped only when the function succeeded. They can
+        # be links to the files of the cache: never overwrite them in place.
+        for filename in self._outputs:
+            for f in (stamp_filename(filename), filename):
+                if os.path.exists(f):
+                    os.remove(f)
+        result = None
+        if cache is not None and cache.fetch(key, self._outputs) is True:
+            print("Restored from the cache: {:s}".format(key))
+        else:
+            result = self._function(*self._args)
+            if cache is not None:
+                cache.store(key, self._outputs)
+        for filename in self._outputs:
+            with open(stamp_filename(filename), "w") as fp:
+                fp.write(digest)
+        return result
+
+# ----------------------------------------------------------------------------
+
+
+class Pipeline(object):
+    """A graph of steps, run in parallel as soon as their inputs exist.
+
+    >>> pipeline = Pipeline(first_step=4)
+    >>> pipeline.add(Step("Synchronize audio", ...))
+    >>> pipeline.add(Step("Trim video", ...))
+    >>> pipeline.run()
+
+    """
+
+    def __init__(self, first_step=1, cache=None):
+        """Create an empty pipeline.
+
+        :param first_step: (int) Number of the first added step
+        :param cache: (OutputCache) Shared cache of the outputs, or None
+
+        """
+        self._steps = list()
+        self._producers = dict()
+        self._first_step = first_step
+        self._cache = cache
+        self._keys = dict()
+
+    # -----------------------------------------------------------------------
+
+    def add(self, step):
+        """Add a step, after the ones creating its inputs.
+
+        :param step: (Step)
+        :raise: ValueError if an output is already created by another step
+
+        """
+        for filename in step.get_outputs():
+            if filename in self._producers:
+                raise ValueError("{:s} is created by two steps."
+                                 "".format(filename))
+        for filename in step.get_outputs():
+            self._producers[filename] = step
+        step.set_number(self._first_step + len(self._steps))
+        self._steps.append(step)
+        return step
+
+    def get_steps(self):
+        return self._steps
+
+    def dependencies(self, step):
+        """Return the steps creating the inputs of a step.
+
+        Inputs which are not created by a step must already exist.
+
+        """
+        return [self._producers[f] for f in step.get_inputs()
+                if f in self._producers and self._producers[f] is not step]
+
+    def get_next_step(self):
+        """Return the number of the step following the last one."""
+        return self._first_step + len(self._steps)
+
+    def key(self, step):
+        """Return the key of a step in the cache, computed once."""
+        if step not in self._keys:
+            input_keys = dict()
+            for dep in self.dependencies(step):
+                for filename in dep.get_outputs():
+                    input_keys[filename] = self.key(dep)
+            self._keys[step] = step.key(input_keys)
+        return self._keys[step]
+
+    def _run_step(self, step):
+        with get_profiler().span(step.get_title()):
+            if self._cache is None:
+                return step.run()
+            return step.run(self._cache, self.key(step))
+
+    # -----------------------------------------------------------------------
+
+    def run(self, max_workers=None):
+        """Run all the steps, each one as soon as its dependencies are done.
+
+        No new step is started after a failure. The exception of the
+        first failed step is raised when the running ones are finished.
+
+        :param max_workers: (int) Max number of concurrent steps, default is
+        the number of steps
+
+        """
+        if len(self._steps) == 0:
+            return
+        if max_workers is None:
+            max_workers = len(self._steps)
+
+        waiting = list(self._steps)
+        done = set()
+        running = dict()
+        error = None
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            while len(waiting) > 0 or len(running) > 0:
+                if error is None:
+                    for step in list(waiting):
+                        if all(d in done for d in self.dependencies(step)):
+                            waiting.remove(step)
+                            running[pool.submit(self._run_step, step)] = step
+                    if len(running) == 0:
+                        raise ValueError("Cyclic dependencies between steps.")
+                elif len(running) == 0:
+                    break
+
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    try:
+                        future.result()
+                        done.add(step)
+                    except BaseException as e:
+                        if error is None:
+                            error = e
+
+        if error is not None:
+            raise error
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Profiling of the steps and of the commands of a run.
+
+# A span is a timed part of a run: a step of the script, or an external
+# command. The span of a step measures its wall time, the CPU time of its
+# thread and the bytes its thread read and wrote. The span of a command
+# measures the CPU time, the peak memory (RSS) and the bytes read and
+# written by the process. Commands are attributed to the step running in
+# the same thread.
+# On Linux, the usage of a process is sampled from /proc while it runs:
+# the last SAMPLE_PERIOD seconds of a command can be missed. Elsewhere, the
+# resource usage of all the children is used, which is exact only if the
+# commands don't run concurrently.
+# The spans are saved into a JSON summary and into a trace file in the
+# Chrome trace event format, to be opened with chrome://tracing or Perfetto.
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# ----------------------------------------------------------------------------
+
+SAMPLE_PERIOD = 0.25    # seconds between two samples of a process usage
+
+# ----------------------------------------------------------------------------
+
+
+def read_proc_usage(pid, task=None):
+    """Return the resource usage of a process or of a thread, from /proc.
+
+    :param pid: (int) Process identifier
+    :param task: (int) Native thread identifier, or None for the process
+    :return: (dict) with keys 'cpu_user' and 'cpu_sys' (seconds),
+    'max_rss' (bytes, process only), 'read_bytes' and 'write_bytes' (bytes
+    read and written by system calls), or None if /proc can't be read
+
+    """
+    path = "/proc/{:d}".format(pid)
+    if task is not None:
+        path = os.path.join(path, "task", str(task))
+    usage = dict()
+    try:
+        with open(os.path.join(path, "stat"), "r") as fp:
+            # the name of the command can contain spaces: skip it
+            fields = fp.read().rsplit(")", 1)[1].split()
+        ticks = float(os.sysconf("SC_CLK_TCK"))
+        usage["cpu_user"] = int(fields[11]) / ticks
+        usage["cpu_sys"] = int(fields[12]) / ticks
+        with open(os.path.join(path, "io"), "r") as fp:
+            for line in fp:
+                key, value = line.split(":")
+                if key == "rchar":
+                    usage["read_bytes"] = int(value)
+                elif key == "wchar":
+                    usage["write_bytes"] = int(value)
+        if task is None:
+            with open(os.path.join(path, "status"), "r") as fp:
+                for line in fp:
+                    if line.startswith("VmHWM:"):
+                        usage["max_rss"] = int(line.split()[1]) * 1024
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+    return usage
+
+# ----------------------------------------------------------------------------
+
+
+def children_usage():
+    """Return the resource usage of all the terminated children, or None."""
+    if resource is None:
+        return None
+    ru = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    unit = 1 if os.uname()[0] == "Darwin" else 1024
+    return {"cpu_user": ru.ru_utime,
+            "cpu_sys": ru.ru_stime,
+            "max_rss": ru.ru_maxrss * unit}
+
+# ----------------------------------------------------------------------------
+
+
+def usage_delta(before, after):
+    """Return the usage between two samples. max_rss is the one of after."""
+    if before is None or after is None:
+        return dict()
+    delta = dict()
+    for key, value in after.items():
+        if key == "max_rss":
+            delta[key] = value
+        elif key in before:
+            delta[key] = value - before[key]
+    return delta
+
+# ----------------------------------------------------------------------------
+
+
+class Profiler(object):
+    """Record the spans of a run.
+
+    >>> profiler = get_profiler()
+    >>> with profiler.span("Trim video"):
+    >>>     run_command(...)
+    >>> profiler.save("tmp")
+
+    """
+
+    def __init__(self):
+        self._origin = time.time()
+        self._spans = list()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counter = 0
+
+    # -----------------------------------------------------------------------
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = list()
+        return self._local.stack
+
+    def current(self):
+        """Return the innermost span of the thread, or None."""
+        stack = self._stack()
+        return stack[-1] if len(stack) > 0 else None
+
+    def _new_span(self, name, cat, tid):
+        parent = self.current()
+        with self._lock:
+            self._counter += 1
+            return {"id": self._counter, "name": name, "cat": cat,
+                    "parent": parent["id"] if parent is not None else None,
+                    "tid": tid}
+
+    # -----------------------------------------------------------------------
+
+    def begin(self, name, cat="step"):
+        """Start a span in the current thread.
+
+        :param name: (str) Name of the span
+        :param cat: (str) Category of the span
+        :return: (dict) The span, to be given to end()
+
+        """
+        tid = threading.get_native_id() if hasattr(threading, "get_native_id") \
+            else threading.get_ident()
+        span = self._new_span(name, cat, tid)
+        span.update({"start": time.time(),
+                     "thread_cpu": time.thread_time(),
+                     "usage": read_proc_usage(os.getpid(), tid)})
+        self._stack().append(span)
+        return span
+
+    def end(self, span):
+        """End a span started with begin()."""
+        stack = self._stack()
+        if span in stack:
+            stack.remove(span)
+        usage = usage_delta(span.pop("usage"),
+                            read_proc_usage(os.getpid(), span["tid"]))
+        usage.pop("cpu_user", None)
+        usage.pop("cpu_sys", None)
+        usage["cpu_self"] = time.thread_time() - span.pop("thread_cpu")
+        span["end"] = time.time()
+        span["usage"] = usage
+        with self._lock:
+            self._spans.append(span)
+
+    @contextmanager
+    def span(self, name, cat="step"):
+        """Context manager of a span."""
+        span = self.begin(name, cat)
+        try:
+            yield span
+        finally:
+            self.end(span)
+
+    def add_command(self, name, pid, start, end, usage, command=""):
+        """Add the span of a command which ran in the current thread.
+
+        :param name: (str) Name of the program
+        :param pid: (int) Process identifier of the command
+        :param start: (float) Start time, from time.time()
+        :param end: (float) End time, from time.time()
+        :param usage: (dict) Resource usage of the process
+        :param command: (str) Command line
+
+        """
+        span = self._new_span(name, "command", pid)
+        span.update({"start": start, "end": end,
+                     "usage": dict(usage, command=command)})
+        with self._lock:
+            self._spans.append(span)
+
+    # -----------------------------------------------------------------------
+
+    def summary(self):
+        """Return the summary of the spans.
+
+        :return: (dict) with keys 'wall' (duration of the run), 'steps' and
+        'commands'. Each step has the total usage of its commands.
+
+        """
+        with self._lock:
+            spans = sorted(self._spans, key=lambda s: s["start"])
+        names = dict((span["id"], span["name"]) for span in spans)
+        steps = dict()
+        commands = list()
+        for span in spans:
+            item = {"name": span["name"],
+                    "start": round(span["start"] - self._origin, 6),
+                    "wall": round(span["end"] - span["start"], 6)}
+            item.update(span["usage"])
+            if span["cat"] == "command":
+                item["step"] = names.get(span["parent"])
+                commands.append((span["parent"], item))
+            else:
+                item.update({"cpu_children": 0., "max_rss": 0,
+                             "commands": 0})
+                steps[span["id"]] = item
+
+        for parent, c in commands:
+            step = steps.get(parent)
+            if step is None:
+                continue
+            step["commands"] += 1
+            step["cpu_children"] += c.get("cpu_user", 0.) + c.get("cpu_sys", 0.)
+            step["max_rss"] = max(step["max_rss"], c.get("max_rss", 0))
+            for key in ("read_bytes", "write_bytes"):
+                step[key] = step.get(key, 0) + c.get(key, 0)
+
+        return {"wall": round(time.time() - self._origin, 6),
+                "steps": list(steps.values()),
+                "commands": [c for parent, c in commands]}
+
+    def trace_events(self):
+        """Return the spans as a list of Chrome trace events."""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self._spans)
+        names = dict((span["id"], span["name"]) for span in spans)
+        events = list()
+        for span in spans:
+            events.append({
+                "name": span["name"],
+                "cat": span["cat"],
+                "ph": "X",
+                "ts": int((span["start"] - self._origin) * 1e6),
+                "dur": int((span["end"] - span["start"]) * 1e6),
+                "pid": pid,
+                "tid": span["tid"],
+                "args": dict(span["usage"], parent=names.get(span["parent"]))})
+        return events
+
+    # -----------------------------------------------------------------------
+
+    def save(self, directory, prefix="profile"):
+        """Save the summary and the trace into a directory.
+
+        :return: (str, str) Names of the summary and of the trace files
+
+        """
+        summary = os.path.join(directory, prefix + ".json")
+        trace = os.path.join(directory, prefix + ".trace.json")
+        with open(summary, "w") as fp:
+            json.dump(self.summary(), fp, indent=2)
+        with open(trace, "w") as fp:
+            json.dump({"traceEvents": self.trace_events(),
+                       "displayTimeUnit": "ms"}, fp)
+        return summary, trace
+
+# ----------------------------------------------------------------------------
+
+_profiler = Profiler()
+
+
+def get_profiler():
+    """Return the profiler of the current run."""
+    return _profiler
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Cached probe of the external commands and of their capabilities.
+
+# Launching sox and ffmpeg to test them costs much more than the jobs of a
+# short synchronization. What was found is stored in a cache file, with
+# the path and the modification time of each command: a command is probed
+# again only if it was moved, installed or updated.
+
+import os
+import json
+import shutil
+import subprocess
+
+from .utils import get_cache_dir
+
+# ----------------------------------------------------------------------------
+
+CACHE_FILENAME = "toolchain.json"
+
+# ----------------------------------------------------------------------------
+
+
+def ffmpeg_encoders(path):
+    """Return the names of the encoders of ffmpeg.
+
+    :param path: (str) Path of the ffmpeg command
+    :return: (list)
+
+    """
+    try:
+        output = subprocess.check_output(
+            [path, "-hide_banner", "-encoders"],
+            stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return list()
+
+    # lines are like: " V....D libx264    libx264 H.264 / AVC ..."
+    encoders = list()
+    started = False
+    for line in output.decode("utf-8", "replace").splitlines():
+        if line.strip().startswith("------"):
+            started = True
+        elif started is True and len(line.split()) > 1:
+            encoders.append(line.split()[1])
+    return encoders
+
+# ----------------------------------------------------------------------------
+
+
+def probe_command(name):
+    """Probe a command: its path and its capabilities.
+
+    :param name: (str) Command name
+    :return: (dict)
+
+    """
+    path = shutil.which(name)
+    info = {"path": path, "mtime": None, "available": path is not None}
+    if path is not None:
+        info["mtime"] = os.stat(path).st_mtime
+        if name == "ffmpeg":
+            info["encoders"] = ffmpeg_encoders(path)
+    return info
+
+# ----------------------------------------------------------------------------
+
+
+def _load_cache(filename):
+    try:
+        with open(filename, "r") as fp:
+            return json.load(fp)
+    except (IOError, ValueError):
+        return dict()
+
+
+def _save_cache(filename, cache):
+    # write then rename: concurrent jobs never read a partial file
+    tmp = "{:s}.{:d}".format(filename, os.getpid())
+    try:
+        with open(tmp, "w") as fp:
+            json.dump(cache, fp, indent=1)
+        os.replace(tmp, filename)
+    except (IOError, OSError):
+        pass
+
+# ----------------------------------------------------------------------------
+
+
+def get_command(name):
+    """Return the cached description of a command, probed if outdated.
+
+    :param name: (str) Command name
+    :return: (dict) with keys 'path', 'mtime', 'available' and 'encoders'
+    for ffmpeg.
+
+    """
+    filename = os.path.join(get_cache_dir(), CACHE_FILENAME)
+    cache = _load_cache(filename)
+
+    path = shutil.which(name)
+    mtime = None if path is None else os.stat(path).st_mtime
+    info = cache.get(name)
+    if info is None or info["path"] != path or info["mtime"] != mtime:
+        info = probe_command(name)
+        cache[name] = info
+        _save_cache(filename, cache)
+
+    return info
+
+# ----------------------------------------------------------------------------
+
+
+def has_command(name):
+    """Return True if the command is available.
+
+    :param name: (str) Command name
+
+    """
+    return get_command(name)["available"]
+
+# ----------------------------------------------------------------------------
+
+
+def has_encoder(encoder):
+    """Return True if ffmpeg has the given encoder.
+
+    :param encoder: (str) Encoder name, ie. libx264, libx265
+
+    """
+    return encoder in get_command("ffmpeg").get("encoders", list())
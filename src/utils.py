@@ -6,7 +6,9 @@
 import sys
 import os
 import shlex
-import subprocess
+import asyncio
+
+from .async_runner import run_process, run_processes
 
 # ----------------------------------------------------------------------------
 
@@ -124,43 +126,118 @@ def seconds_to_time(value):
 def test_command(command):
     """Test if a command is available.
 
+    The result is cached, see toolchain.has_command().
+
     :param command: (str) The command to execute as a sub-process.
 
     """
-    NULL = open(os.path.devnull, "w")
-    try:
-        subprocess.call([command], stdout=NULL, stderr=subprocess.STDOUT)
-    except OSError:
-        NULL.close()
-        return False
+    # toolchain imports this module
+    from .toolchain import has_command
+    return has_command(command)
+
+# ----------------------------------------------------------------------------
+
+
+def command_timeout():
+    """Return the max duration of a command: $AUDEO_TIMEOUT or None."""
+    value = os.getenv("AUDEO_TIMEOUT")
+    if value:
+        return float(value)
+    return None
+
+# ----------------------------------------------------------------------------
+
+
+def command_to_args(command):
+    """Return a command as the list of its arguments.
+
+    :param command: (str or list) A shell-like string or a list of arguments
+
+    """
+    if isinstance(command, (list, tuple)):
+        return [str(a) for a in command]
+    return shlex.split(command)
+
 
-    NULL.close()
-    return True
+def args_to_command(args):
+    """Return a list of arguments as a shell-like string, to be printed."""
+    return " ".join(shlex.quote(a) for a in args)
 
 # ----------------------------------------------------------------------------
 
 
-def run_command(command):
+def run_command(command, timeout=None, duration=None):
     """Execute a command is available.
 
-    :param command: (str) The command to execute as a sub-process.
+    The errors of the command are streamed line by line to stderr, and the
+    progress of ffmpeg is printed there, see async_runner.
+
+    :param command: (str or list) The command to execute as a sub-process,
+    as a shell-like string or as the list of its arguments.
+    :param timeout: (float) Max duration of the command in seconds, default
+    is $AUDEO_TIMEOUT or no limit
+    :param duration: (float) Expected duration of the output of ffmpeg, to
+    estimate the remaining time of the command
+    :return: (list) The standard output of the command
+    :raise: TimeoutError if the command exceeded the timeout
+    :raise: IOError if the command failed, with the end of its errors
 
     """
+    command_args = command_to_args(command)
     print("Run command:")
-    print(command)
-    command_args = shlex.split(command)
-    p = subprocess.Popen(
-        command_args, 
-        shell=False, 
-        stdout=subprocess.PIPE, 
-        stderr=None
-        )
-    output = p.communicate()
-    message = list()
-    for m in output:
-        if m is not None:
-            message.append(m)
-        if len(message) > 0:
-            return message
-
-    print("Done.")
+    print(args_to_command(command_args))
+    sys.stdout.flush()
+    if timeout is None:
+        timeout = command_timeout()
+    returncode, output = asyncio.run(
+        run_process(command_args, timeout, duration, check=True))
+    return [output]
+
+# ----------------------------------------------------------------------------
+
+
+def run_commands(commands, max_jobs=None, timeout=None):
+    """Execute commands concurrently, in a single event loop.
+
+    :param commands: (list) The commands to execute as sub-processes,
+    strings or lists of arguments.
+    :param max_jobs: (int) Max number of commands at a time, default is all
+    :param timeout: (float) Max duration of each command in seconds, default
+    is $AUDEO_TIMEOUT or no limit
+    :return: (list) The standard output of each command
+    :raise: TimeoutError if a command exceeded the timeout, or IOError if
+    a command failed: the other commands are then killed
+
+    """
+    commands = [command_to_args(c) for c in commands]
+    for command_args in commands:
+        print("Run command:")
+        print(args_to_command(command_args))
+    sys.stdout.flush()
+    if timeout is None:
+        timeout = command_timeout()
+    results = asyncio.run(run_processes(commands, max_jobs, timeout,
+                                        check=True))
+    return [[output] for returncode, output in results]
+
+# ----------------------------------------------------------------------------
+
+
+def get_cache_dir(name=""):
+    """Return the directory in which audeo caches its data, created if needed.
+
+    It is $AUDEO_CACHE if defined, or audeo in the user cache directory.
+
+    :param name: (str) Name of a sub-directory
+    :return: (str) Directory name
+
+    """
+    cache = os.getenv("AUDEO_CACHE")
+    if cache is None:
+        base = os.getenv("XDG_CACHE_HOME",
+                         os.path.join(os.path.expanduser("~"), ".cache"))
+        cache = os.path.join(base, "audeo")
+    cache = os.path.join(cache, name)
+    # several runs can create it at the same time
+    os.makedirs(cache, exist_ok=True)
+    return cache
@@ -2,40 +2,531 @@
 # -*- coding: UTF-8 -*-
 # Brigitte Bigi
 # Utility functions for audio
-# Required: sox, sppas
+# Required: sox, sppas (only for other formats than WAV)
 
 import sys
 import os
+import mmap
+import struct
 
 from .utils import run_command
 
-sys.path.append(os.getenv("SPPAS"))
-import sppas.src.audiodata.aio
+# ----------------------------------------------------------------------------
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+CHUNK_FRAMES = 65536    # number of frames read or written at a time
+
+# Sony Wave64 uses GUIDs instead of 4 characters chunk identifiers
+W64_SUFFIX = b"\xf3\xac\xd3\x11\x8c\xd1\x00\xc0\x4f\x8e\xdb\x8a"
+W64_RIFF = b"riff\x2e\x91\xcf\x11\xa5\xd6\x28\xdb\x04\xc1\x00\x00"
+W64_WAVE = b"wave" + W64_SUFFIX
+
+# ----------------------------------------------------------------------------
+
+
+def sppas_aio():
+    """Import and return the audio module of SPPAS.
+
+    SPPAS is a large package: it is imported only when a file can't be
+    read natively, and not when this module is imported.
+
+    """
+    path = os.getenv("SPPAS")
+    if path is not None and path not in sys.path:
+        sys.path.append(path)
+    import sppas.src.audiodata.aio
+    return sppas.src.audiodata.aio
+
+# ----------------------------------------------------------------------------
+
+
+class WaveReader(object):
+    """Read the samples of a RIFF, RF64 or Wave64 file by chunks.
+
+    The header is parsed when the file is opened: the duration is known
+    without reading any sample. Samples are then either read into a buffer
+    given by the caller, so that memory is constant whatever the length of
+    the file, or accessed through a memory-map.
+
+    >>> with WaveReader("audio.wav") as fa:
+    >>>     buf = bytearray(CHUNK_FRAMES * fa.get_framesize())
+    >>>     n = fa.readinto(buf)
+
+    """
+
+    def __init__(self, audio):
+        """Open a file and read its header.
+
+        :param audio: (str) Input audio file name
+        :raise: IOError if the file is not a PCM or float WAV file
+
+        """
+        self._filename = audio
+        self._fp = open(audio, "rb")
+        try:
+            self.__read_header()
+        except struct.error:
+            # a chunk is shorter than its content
+            self._fp.close()
+            raise IOError("{:s} has a truncated header.".format(audio))
+        except Exception:
+            self._fp.close()
+            raise
+        self._pos = 0
+        self._fp.seek(self._offset)
+
+    # -----------------------------------------------------------------------
+
+    def __read_header(self):
+        head = self._fp.read(16)
+        if len(head) < 12:
+            raise IOError("{:s} is not a WAV file.".format(self._filename))
+
+        if head[0:4] in (b"RIFF", b"RF64") and head[8:12] == b"WAVE":
+            self._container = head[0:4].decode("ascii")
+            self._fp.seek(12)
+            read_chunk = self.__read_riff_chunk
+        elif head == W64_RIFF:
+            self._container = "W64"
+            if self._fp.read(8 + 16)[8:] != W64_WAVE:
+                raise IOError("{:s} is not a Wave64 file."
+                              "".format(self._filename))
+            read_chunk = self.__read_w64_chunk
+        else:
+            raise IOError("{:s} is not a WAV file.".format(self._filename))
+
+        self._format = None
+        ds64_datasize = None
+        while True:
+            name, size, padding = read_chunk()
+            if name is None:
+                raise IOError("No 'data' chunk in {:s}.".format(self._filename))
+
+            if name == b"fmt ":
+                self.__read_fmt(self._fp.read(size))
+
+            elif name == b"ds64":
+                ds64 = self._fp.read(size)
+                ds64_datasize = struct.unpack("<Q", ds64[8:16])[0]
+
+            elif name == b"data":
+                if self._format is None:
+                    raise IOError("No 'fmt ' chunk before 'data' in {:s}."
+                                  "".format(self._filename))
+                if self._container == "RF64" and size == 0xFFFFFFFF:
+                    size = ds64_datasize
+                self._offset = self._fp.tell()
+                # the size is sometimes wrong when a recording was interrupted
+                available = os.path.getsize(self._filename) - self._offset
+                if size is None or size > available:
+                    size = available
+                self._nframes = size // self.get_framesize()
+                break
+
+            else:
+                self._fp.seek(size, 1)
+
+            self._fp.seek(padding, 1)
+
+        if self._format not in (WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT):
+            raise IOError("Unsupported WAV format {:d} in {:s}."
+                          "".format(self._format, self._filename))
+
+    # -----------------------------------------------------------------------
+
+    def __read_riff_chunk(self):
+        chunk = self._fp.read(8)
+        if len(chunk) < 8:
+            return None, 0, 0
+        size = struct.unpack("<I", chunk[4:8])[0]
+        # chunks are word-aligned
+        return chunk[0:4], size, size % 2
+
+    def __read_w64_chunk(self):
+        chunk = self._fp.read(24)
+        if len(chunk) < 24:
+            return None, 0, 0
+        # sizes include the chunk header
+        size = struct.unpack("<Q", chunk[16:24])[0] - 24
+        # chunks are aligned on 8 bytes
+        return chunk[0:4], size, (8 - size % 8) % 8
+
+    # -----------------------------------------------------------------------
+
+    def __read_fmt(self, fmt):
+        tag, nchannels, framerate = struct.unpack("<HHI", fmt[0:8])
+        sampbits = struct.unpack("<H", fmt[14:16])[0]
+        if tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+            # the sub-format GUID starts with the actual format tag
+            tag = struct.unpack("<H", fmt[24:26])[0]
+        if nchannels == 0 or sampbits < 8:
+            raise IOError("Invalid 'fmt ' chunk in {:s}.".format(self._filename))
+        self._format = tag
+        self._nchannels = nchannels
+        self._framerate = framerate
+        self._sampwidth = sampbits // 8
+
+    # -----------------------------------------------------------------------
+
+    def get_container(self):
+        """Return the container: RIFF, RF64 or W64."""
+        return self._container
+
+    def get_format(self):
+        """Return the format tag of the samples (PCM or IEEE float)."""
+        return self._format
+
+    def get_framerate(self):
+        """Return the number of frames per second."""
+        return self._framerate
+
+    def get_nchannels(self):
+        """Return the number of channels."""
+        return self._nchannels
+
+    def get_sampwidth(self):
+        """Return the number of bytes of a sample."""
+        return self._sampwidth
+
+    def get_framesize(self):
+        """Return the number of bytes of a frame (a sample of each channel)."""
+        return self._nchannels * self._sampwidth
+
+    def get_nframes(self):
+        """Return the number of frames."""
+        return self._nframes
+
+    def get_offset(self):
+        """Return the position of the first sample in the file (bytes)."""
+        return self._offset
+
+    def get_duration(self):
+        """Return the duration in seconds."""
+        return float(self._nframes) / float(self._framerate)
+
+    def get_header(self):
+        """Return the header as a dictionary."""
+        return {"format": self._format,
+                "framerate": self._framerate,
+                "nchannels": self._nchannels,
+                "sampwidth": self._sampwidth,
+                "offset": self._offset,
+                "nframes": self._nframes}
+
+    # -----------------------------------------------------------------------
+
+    def tell(self):
+        """Return the current position (in frames)."""
+        return self._pos
+
+    def seek(self, pos):
+        """Go to the given position (in frames)."""
+        self._pos = max(0, min(pos, self._nframes))
+        self._fp.seek(self._offset + self._pos * self.get_framesize())
+
+    def readinto(self, buf):
+        """Read frames into a pre-allocated buffer.
+
+        :param buf: (bytearray or memoryview) The size of the buffer should
+        be a multiple of the size of a frame.
+        :return: (int) Number of frames read
+
+        """
+        framesize = self.get_framesize()
+        view = memoryview(buf).cast("B")
+        nframes = min(len(view) // framesize, self._nframes - self._pos)
+        if nframes <= 0:
+            return 0
+        n = self._fp.readinto(view[:nframes * framesize])
+        nframes = n // framesize
+        self._pos += nframes
+        return nframes
+
+    def mmap(self):
+        """Return a read-only memory-map of the whole file.
+
+        Samples are at get_offset() in the returned object.
+
+        """
+        return mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# ----------------------------------------------------------------------------
+
+
+class WaveWriter(object):
+    """Write a WAV file by chunks, with no limit of size.
+
+    A 'JUNK' chunk is reserved after the RIFF header. When the file is
+    closed, if the data is larger than the 4GB limit of RIFF, the file is
+    turned into a RF64 file by replacing this chunk with a 'ds64' one.
+
+    """
+
+    # size of the 'ds64' chunk, without any table
+    DS64_SIZE = 28
+
+    def __init__(self, audio, framerate, nchannels, sampwidth,
+                 fmt=WAVE_FORMAT_PCM):
+        """Create a file and write its header.
+
+        :param audio: (str) Output audio file name
+        :param framerate: (int) Number of frames per second
+        :param nchannels: (int) Number of channels
+        :param sampwidth: (int) Number of bytes of a sample
+        :param fmt: (int) Format tag of the samples (PCM or IEEE float)
+
+        """
+        self._fp = open(audio, "wb")
+        self._sampwidth = sampwidth
+        self._framesize = nchannels * sampwidth
+        self._datasize = 0
+
+        self._fp.write(struct.pack("<4sI4s", b"RIFF", 0, b"WAVE"))
+        self._fp.write(struct.pack("<4sI", b"JUNK", self.DS64_SIZE))
+        self._fp.write(b"\x00" * self.DS64_SIZE)
+        self._fp.write(struct.pack(
+            "<4sIHHIIHH", b"fmt ", 16, fmt, nchannels, framerate,
+            framerate * self._framesize, self._framesize, sampwidth * 8))
+        self._fp.write(struct.pack("<4sI", b"data", 0))
+        self._header_size = self._fp.tell()
+
+    # -----------------------------------------------------------------------
+
+    def get_framesize(self):
+        """Return the number of bytes of a frame."""
+        return self._framesize
+
+    def write(self, data):
+        """Append frames.
+
+        :param data: (bytes-like) Frames
+
+        """
+        self._fp.write(data)
+        self._datasize += len(data)
+
+    def write_silence(self, nframes):
+        """Append nframes of silence."""
+        # 8 bits samples are unsigned
+        value = b"\x80" if self._sampwidth == 1 else b"\x00"
+        nbytes = nframes * self._framesize
+        chunk = value * min(nbytes, CHUNK_FRAMES * self._framesize)
+        while nbytes > 0:
+            self.write(memoryview(chunk)[:nbytes])
+            nbytes -= len(chunk)
+
+    def close(self):
+        """Fix the sizes in the header and close the file."""
+        if self._datasize % 2 == 1:
+            self._fp.write(b"\x00")
+        riffsize = self._fp.tell() - 8
+
+        if riffsize <= 0xFFFFFFFF:
+            self._fp.seek(4)
+            self._fp.write(struct.pack("<I", riffsize))
+            self._fp.seek(self._header_size - 4)
+            self._fp.write(struct.pack("<I", self._datasize))
+        else:
+            nframes = self._datasize // self._framesize
+            self._fp.seek(0)
+            self._fp.write(struct.pack("<4sI4s", b"RF64", 0xFFFFFFFF, b"WAVE"))
+            self._fp.write(struct.pack("<4sIQQQI", b"ds64", self.DS64_SIZE,
+                                       riffsize, self._datasize, nframes, 0))
+            self._fp.seek(self._header_size - 4)
+            self._fp.write(struct.pack("<I", 0xFFFFFFFF))
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+# ----------------------------------------------------------------------------
+
+
+def read_wav_header(audio):
+    """Read the header of a WAV file without loading its samples.
+
+    :param audio: (str) Input audio file name
+    :return: (dict) with keys 'format', 'framerate', 'nchannels', 'sampwidth',
+    'offset' (position of the first sample in bytes) and 'nframes'.
+    :raise: IOError if the file is not a PCM or float WAV file
+
+    """
+    with WaveReader(audio) as fa:
+        return fa.get_header()
+
+# ----------------------------------------------------------------------------
+
+
+def select_channel(data, c, nchannels, sampwidth, out=None):
+    """Return the samples of a channel from interleaved frames.
+
+    :param data: (bytes-like) Frames
+    :param c: (int) Channel index (0=first channel)
+    :param nchannels: (int) Number of channels in the frames
+    :param sampwidth: (int) Number of bytes of a sample
+    :param out: (bytearray) Buffer to re-use, large enough for the result
+    :return: (memoryview)
+
+    """
+    framesize = nchannels * sampwidth
+    size = len(data) // nchannels
+    if out is None:
+        out = bytearray(size)
+    view = memoryview(out)[:size]
+    data = memoryview(data).cast("B")
+    for k in range(sampwidth):
+        view[k::sampwidth] = data[c * sampwidth + k::framesize]
+    return view
+
+# ----------------------------------------------------------------------------
+
+
+def sync_audio(audio, shift, start, end, audio_out, channel=None):
+    """Shift, pad, trim and select the channel of an audio in one pass.
+
+    The output is the part [start;end] of the input audio shifted by the
+    given delay, with silence where the input has no sample. All positions
+    are rounded to integer sample positions only once, so that the result
+    is sample-accurate. The input is read by chunks into a re-used buffer
+    and the output is written once, without any intermediate file.
+
+    :param audio: (str) Input audio file name
+    :param shift: (float) Delay (in seconds) to add to the input: negative
+    to remove the beginning, positive to insert silence
+    :param start: (float) Start time of the output in the shifted audio
+    :param end: (float) End time of the output in the shifted audio
+    :param audio_out: (str) Output audio file name
+    :param channel: (int) Channel to select (1=left, 2=right) or None for all
+
+    """
+    sync_audio_channels(audio, shift, start, end, [(channel, audio_out)])
+
+# ----------------------------------------------------------------------------
+
+
+def sync_audio_channels(audio, shift, start, end, outputs):
+    """Shift, pad and trim an audio into several outputs in one pass.
+
+    Same as sync_audio(), but each output gets its own channel, or all
+    the channels: the input is read only once whatever the number of
+    outputs, ie. to split the lavalier microphones of a recorder.
+
+    :param audio: (str) Input audio file name
+    :param shift: (float) Delay (in seconds) to add to the input
+    :param start: (float) Start time of the outputs in the shifted audio
+    :param end: (float) End time of the outputs in the shifted audio
+    :param outputs: (list) Channel (1-based, or None for all the channels)
+    and file name of each output
+    :raise: ValueError if a channel is not in the audio
+
+    """
+    with WaveReader(audio) as fa:
+        framerate = fa.get_framerate()
+        nchannels = fa.get_nchannels()
+        sampwidth = fa.get_sampwidth()
+
+        first = int(round(start * framerate)) - int(round(shift * framerate))
+        nframes = int(round(end * framerate)) - int(round(start * framerate))
+        nframes = max(0, nframes)
+        for channel, audio_out in outputs:
+            if channel is not None and (channel < 1 or channel > nchannels):
+                raise ValueError("Invalid channel {:d}: the audio has {:d} "
+                                 "channels.".format(channel, nchannels))
+
+        # the part of the outputs that comes from the input
+        lead = min(nframes, max(0, -first))
+        begin = max(0, first)
+        stop = max(begin, min(fa.get_nframes(), first + nframes))
+
+        buf = bytearray(CHUNK_FRAMES * fa.get_framesize())
+        out = bytearray(CHUNK_FRAMES * sampwidth)
+        writers = list()
+        try:
+            for channel, audio_out in outputs:
+                writers.append(WaveWriter(
+                    audio_out, framerate, 1 if channel else nchannels,
+                    sampwidth, fa.get_format()))
+            for fw in writers:
+                fw.write_silence(lead)
+            fa.seek(begin)
+            remain = stop - begin
+            while remain > 0:
+                n = fa.readinto(memoryview(buf)[:min(remain, CHUNK_FRAMES) *
+                                                 fa.get_framesize()])
+                if n == 0:
+                    break
+                frames = memoryview(buf)[:n * fa.get_framesize()]
+                for (channel, audio_out), fw in zip(outputs, writers):
+                    if channel is None:
+                        fw.write(frames)
+                    else:
+                        fw.write(select_channel(frames, channel - 1,
+                                                nchannels, sampwidth, out))
+                remain -= n
+            for fw in writers:
+                fw.write_silence(nframes - lead - (stop - begin - remain))
+        finally:
+            for fw in writers:
+                fw.close()
 
 # ----------------------------------------------------------------------------
 
 
 def test_audio(audio, workdir):
+    """Test if an audio file can be read and convert it if not.
+
+    :param audio: (str) Input audio file name
+    :param workdir: (str) Directory to save the converted file
+    :return: (str) Name of a WAV file with the content of the given audio
+
+    """
     try:
         print("Test audio file: {:s}".format(audio))
-        fa = sppas.src.audiodata.aio.open(audio)
-        print("  - duration: {:.3f}".format(fa.get_duration()))
-        print("  - framerate: {:d}".format(fa.get_framerate()))
-        print("  - channels: {:d}".format(fa.get_nchannels()))
-        print("  - bitrate: {:d}".format(fa.get_sampwidth()*8))
-        fa.close()
+        with WaveReader(audio) as fa:
+            print("  - container: {:s}".format(fa.get_container()))
+            print("  - duration: {:.3f}".format(fa.get_duration()))
+            print("  - framerate: {:d}".format(fa.get_framerate()))
+            print("  - channels: {:d}".format(fa.get_nchannels()))
+            print("  - bitrate: {:d}".format(fa.get_sampwidth()*8))
         return audio
     except Exception as e:
-        print("SPPAS was not able to read the audio file: {:s}. Try to convert "
+        print("The audio file can't be read: {:s}. Try to convert "
               "it with sox.".format(str(e)))
         new_audio = os.path.join(workdir, "audio_converted.wav")
         if os.path.exists(new_audio):
-            print("File {:s} already exists.".format(new_audio))
-            sys.exit(1)
+            # converted by a previous run into the same working directory
+            if os.path.getmtime(new_audio) >= os.path.getmtime(audio):
+                print("File {:s} already exists.".format(new_audio))
+                return new_audio
+            os.remove(new_audio)
+        # a unique name: a job never reads the partial file of another one
+        tmp = "{:s}.{:d}.tmp.wav".format(new_audio[:-4], os.getpid())
         command = "sox "
         command += "'{:s}' -b 16 ".format(audio)
-        command += "{:s} ".format(new_audio)
-        run_command(command)
+        command += "'{:s}' ".format(tmp)
+        try:
+            run_command(command)
+        except IOError:
+            pass
+        if os.path.exists(tmp) is False:
+            print("The audio file can't be converted.")
+            sys.exit(1)
+        os.replace(tmp, new_audio)
         return new_audio
     
 # ----------------------------------------------------------------------------
@@ -44,15 +535,20 @@ def test_audio(audio, workdir):
 def audio_duration(audio):
     """Return the duration of the audio (wav).
 
-    It corresponds to execute this command:
-    sox audio -n stat 2>&1 | sed -n 's#^Length (seconds):[^0-9]*\([0-9.]*\)$#\1#p'
+    Only the header is read. Other formats than WAV are read with SPPAS.
 
     :param audio: (str) Input audio file name
     :return: (float) Duration in seconds
     
     """
     try:
-        fa = sppas.src.audiodata.aio.open(audio)
+        with WaveReader(audio) as fa:
+            return fa.get_duration()
+    except IOError:
+        pass
+
+    try:
+        fa = sppas_aio().open(audio)
         d = fa.get_duration()
         fa.close()
     except Exception as e:
@@ -64,6 +560,31 @@ def audio_duration(audio):
 # ----------------------------------------------------------------------------
 
 
+def sox_effects(audio, audio_out, effects, channels=None):
+    """Apply a chain of sox effects to an audio file, in a single process.
+
+    The samples go through all the effects in memory: no intermediate file
+    is written, even to insert silence.
+
+    >>> sox_effects("in.wav", "out.wav", ["pad 1.5 0", "trim 0 60"])
+
+    :param audio: (str) Input audio file name
+    :param audio_out: (str) Output audio file name
+    :param effects: (list) Effects with their arguments, applied in order
+    :param channels: (int) Number of channels of the output, or None
+
+    """
+    command = ["sox", audio]
+    if channels is not None:
+        command += ["-c", str(channels)]
+    command.append(audio_out)
+    for effect in effects:
+        command += effect.split()
+    run_command(command)
+
+# ----------------------------------------------------------------------------
+
+
 def trim_audio(audio, duration, audio_out, begin=True):
     """Trim an audio file.
 
@@ -73,17 +594,12 @@ def trim_audio(audio, duration, audio_out, begin=True):
     :param begin: (bool) True to trim at the beginning, False to trim the end.
     
     """
-    cur_dur = audio_duration(audio)
-    trim_dur = cur_dur - duration
     if begin is True:
-        trim_start = duration 
+        effect = "trim {:f}".format(duration)
     else:
-        trim_start = 0.
-
-    command = "sox '{:s}' ".format(audio)
-    command += "'{:s}' ".format(audio_out)
-    command += "trim {:f} {:f} ".format(trim_start, trim_dur)
-    run_command(command)
+        # a negative duration is relative to the end of the audio
+        effect = "trim 0 -{:f}".format(duration)
+    sox_effects(audio, audio_out, [effect])
 
 # ----------------------------------------------------------------------------
 
@@ -98,11 +614,8 @@ def trim_audio_from_to(audio, from_time, to_time, audio_out):
     
     """
     trim_dur = to_time - from_time
-    
-    command = "sox '{:s}' ".format(audio)
-    command += "'{:s}' ".format(audio_out)
-    command += "trim {:f} {:f} ".format(from_time, trim_dur)
-    run_command(command)
+    sox_effects(audio, audio_out,
+                ["trim {:f} {:f}".format(from_time, trim_dur)])
 
 # ----------------------------------------------------------------------------
 
@@ -110,35 +623,59 @@ def trim_audio_from_to(audio, from_time, to_time, audio_out):
 def add_silence_to_audio(audio, duration, audio_out, begin=True):
     """Add silence at the begin or the end of an audio file.
 
+    The silence is generated by the pad effect of sox.
+
     :param audio: (str) Input audio file name
     :param duration: (float) Duration (in seconds) to insert
     :param audio_out: (str) Output audio file name
     :param begin: (bool) True to insert the silence at the beginning, False to append it.
     
     """
-    fa = sppas.src.audiodata.aio.open(audio)
-
-    # create a file with silence
-    command = "sox -n "
-    command += "-r {:d} ".format(fa.get_framerate())
-    command += "-c {:d} ".format(fa.get_nchannels())
-    command += "-b {:d} ".format(fa.get_sampwidth()*8)
-    command += "silence.wav "
-    command += "trim 0.0 {:f}".format(duration)
-    fa.close()    
-    run_command(command)
-
-    # concatenate the silence and the audio (or the contrary)
-    command = "sox "
     if begin is True:
-        command += "silence.wav "
-        command += "'{:s}' ".format(audio)
+        effect = "pad {:f} 0".format(duration)
     else:
-        command += "'{:s}' ".format(audio)
-        command += "silence.wav "
-    command += "'{:s}' ".format(audio_out)    
-    run_command(command)
-    os.remove("silence.wav")
+        effect = "pad 0 {:f}".format(duration)
+    sox_effects(audio, audio_out, [effect])
+
+# ----------------------------------------------------------------------------
+
+
+def shift_audio_effects(shift, start, end, channel=None):
+    """Return the sox effects of sync_audio().
+
+    :param shift: (float) Delay of the input in seconds
+    :param start: (float) Start time of the output, in the shifted time
+    :param end: (float) End time of the output, in the shifted time
+    :param channel: (int) Channel to select (1-based) or None for all
+    :return: (list) Effects for sox_effects()
+
+    """
+    effects = list()
+    if channel is not None:
+        effects.append("remix {:d}".format(channel))
+    # position of the start of the output in the input
+    first = start - shift
+    if first > 0.:
+        effects.append("trim {:f}".format(first))
+    elif first < 0.:
+        effects.append("pad {:f} 0".format(-first))
+    # silence where the input has no sample, then the exact duration
+    duration = max(0., end - start)
+    effects.append("pad 0 {:f}".format(duration))
+    effects.append("trim 0 {:f}".format(duration))
+    return effects
+
+
+def sync_audio_sox(audio, shift, start, end, audio_out, channel=None):
+    """Shift, pad, trim and select the channel of an audio with sox.
+
+    Same as sync_audio() for any audio format sox can read, in a single
+    sox process without intermediate files.
+
+    """
+    channels = 1 if channel is not None else None
+    sox_effects(audio, audio_out,
+                shift_audio_effects(shift, start, end, channel), channels)
 
 # ----------------------------------------------------------------------------
 
@@ -147,16 +684,11 @@ def extract_channel(audio, c, audio_out):
     """Extract the channel of an audio file.
 
     :param audio: (str) Input audio file name
-    :param c: (int) Channel numberi (1=left, 2=right)
+    :param c: (int) Channel number (1=left, 2=right)
     :param audio_out: (str) Output audio file name
 
     """
-    command = "sox "
-    command += "'{:s}' ".format(audio)
-    command += "-c 1 "
-    command += "'{:s}' ".format(audio_out)
-    command += "remix {:d}".format(c)
-    run_command(command)
+    sox_effects(audio, audio_out, ["remix {:d}".format(c)], channels=1)
 
 # ----------------------------------------------------------------------------
 
@@ -168,8 +700,4 @@ def mix_channels(audio, audio_out):
     :param audio_out: (str) Output audio file name
 
     """
-    command = "sox "
-    command += "'{:s}' ".format(audio)
-    command += "'{:s}' ".format(audio_out)
-    command += "remix 1,2"
-    run_command(command)
+    sox_effects(audio, audio_out, ["remix 1,2"])
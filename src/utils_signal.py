@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Utility functions to analyze audio samples.
+# Required: numpy
+
+import numpy
+
+from .utils_audio import read_wav_header, WAVE_FORMAT_IEEE_FLOAT
+
+# ----------------------------------------------------------------------------
+
+
+def pcm_memmap(audio):
+    """Memory-map the samples of a WAV file.
+
+    Nothing is loaded: samples are read from the disk only when the
+    returned array is accessed.
+
+    :param audio: (str) Input audio file name
+    :return: (numpy.memmap, dict) Samples and the header of the file.
+    The array is of shape (nframes, nchannels), or (nframes, nchannels, 3)
+    with bytes for 24 bits samples.
+
+    """
+    header = read_wav_header(audio)
+    nframes = header["nframes"]
+    nchannels = header["nchannels"]
+    sampwidth = header["sampwidth"]
+
+    shape = (nframes, nchannels)
+    if header["format"] == WAVE_FORMAT_IEEE_FLOAT:
+        dtype = "<f{:d}".format(sampwidth)
+    elif sampwidth == 1:
+        dtype = "u1"
+    elif sampwidth == 3:
+        dtype = "u1"
+        shape = (nframes, nchannels, 3)
+    else:
+        dtype = "<i{:d}".format(sampwidth)
+
+    if nframes == 0:
+        return numpy.zeros(shape, dtype=dtype), header
+
+    data = numpy.memmap(audio, dtype=dtype, mode="r",
+                        offset=header["offset"], shape=shape)
+    return data, header
+
+# ----------------------------------------------------------------------------
+
+
+def to_float(block, header):
+    """Convert a block of samples into float values in range [-1;1].
+
+    :param block: (numpy.ndarray) Samples as returned by pcm_memmap
+    :param header: (dict) Header of the file
+    :return: (numpy.ndarray) float32 array of shape (nframes, nchannels)
+
+    """
+    sampwidth = header["sampwidth"]
+    if header["format"] == WAVE_FORMAT_IEEE_FLOAT:
+        return numpy.asarray(block, dtype=numpy.float32)
+
+    if sampwidth == 1:
+        # 8 bits samples are unsigned
+        return (numpy.asarray(block, dtype=numpy.float32) - 128.) / 128.
+
+    if sampwidth == 3:
+        b = numpy.asarray(block, dtype=numpy.int32)
+        values = b[..., 0] | (b[..., 1] << 8) | (b[..., 2] << 16)
+        values = numpy.where(values >= 1 << 23, values - (1 << 24), values)
+        return values.astype(numpy.float32) / float(1 << 23)
+
+    scale = float(1 << (8 * sampwidth - 1))
+    return numpy.asarray(block, dtype=numpy.float32) / scale
+
+# ----------------------------------------------------------------------------
+
+
+def iter_mono(data, header, start=0, end=None, blocksize=None, overlap=0):
+    """Iterate over blocks of samples mixed down to mono.
+
+    Only one block is in memory at a time, whatever the file length.
+
+    :param data: (numpy.ndarray) Samples as returned by pcm_memmap
+    :param header: (dict) Header of the file
+    :param start: (int) First frame
+    :param end: (int) Last frame (excluded), default is the end of the data
+    :param blocksize: (int) Number of frames of a block, default is 10 seconds
+    :param overlap: (int) Number of frames shared by consecutive blocks
+    :return: generator of (first frame index, float32 mono samples)
+
+    """
+    nframes = len(data)
+    if end is None or end > nframes:
+        end = nframes
+    start = max(0, start)
+    if blocksize is None:
+        blocksize = 10 * header["framerate"]
+    blocksize = max(blocksize, overlap + 1)
+
+    pos = start
+    while pos < end:
+        stop = min(end, pos + blocksize)
+        block = to_float(data[pos:stop], header)
+        yield pos, block.mean(axis=1)
+        if stop == end:
+            break
+        pos = stop - overlap
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Tests of the asyncio runner of the commands and of the ffmpeg progress.
+
+import os
+import sys
+import time
+import shutil
+import asyncio
+import tempfile
+import unittest
+
+from src.async_runner import ProgressParser, run_process, run_processes
+from src.utils import run_command, run_commands
+
+# ----------------------------------------------------------------------------
+
+
+def python(code):
+    """Return the command to run a python code in a child process."""
+    return [sys.executable, "-c", code]
+
+
+FAIL = python("import sys, time\n"
+              "time.sleep(0.5)\n"
+              "sys.stderr.write('reading\\nno such file\\n')\n"
+              "sys.exit(3)")
+
+# ----------------------------------------------------------------------------
+
+
+class TestProgressParser(unittest.TestCase):
+
+    BLOCK = ["frame=250", "fps=50.0", "total_size=1024",
+             "out_time=00:00:30.000000", "speed=2.0x"]
+
+    def test_block(self):
+        parser = ProgressParser()
+        for line in self.BLOCK:
+            self.assertIsNone(parser.feed(line + "\n"))
+        self.assertIsNone(parser.feed("not a progress line"))
+        event = parser.feed("progress=continue\n")
+        self.assertEqual(event["frame"], 250)
+        self.assertEqual(event["fps"], 50.)
+        self.assertEqual(event["speed"], 2.)
+        self.assertEqual(event["out_time"], 30.)
+        self.assertEqual(event["total_size"], 1024)
+        self.assertEqual(event["status"], "continue")
+        self.assertNotIn("percent", event)
+        # a new block: the values of the previous one are forgotten
+        event = parser.feed("progress=end")
+        self.assertIsNone(event["frame"])
+        self.assertEqual(event["status"], "end")
+
+    def test_eta(self):
+        parser = ProgressParser(duration=120.)
+        for line in self.BLOCK:
+            parser.feed(line)
+        event = parser.feed("progress=continue")
+        self.assertEqual(event["percent"], 25.)
+        self.assertEqual(event["eta"], 45.)
+
+    def test_unknown_values(self):
+        parser = ProgressParser(duration=120.)
+        for line in ("out_time=N/A", "speed=N/A"):
+            parser.feed(line)
+        event = parser.feed("progress=continue")
+        self.assertIsNone(event["out_time"])
+        self.assertIsNone(event["speed"])
+        self.assertNotIn("eta", event)
+
+# ----------------------------------------------------------------------------
+
+
+class TestRunProcess(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_output(self):
+        returncode, output = asyncio.run(run_process(
+            python("print('abc')"), on_line=None, check=True))
+        self.assertEqual(returncode, 0)
+        self.assertEqual(output.strip(), b"abc")
+
+    def test_failure(self):
+        returncode, output = asyncio.run(run_process(FAIL, on_line=None))
+        self.assertEqual(returncode, 3)
+        with self.assertRaises(IOError) as error:
+            asyncio.run(run_process(FAIL, on_line=None, check=True))
+        # the end of the errors of the command is in the message
+        self.assertIn("return code 3", str(error.exception))
+        self.assertIn("no such file", str(error.exception))
+        with self.assertRaises(IOError):
+            run_command(FAIL)
+
+    def test_timeout(self):
+        with self.assertRaises(TimeoutError):
+            asyncio.run(run_process(python("import time; time.sleep(30)"),
+                                    timeout=0.5, on_line=None))
+
+    def test_cancel_on_failure(self):
+        # the other commands are killed when a command fails
+        filename = os.path.join(self._dir, "pid")
+        sleep = python("import os, time\n"
+                       "with open({!r}, 'w') as fp:\n"
+                       "    fp.write(str(os.getpid()))\n"
+                       "time.sleep(30)".format(filename))
+        start = time.time()
+        with self.assertRaises(IOError):
+            asyncio.run(run_processes([sleep, FAIL], on_line=None,
+                                      check=True))
+        self.assertLess(time.time() - start, 10.)
+        with open(filename, "r") as fp:
+            pid = int(fp.read())
+        with self.assertRaises(ProcessLookupError):
+            os.kill(pid, 0)
+        with self.assertRaises(IOError):
+            run_commands([python("pass"), FAIL])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Tests of the estimation of the offset between two recordings.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from src.audio_align import estimate_offset, estimate_offsets
+from src.audio_align import MIN_CONFIDENCE
+from src.utils_audio import WaveWriter
+
+# ----------------------------------------------------------------------------
+
+FRAMERATE = 16000
+DURATION = 10
+
+
+def delayed_signals(lag, seed=0):
+    """Return a band-limited noise and its copy delayed by lag samples.
+
+    The delay is applied in the frequency domain: it can be a fraction of
+    a sample.
+
+    """
+    rng = numpy.random.default_rng(seed)
+    n = FRAMERATE * DURATION
+    margin = FRAMERATE * 2
+    spectrum = numpy.fft.rfft(rng.normal(0., 1., n + 2 * margin))
+    freq = numpy.fft.rfftfreq(n + 2 * margin, 1. / FRAMERATE)
+    spectrum[freq > 4000.] = 0.
+    signal = numpy.fft.irfft(spectrum, n + 2 * margin)
+    delayed = numpy.fft.irfft(
+        spectrum * numpy.exp(-2j * numpy.pi * freq * lag / FRAMERATE),
+        n + 2 * margin)
+    scale = 2. * numpy.abs(signal).max()
+    return signal[margin:margin + n] / scale, delayed[margin:margin + n] / scale
+
+
+def write_wav(filename, samples):
+    """Write float samples into a mono 16 bits WAV file."""
+    pcm = numpy.clip(samples * 32767., -32768, 32767).astype("<i2")
+    with WaveWriter(filename, FRAMERATE, 1, 2) as fw:
+        fw.write(pcm.tobytes())
+
+# ----------------------------------------------------------------------------
+
+
+class TestEstimateOffset(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._rng = numpy.random.default_rng(1)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _files(self, lag, polarity=1.):
+        reference, delayed = delayed_signals(lag)
+        noise = self._rng.normal(0., 0.05, len(delayed))
+        files = [os.path.join(self._dir, name) for name in ("ref.wav",
+                                                             "other.wav")]
+        write_wav(files[0], reference)
+        write_wav(files[1], polarity * delayed + noise)
+        return files
+
+    def test_delay(self):
+        # a time t of the reference is at t + offset in the other audio
+        offset, confidence = estimate_offset(*self._files(12345.3))
+        self.assertAlmostEqual(offset * FRAMERATE, 12345.3, delta=0.1)
+        self.assertGreater(confidence, MIN_CONFIDENCE)
+
+    def test_advance(self):
+        offset, confidence = estimate_offset(*self._files(-8000.7))
+        self.assertAlmostEqual(offset * FRAMERATE, -8000.7, delta=0.1)
+        self.assertGreater(confidence, MIN_CONFIDENCE)
+
+    def test_polarity(self):
+        offset, confidence = estimate_offset(*self._files(500.5, -1.))
+        self.assertAlmostEqual(offset * FRAMERATE, 500.5, delta=0.1)
+        self.assertGreater(confidence, MIN_CONFIDENCE)
+
+    def test_unrelated(self):
+        # the peak of the correlation of noises is rejected
+        reference, other = self._files(500.5)
+        write_wav(other, self._rng.normal(0., 0.2, FRAMERATE * DURATION))
+        results = estimate_offsets(reference, [other, other])
+        self.assertEqual(len(results), 2)
+        for offset, confidence in results:
+            self.assertLess(confidence, MIN_CONFIDENCE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Tests of the manifest and of the jobs of the batch synchronizations.
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+from src.batch import read_manifest, job_command, run_jobs
+
+# ----------------------------------------------------------------------------
+
+# Script of the jobs: saves a profile, and fails if the audio is "fail.wav"
+SCRIPT = """import os, sys, json
+args = sys.argv[1:]
+workdir = args[args.index("-w") + 1]
+os.makedirs(workdir)
+with open(os.path.join(workdir, "profile.json"), "w") as fp:
+    json.dump({"steps": [{"name": "trim", "wall": 1.5}]}, fp)
+print(" ".join(args))
+sys.exit(1 if args[args.index("-a") + 1] == "fail.wav" else 0)
+"""
+
+# ----------------------------------------------------------------------------
+
+
+class TestManifest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _json(self, rows):
+        filename = os.path.join(self._dir, "manifest.json")
+        with open(filename, "w") as fp:
+            json.dump(rows, fp)
+        return filename
+
+    def test_csv(self):
+        filename = os.path.join(self._dir, "manifest.csv")
+        with open(filename, "w") as fp:
+            fp.write("audio,video,workdir,duration,outputs\n"
+                     "a1.wav,v1.mp4,out/w1,60,mkv+mp4\n"
+                     "a2.wav,v2.mp4,out/w2,,\n")
+        jobs = read_manifest(filename)
+        self.assertEqual(len(jobs), 2)
+        self.assertEqual(jobs[0]["outputs"], ["mkv", "mp4"])
+        self.assertEqual(jobs[0]["name"], "001_w1")
+        # empty values are not options
+        self.assertNotIn("duration", jobs[1])
+        self.assertEqual(jobs[1]["outputs"], [])
+        self.assertEqual(job_command(jobs[0], "embed.py"),
+                         [sys.executable, "embed.py", "-a", "a1.wav",
+                          "-v", "v1.mp4", "-d", "60", "-w", "out/w1",
+                          "--mkv", "--mp4"])
+
+    def test_json(self):
+        jobs = read_manifest(self._json([
+            {"audio": "a.wav", "video": "v.mp4", "workdir": "w",
+             "fps": 25, "outputs": ["mp4"]}]))
+        self.assertEqual(job_command(jobs[0], "embed.py")[2:],
+                         ["-a", "a.wav", "-v", "v.mp4", "-FPS", "25",
+                          "-w", "w", "--mp4"])
+
+    def test_invalid(self):
+        job = {"audio": "a.wav", "video": "v.mp4", "workdir": "w"}
+        for rows in ({"jobs": []},
+                     [job, ["a.wav", "v.mp4", "w2"]],
+                     [job, "a.wav"],
+                     [{"audio": "a.wav", "workdir": "w"}],
+                     [dict(job, outputs=["avi"])],
+                     [dict(job, outputs=5)],
+                     [job, dict(job)]):
+            with self.assertRaises(ValueError):
+                read_manifest(self._json(rows))
+        # the message gives the number of the invalid row
+        with self.assertRaisesRegex(ValueError, "Job 2"):
+            read_manifest(self._json([job, [1, 2]]))
+
+# ----------------------------------------------------------------------------
+
+
+class TestRunJobs(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._script = os.path.join(self._dir, "embed.py")
+        with open(self._script, "w") as fp:
+            fp.write(SCRIPT)
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _job(self, i, audio):
+        return {"audio": audio, "video": "v.mp4", "outputs": ["mkv"],
+                "workdir": os.path.join(self._dir, "w{:d}".format(i)),
+                "name": "{:03d}_w{:d}".format(i, i)}
+
+    def test_run(self):
+        jobs = [self._job(i, a) for i, a in enumerate(
+            ("a.wav", "fail.wav", "b.wav"), 1)]
+        logdir = os.path.join(self._dir, "logs")
+        results = run_jobs(jobs, self._script, logdir, nb_workers=2)
+        # in the order of the manifest, whatever the end order
+        self.assertEqual([r["name"] for r in results],
+                         ["001_w1", "002_w2", "003_w3"])
+        self.assertEqual([r["status"] for r in results],
+                         ["ok", "failed", "ok"])
+        self.assertEqual(results[1]["returncode"], 1)
+        self.assertEqual(results[0]["steps"], [("trim", 1.5)])
+        with open(results[0]["log"], "r") as fp:
+            self.assertIn("-a a.wav", fp.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Tests of the automatic detection of a clap in an audio.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from src.clap_detect import detect_claps, find_clap, refine_onset
+from src.utils_audio import WaveWriter
+from src.utils_signal import pcm_memmap
+
+# ----------------------------------------------------------------------------
+
+FRAMERATE = 16000
+
+
+def click_in_noise(clap, duration=2., channels=(1.,), seed=1):
+    """Return samples of a noise with a click starting at frame clap.
+
+    :param channels: (tuple) Factor of the click in each channel
+    :return: (numpy.ndarray) float samples of shape (nframes, nchannels)
+
+    """
+    rng = numpy.random.default_rng(seed)
+    n = int(duration * FRAMERATE)
+    noise = rng.normal(0., 0.005, (n, len(channels)))
+    # a broadband burst, decaying in 10ms
+    length = FRAMERATE // 100
+    burst = rng.normal(0., 0.3, length) * numpy.exp(-numpy.arange(length) /
+                                                    (length / 5.))
+    burst[0] = 0.8
+    for c, factor in enumerate(channels):
+        noise[clap:clap + length, c] += factor * burst
+    return noise
+
+
+def write_wav(filename, samples):
+    """Write float samples into a 16 bits WAV file."""
+    pcm = numpy.clip(samples * 32767., -32768, 32767).astype("<i2")
+    with WaveWriter(filename, FRAMERATE, samples.shape[1], 2) as fw:
+        fw.write(pcm.tobytes())
+
+# ----------------------------------------------------------------------------
+
+
+class TestClapDetect(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._audio = os.path.join(self._dir, "clap.wav")
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_detect(self):
+        clap = int(1.2345 * FRAMERATE)
+        write_wav(self._audio, click_in_noise(clap))
+        candidates = detect_claps(self._audio)
+        self.assertGreater(len(candidates), 0)
+        self.assertAlmostEqual(candidates[0][0], 1.2345, delta=0.002)
+        self.assertAlmostEqual(find_clap(self._audio), candidates[0][0])
+        # times are in the whole audio, not in the given range
+        candidates = detect_claps(self._audio, 1., 2.)
+        self.assertAlmostEqual(candidates[0][0], 1.2345, delta=0.002)
+
+    def test_refine_out_of_phase(self):
+        # the click is in opposite phase in both channels
+        clap = int(0.5 * FRAMERATE)
+        write_wav(self._audio, click_in_noise(clap, 1., (1., -1.)))
+        data, header = pcm_memmap(self._audio)
+        onset = refine_onset(data, header, clap + 100)
+        self.assertLessEqual(abs(onset - clap), 2)
+
+    def test_refine_flat(self):
+        write_wav(self._audio, numpy.zeros((FRAMERATE, 2)))
+        data, header = pcm_memmap(self._audio)
+        self.assertEqual(refine_onset(data, header, 8000), 8000)
+
+
+if __name__ == "__main__":
+    unittest.main()
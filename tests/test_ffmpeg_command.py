@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Tests of the builder of the command lines of ffmpeg.
+
+import unittest
+
+from src import ffmpeg_command as filters
+from src.ffmpeg_command import Filter, FilterGraph, FFmpegCommand
+from src.ffmpeg_command import escape_value, audio_sync_filters
+
+# ----------------------------------------------------------------------------
+
+
+class TestFilter(unittest.TestCase):
+
+    def test_escape_value(self):
+        self.assertEqual(escape_value(25), "25")
+        self.assertEqual(escape_value(0.5), "0.500000")
+        # escaped for the options of the filter, then for the filter graph
+        self.assertEqual(escape_value("a:b,c"), r"a\\:b\,c")
+        self.assertEqual(escape_value("[x];y"), r"\[x\]\;y")
+        self.assertEqual(escape_value("it's"), r"it\\\'s")
+        self.assertEqual(escape_value("a\\b"), r"a\\\\b")
+        self.assertEqual(escape_value("c0=c1|c1"), "c0=c1|c1")
+
+    def test_render(self):
+        self.assertEqual(str(Filter("setpts", "PTS-STARTPTS")),
+                         "setpts=PTS-STARTPTS")
+        self.assertEqual(str(Filter("trim", end_frame=25)), "trim=end_frame=25")
+        self.assertEqual(str(Filter("split")), "split")
+        # None options are ignored
+        self.assertEqual(str(Filter("trim", start_frame=None, end_frame=3)),
+                         "trim=end_frame=3")
+        self.assertEqual(str(Filter("scale", -2, 360)), "scale=-2:360")
+
+    def test_helpers(self):
+        self.assertEqual(str(filters.fps(25)), "fps=fps=25")
+        self.assertEqual(str(filters.trim(end_frame=1500)),
+                         "trim=end_frame=1500")
+        self.assertEqual(str(filters.scale(-2, 360)), "scale=-2:360")
+        self.assertEqual(str(filters.adelay(480)), "adelay=delays=480S:all=1")
+        self.assertEqual(str(filters.atrim(start_sample=10)),
+                         "atrim=start_sample=10")
+        self.assertEqual(str(filters.apad(100)), "apad=whole_len=100")
+
+    def test_pan_channel(self):
+        # the layout and the mapping are one value, separated by '|'
+        self.assertEqual(str(filters.pan_channel(1)), "pan=mono|c0=c0")
+        self.assertEqual(str(filters.pan_channel(2)), "pan=mono|c0=c1")
+
+# ----------------------------------------------------------------------------
+
+
+class TestAudioSyncFilters(unittest.TestCase):
+
+    def test_remove_beginning(self):
+        # the output starts 2s after the start of the input
+        f = [str(x) for x in audio_sync_filters(-1., 1., 3., 100)]
+        self.assertEqual(f, ["atrim=start_sample=200",
+                             "asetpts=PTS-STARTPTS",
+                             "apad=whole_len=200",
+                             "atrim=end_sample=200"])
+
+    def test_insert_silence(self):
+        f = [str(x) for x in audio_sync_filters(1.5, 0.5, 2., 100, 2)]
+        self.assertEqual(f, ["pan=mono|c0=c1",
+                             "adelay=delays=100S:all=1",
+                             "apad=whole_len=150",
+                             "atrim=end_sample=150"])
+
+    def test_rounding(self):
+        # positions are rounded to samples separately, like sync_audio()
+        f = audio_sync_filters(0.00004, 0.00006, 1.00006, 48000)
+        self.assertEqual([str(x) for x in f],
+                         ["atrim=start_sample=1", "asetpts=PTS-STARTPTS",
+                          "apad=whole_len=48000", "atrim=end_sample=48000"])
+
+    def test_no_shift(self):
+        f = [str(x) for x in audio_sync_filters(0., 0., 1., 10)]
+        self.assertEqual(f, ["apad=whole_len=10", "atrim=end_sample=10"])
+
+    def test_empty(self):
+        f = [str(x) for x in audio_sync_filters(0., 2., 1., 10)]
+        self.assertEqual(f[-1], "atrim=end_sample=0")
+
+# ----------------------------------------------------------------------------
+
+
+class TestFilterGraph(unittest.TestCase):
+
+    def test_chains(self):
+        graph = FilterGraph()
+        self.assertTrue(graph.is_empty())
+        out = graph.add_chain(["0:v"], [filters.trim(end_frame=10),
+                                        filters.split(2)], 2)
+        self.assertEqual(out, ["[s1]", "[s2]"])
+        scaled = graph.add_chain([out[1]], [filters.scale(-2, 360)])
+        self.assertEqual(scaled, ["[s3]"])
+        self.assertEqual(str(graph),
+                         "[0:v]trim=end_frame=10,split=2[s1][s2];"
+                         "[s2]scale=-2:360[s3]")
+
+    def test_empty_chain(self):
+        with self.assertRaises(ValueError):
+            FilterGraph().add_chain(["0:a"], [])
+
+# ----------------------------------------------------------------------------
+
+
+class TestFFmpegCommand(unittest.TestCase):
+
+    def test_args(self):
+        cmd = FFmpegCommand()
+        v = cmd.add_input("video file.mp4", seek=10.02)
+        a = cmd.add_input("audio.wav")
+        self.assertEqual((v, a), (0, 1))
+        out = cmd.filter(["{:d}:v".format(v)], [filters.trim(end_frame=5)])
+        cmd.add_output("out.mkv", [out[0], "{:d}:a".format(a)],
+                       fmt="matroska", vcodec="libx265", acodec="copy",
+                       options=["-crf", "0"])
+        self.assertEqual(cmd.get_args(), [
+            "ffmpeg", "-hide_banner", "-nostdin", "-y",
+            "-ss", "10.020000", "-i", "video file.mp4",
+            "-i", "audio.wav",
+            "-filter_complex", "[0:v]trim=end_frame=5[s1]",
+            "-map", "[s1]", "-map", "1:a", "-c:v", "libx265", "-c:a", "copy",
+            "-crf", "0", "-f", "matroska", "out.mkv"])
+        # the file name with a space is quoted only in the printed command
+        self.assertIn("'video file.mp4'", str(cmd))
+
+    def test_input_options(self):
+        cmd = FFmpegCommand()
+        cmd.add_input("v.mp4", seek="00:01.500", fmt="mp4",
+                      options=["-noaccurate_seek"])
+        cmd.add_output("o.ts")
+        self.assertEqual(cmd.get_args()[4:], [
+            "-noaccurate_seek", "-ss", "00:01.500", "-f", "mp4", "-i", "v.mp4",
+            "o.ts"])
+
+    def test_no_output(self):
+        cmd = FFmpegCommand()
+        cmd.add_input("v.mp4")
+        with self.assertRaises(ValueError):
+            cmd.get_args()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Tests of the commands of ffmpeg created by the functions on videos.
+
+import json
+import unittest
+from unittest import mock
+
+from src import ffmpeg_video
+from src.frame_index import FrameIndex
+
+# ----------------------------------------------------------------------------
+
+
+def option(args, name):
+    """Return the value of the last given option of a command."""
+    i = len(args) - 1 - args[::-1].index(name)
+    return args[i + 1]
+
+# ----------------------------------------------------------------------------
+
+
+class TestTrimVideo(unittest.TestCase):
+
+    def _args(self, *args, **kwargs):
+        with mock.patch("src.ffmpeg_video.run_command") as run:
+            ffmpeg_video.trim_video_at_frame(*args, **kwargs)
+        return run.call_args[0][0]
+
+    def test_seek(self):
+        # seeked half a frame before the frame 250 at 25fps
+        args = self._args("in.mp4", "00:09.980", 250, 1750, "out.mkv",
+                          profile="x264")
+        self.assertEqual(args[args.index("-i") - 2:args.index("-i") + 2],
+                         ["-ss", "00:09.980", "-i", "in.mp4"])
+        # the first frame is at time 0, not half a frame after
+        self.assertEqual(option(args, "-filter_complex"),
+                         "[0:v]trim=end_frame=1500,setpts=PTS-STARTPTS[s1]")
+        self.assertEqual(args[-1], "out.mkv")
+
+    def test_fps(self):
+        args = self._args("in.mp4", "00:09.980", 250, 1750, "out.mkv",
+                          fps=50, profile="x264")
+        self.assertEqual(option(args, "-filter_complex"),
+                         "[0:v]trim=end_frame=1500,setpts=PTS-STARTPTS,"
+                         "fps=fps=50[s1]")
+
+    def test_threads(self):
+        # the number of CPUs is not in the profile, part of the cache keys
+        self.assertNotIn("-threads", ffmpeg_video.intermediate_codec("ffv1")[1])
+        with mock.patch("src.ffmpeg_video.os.cpu_count", return_value=6):
+            args = self._args("in.mp4", "00:09.980", 250, 1750, "out.mkv",
+                              profile="ffv1")
+        self.assertEqual(option(args, "-c:v"), "ffv1")
+        self.assertEqual(option(args, "-threads"), "6")
+
+    def test_copy(self):
+        args = self._args("in.mp4", "00:10.010", 250, 1750, "out.mkv",
+                          profile="copy")
+        self.assertNotIn("-filter_complex", args)
+        self.assertEqual(option(args, "-c:v"), "copy")
+        self.assertEqual(option(args, "-frames:v"), "1500")
+        with self.assertRaises(ValueError):
+            self._args("in.mp4", "00:10.010", 250, 1750, "out.mkv", fps=50,
+                       profile="copy")
+
+# ----------------------------------------------------------------------------
+
+
+class TestTrimAndEncode(unittest.TestCase):
+
+    def test_single_decode(self):
+        with mock.patch("src.ffmpeg_video.run_command") as run:
+            ffmpeg_video.trim_and_encode(
+                "in.mp4", "sync.wav", "00:09.980", 250, 1750,
+                lossless="out.mkv", lossy="out.mp4", proxy="proxy.mp4",
+                profile="x264")
+        args = run.call_args[0][0]
+        # the video is seeked, the synchronized audio starts at 0: the
+        # video starts at 0 too, before it is split into the outputs
+        self.assertEqual(args[args.index("-i") - 2:args.index("-i") + 4],
+                         ["-ss", "00:09.980", "-i", "in.mp4", "-i", "sync.wav"])
+        self.assertEqual(option(args, "-filter_complex"),
+                         "[0:v]trim=end_frame=1500,setpts=PTS-STARTPTS,"
+                         "split=3[s1][s2][s3];[s3]scale=-2:360[s4]")
+        maps = [args[i + 1] for i, a in enumerate(args) if a == "-map"]
+        self.assertEqual(maps, ["[s1]", "1:a", "[s2]", "1:a", "[s4]", "1:a"])
+
+    def test_copy(self):
+        with self.assertRaises(ValueError):
+            ffmpeg_video.trim_and_encode("in.mp4", "sync.wav", "00:09.980",
+                                         250, 1750, lossless="out.mkv",
+                                         profile="copy")
+
+# ----------------------------------------------------------------------------
+
+
+class TestSmartEncoder(unittest.TestCase):
+
+    def _stream(self, codec, profile, level):
+        info = {"format": {"duration": "10.0", "format_name": "mp4"},
+                "streams": [{"index": 0, "codec_type": "video",
+                             "codec_name": codec, "profile": profile,
+                             "level": level, "pix_fmt": "yuv420p",
+                             "bit_rate": "8000000", "width": 1920,
+                             "height": 1080, "avg_frame_rate": "25/1"}]}
+        with mock.patch("src.ffmpeg_video.run_command",
+                        return_value=[json.dumps(info).encode("utf-8")]):
+            return ffmpeg_video.probe_media("in.mp4")["video"]
+
+    def test_h264(self):
+        options = ffmpeg_video._encoder_options(
+            self._stream("h264", "High", 41))
+        self.assertEqual(options, ["-profile:v", "high", "-pix_fmt", "yuv420p",
+                                   "-b:v", "8000000", "-level", "4.1",
+                                   "-x264-params", "repeat-headers=1"])
+
+    def test_hevc(self):
+        options = ffmpeg_video._encoder_options(
+            self._stream("hevc", "Main 10", 153))
+        self.assertEqual(option(options, "-profile:v"), "main10")
+        self.assertEqual(option(options, "-x265-params"),
+                         "level-idc=5.1:repeat-headers=1")
+
+    def test_unknown_level(self):
+        options = ffmpeg_video._encoder_options(
+            self._stream("h264", "Constrained Baseline", -99))
+        self.assertEqual(option(options, "-profile:v"), "baseline")
+        self.assertNotIn("-level", options)
+
+# ----------------------------------------------------------------------------
+
+
+class TestMpegts(unittest.TestCase):
+
+    def test_convert_concat(self):
+        with mock.patch("src.ffmpeg_video.run_command") as run:
+            ffmpeg_video.convert_to_mpegts("in.mp4", "in.ts")
+            ffmpeg_video.concat_mpegts_to_video(["a.ts", "b.ts"], "out.mp4")
+        args = run.call_args_list[0][0][0]
+        self.assertEqual(option(args, "-bsf:v"), "h264_mp4toannexb")
+        self.assertEqual(option(args, "-c:v"), "copy")
+        self.assertEqual(args[-3:], ["-f", "mpegts", "in.ts"])
+        args = run.call_args_list[1][0][0]
+        self.assertEqual(option(args, "-i"), "concat:a.ts|b.ts")
+        self.assertEqual(args[-1], "out.mp4")
+
+# ----------------------------------------------------------------------------
+
+
+class TestSmartTrim(unittest.TestCase):
+
+    def test_parts(self):
+        # 100 frames at 25fps, closed keyframes every second
+        index = FrameIndex([i / 25. for i in range(100)], [0, 25, 50, 75])
+        media = {"video": {"codec": "h264", "profile": "High", "level": 41,
+                           "pix_fmt": "yuv420p", "bit_rate": None}}
+        with mock.patch("src.ffmpeg_video.run_command") as run, \
+                mock.patch("src.ffmpeg_video.concat_mpegts_to_video"), \
+                mock.patch("src.ffmpeg_video.os.path.exists",
+                           return_value=True), \
+                mock.patch("src.ffmpeg_video.os.remove"):
+            ffmpeg_video.smart_trim("in.mp4", 10, 60, "out.mp4", "wk",
+                                    media, index)
+        head, copy, tail = [c[0][0] for c in run.call_args_list]
+        # the head is decoded from the keyframe before it
+        self.assertEqual(option(head, "-ss"), "0.380000")
+        self.assertNotIn("-noaccurate_seek", head)
+        self.assertEqual(option(head, "-frames:v"), "15")
+        self.assertEqual(option(copy, "-c:v"), "copy")
+        self.assertEqual(option(copy, "-ss"), "1.010000")
+        # the tail is decoded from its own keyframe, not the previous one
+        self.assertEqual(tail[tail.index("-ss") - 1], "-noaccurate_seek")
+        self.assertEqual(option(tail, "-ss"), "2.010000")
+        self.assertEqual(option(tail, "-c:v"), "libx264")
+        self.assertEqual(option(tail, "-frames:v"), "10")
+        self.assertEqual(option(tail, "-output_ts_offset"), "1.610000")
+
+
+if __name__ == "__main__":
+    unittest.main()
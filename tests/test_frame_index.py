@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Tests of the index of the frames of a video.
+
+import os
+import shutil
+import tempfile
+import unittest
+from fractions import Fraction
+from unittest import mock
+
+from src import frame_index
+from src.frame_index import FrameIndex, _fill_times
+
+# ----------------------------------------------------------------------------
+
+
+class TestFrameIndex(unittest.TestCase):
+
+    def setUp(self):
+        # 10 frames at 10fps, keyframes at 0, 4 (open) and 8
+        self._index = FrameIndex([i / 10. for i in range(10)], [0, 4, 8], [4])
+
+    def test_from_fps(self):
+        index = FrameIndex.from_fps(Fraction(25), 2.)
+        self.assertEqual(index.get_nframes(), 50)
+        self.assertEqual(index.get_keyframes(), [])
+        self.assertAlmostEqual(index.frame_to_time(25), 1.)
+        self.assertAlmostEqual(index.get_duration(), 2.)
+
+    def test_frame_to_time(self):
+        self.assertEqual(self._index.frame_to_time(0), 0.)
+        self.assertEqual(self._index.frame_to_time(-1), 0.)
+        self.assertAlmostEqual(self._index.frame_to_time(3), 0.3)
+        # end of the last frame
+        self.assertAlmostEqual(self._index.frame_to_time(10), 1.)
+        self.assertAlmostEqual(self._index.get_duration(), 1.)
+        self.assertAlmostEqual(self._index.frame_duration(2), 0.1)
+
+    def test_time_to_frame(self):
+        self.assertEqual(self._index.time_to_frame(0.), 0)
+        self.assertEqual(self._index.time_to_frame(0.29), 2)
+        self.assertEqual(self._index.time_to_frame(0.3), 3)
+        self.assertEqual(self._index.time_to_frame(-1.), 0)
+        self.assertEqual(self._index.time_to_frame(5.), 9)
+
+    def test_time_to_nearest_frame(self):
+        self.assertEqual(self._index.time_to_frame(0.26, nearest=True), 3)
+        self.assertEqual(self._index.time_to_frame(0.24, nearest=True), 2)
+        self.assertEqual(self._index.time_to_frame(0.93, nearest=True), 9)
+        self.assertEqual(self._index.time_to_frame(0.97, nearest=True), 10)
+        self.assertEqual(self._index.time_to_frame(-1., nearest=True), 0)
+
+    def test_end_frame(self):
+        self.assertEqual(self._index.end_frame(0.52), 5)
+        # the end of the last frame, within half a frame
+        self.assertEqual(self._index.end_frame(1.), 10)
+        self.assertEqual(self._index.end_frame(1.04), 10)
+        # the expected duration is longer than the video
+        with self.assertRaises(ValueError):
+            self._index.end_frame(1.06)
+        with self.assertRaises(ValueError):
+            self._index.end_frame(20.)
+
+    def test_keyframes(self):
+        self.assertEqual(self._index.keyframe_before(3), 0)
+        self.assertEqual(self._index.keyframe_before(4), 4)
+        self.assertEqual(self._index.keyframe_after(5), 8)
+        self.assertIsNone(self._index.keyframe_after(9))
+        self.assertEqual(self._index.keyframes_between(0, 8), [0, 4, 8])
+        self.assertEqual(self._index.keyframes_between(1, 7), [4])
+        self.assertEqual(self._index.keyframes_between(0, 8, closed=True),
+                         [0, 8])
+        self.assertTrue(self._index.is_keyframe(8))
+        self.assertFalse(self._index.is_keyframe(7))
+        self.assertTrue(self._index.is_open(4))
+        self.assertFalse(self._index.is_open(8))
+
+    def test_seek_time(self):
+        self.assertEqual(self._index.seek_time(0), 0.)
+        self.assertAlmostEqual(self._index.seek_time(4), 0.35)
+
+# ----------------------------------------------------------------------------
+
+
+class TestSidecar(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._filename = os.path.join(self._dir, "video.idx")
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_save_load(self):
+        index = FrameIndex([0., 0.04, 0.1, 0.13], [0, 2], [2])
+        index.save(self._filename)
+        loaded = FrameIndex.load(self._filename)
+        self.assertEqual(loaded.get_nframes(), 4)
+        self.assertEqual(loaded.get_keyframes(), [0, 2])
+        self.assertEqual(loaded.frame_to_time(3), 0.13)
+        self.assertTrue(loaded.is_open(2))
+
+    def test_truncated(self):
+        with open(self._filename, "wb") as fp:
+            fp.write(frame_index.MAGIC + b"\x02\x00")
+        with self.assertRaises(IOError):
+            FrameIndex.load(self._filename)
+
+    def test_version(self):
+        FrameIndex([0.], [0]).save(self._filename)
+        with mock.patch("src.frame_index.VERSION", frame_index.VERSION + 1):
+            with self.assertRaises(IOError):
+                FrameIndex.load(self._filename)
+
+# ----------------------------------------------------------------------------
+
+
+class TestFromVideo(unittest.TestCase):
+
+    def setUp(self):
+        # the video starts with the container
+        patcher = mock.patch("src.frame_index.read_start_time",
+                             side_effect=lambda video: None)
+        self._start = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_fill_times(self):
+        packets = [(None, True), (0.1, False), (None, False), (0.3, False),
+                   (None, False)]
+        times = [p[0] for p in _fill_times(packets)]
+        for t, expected in zip(times, [0., 0.1, 0.2, 0.3, 0.4]):
+            self.assertAlmostEqual(t, expected)
+        with self.assertRaises(IOError):
+            _fill_times([(None, True), (0.1, False), (None, False)])
+
+    def test_decoding_order(self):
+        # a closed GOP with B-frames, then an open GOP: the frames 0.5 and
+        # 0.6 are displayed before the keyframe 0.7 but decoded after it
+        packets = [(1.0, True), (1.3, False), (1.1, False), (1.2, False),
+                   (1.4, False), (1.7, True), (1.5, False), (1.6, False),
+                   (1.8, False)]
+        with mock.patch("src.frame_index.read_packets",
+                        return_value=packets):
+            index = FrameIndex.from_video("video.mp4")
+        self.assertEqual(index.get_nframes(), 9)
+        self.assertAlmostEqual(index.frame_to_time(0), 0.)
+        self.assertAlmostEqual(index.frame_to_time(5), 0.5)
+        self.assertEqual(index.get_keyframes(), [0, 7])
+        self.assertFalse(index.is_open(0))
+        self.assertTrue(index.is_open(7))
+
+    def test_no_timestamps(self):
+        packets = [(None, True), (None, False), (0.04, False), (0.08, False)]
+        with mock.patch("src.frame_index.read_packets",
+                        return_value=packets):
+            index = FrameIndex.from_video("video.ts")
+        self.assertAlmostEqual(index.frame_to_time(1), 0.04)
+        self.assertEqual(index.get_keyframes(), [0])
+
+    def test_start_time(self):
+        # the video starts 0.5s after the audio: times are the ones of the
+        # container, ie. of a seek or of the audio extracted from the video
+        packets = [(1.5, True), (1.54, False), (1.58, False)]
+        self._start.side_effect = lambda video: 1.
+        with mock.patch("src.frame_index.read_packets",
+                        return_value=packets):
+            index = FrameIndex.from_video("video.mp4")
+        self.assertAlmostEqual(index.frame_to_time(0), 0.5)
+        self.assertAlmostEqual(index.frame_to_time(2), 0.58)
+        self.assertEqual(index.time_to_frame(0.2), 0)
+        self.assertEqual(index.time_to_frame(0.55), 1)
+
+    def test_no_packets(self):
+        with mock.patch("src.frame_index.read_packets", return_value=[]):
+            with self.assertRaises(IOError):
+                FrameIndex.from_video("video.mp4")
+
+
+if __name__ == "__main__":
+    unittest.main()
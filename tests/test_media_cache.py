@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Tests of the cache of the metadata and of the audio of media files.
+
+import os
+import shutil
+import tempfile
+import unittest
+from fractions import Fraction
+from unittest import mock
+
+from src.media_cache import MediaCache, file_identity
+
+# ----------------------------------------------------------------------------
+
+
+def fake_extract(media, audio, **kwargs):
+    """Replace extract_audio(): write a small file."""
+    with open(audio, "wb") as fp:
+        fp.write(b"RIFF" + b"\x00" * 40)
+
+
+class TestMediaCache(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._media = os.path.join(self._dir, "video.mp4")
+        with open(self._media, "wb") as fp:
+            fp.write(b"a video")
+        self._cache = MediaCache(os.path.join(self._dir, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_file_identity(self):
+        key = file_identity(self._media)
+        self.assertEqual(file_identity(self._media), key)
+        # same size, but another content and modification time
+        with open(self._media, "wb") as fp:
+            fp.write(b"b video")
+        self.assertNotEqual(file_identity(self._media), key)
+        # same content, but touched
+        key = file_identity(self._media)
+        st = os.stat(self._media)
+        os.utime(self._media, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        self.assertNotEqual(file_identity(self._media), key)
+
+    def test_probe_media(self):
+        info = {"duration": 2., "video": {"fps": Fraction(30000, 1001)},
+                "audio": []}
+        with mock.patch("src.media_cache.probe_media",
+                        return_value=info) as probe:
+            self._cache.probe_media(self._media)
+            cached = self._cache.probe_media(self._media)
+            self.assertEqual(probe.call_count, 1)
+            self.assertEqual(cached["video"]["fps"], Fraction(30000, 1001))
+
+            # the file changed: it is probed again
+            with open(self._media, "wb") as fp:
+                fp.write(b"another video")
+            MediaCache(self._cache.get_directory()).probe_media(self._media)
+            self.assertEqual(probe.call_count, 2)
+
+    def test_mono_audio(self):
+        with mock.patch("src.media_cache.extract_audio",
+                        side_effect=fake_extract) as extract:
+            wav = self._cache.mono_audio(self._media)
+            self.assertEqual(self._cache.mono_audio(self._media), wav)
+            self.assertEqual(extract.call_count, 1)
+            self.assertTrue(wav.startswith(self._cache.get_directory()))
+            self.assertTrue(os.path.exists(wav))
+            # no temporary file is left
+            self.assertEqual(os.listdir(self._cache.get_directory()),
+                             [os.path.basename(wav)])
+
+    def test_evict(self):
+        directory = self._cache.get_directory()
+        cache = MediaCache(directory, max_size=25)
+        for i, name in enumerate(("a", "b", "c")):
+            filename = os.path.join(directory, name)
+            with open(filename, "wb") as fp:
+                fp.write(b"x" * 10)
+            os.utime(filename, (1000 + i, 1000 + i))
+        # "a" is the oldest one, but it was just used
+        self.assertTrue(cache.lookup(os.path.join(directory, "a")))
+        cache.evict()
+        self.assertEqual(sorted(os.listdir(directory)), ["a", "c"])
+        # an entry to keep is never removed
+        cache = MediaCache(directory, max_size=5)
+        cache.evict(keep=os.path.join(directory, "c"))
+        self.assertEqual(os.listdir(directory), ["c"])
+
+    def test_pinned(self):
+        # the mono audio of a first camera is still used by the run
+        directory = self._cache.get_directory()
+        cache = MediaCache(directory, max_size=25)
+        for i, name in enumerate(("a", "b")):
+            tmp = os.path.join(directory, name + ".tmp")
+            with open(tmp, "wb") as fp:
+                fp.write(b"x" * 20)
+            cache.store(tmp, os.path.join(directory, name))
+        self.assertEqual(sorted(os.listdir(directory)), ["a", "b"])
+        # released at the end of the run: the oldest one is removed
+        os.utime(os.path.join(directory, "a"), (1000, 1000))
+        cache.release()
+        self.assertEqual(os.listdir(directory), ["b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Tests of the cache of the output files of the steps.
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from src.output_cache import OutputCache, link_file
+
+# ----------------------------------------------------------------------------
+
+
+class TestLinkFile(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._src = os.path.join(self._dir, "src.wav")
+        self._dst = os.path.join(self._dir, "dst.wav")
+        with open(self._src, "wb") as fp:
+            fp.write(b"samples")
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _content(self):
+        with open(self._dst, "rb") as fp:
+            return fp.read()
+
+    def test_hardlink(self):
+        with open(self._dst, "wb") as fp:
+            fp.write(b"old")
+        link_file(self._src, self._dst)
+        self.assertTrue(os.path.samefile(self._src, self._dst))
+
+    def test_reflink(self):
+        # another file system: the file is cloned
+        with mock.patch("src.output_cache.os.link", side_effect=OSError), \
+                mock.patch("src.output_cache.fcntl.ioctl") as ioctl, \
+                mock.patch("src.output_cache.shutil.copy2") as copy:
+            link_file(self._src, self._dst)
+        self.assertEqual(ioctl.call_count, 1)
+        self.assertEqual(copy.call_count, 0)
+
+    def test_copy(self):
+        # no reflink either: the file is copied
+        with mock.patch("src.output_cache.os.link", side_effect=OSError), \
+                mock.patch("src.output_cache.fcntl.ioctl",
+                           side_effect=OSError):
+            link_file(self._src, self._dst)
+        self.assertFalse(os.path.samefile(self._src, self._dst))
+        self.assertEqual(self._content(), b"samples")
+
+# ----------------------------------------------------------------------------
+
+
+class TestOutputCache(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._cache = OutputCache(os.path.join(self._dir, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _output(self, name, content=b"x" * 10):
+        filename = os.path.join(self._dir, name)
+        with open(filename, "wb") as fp:
+            fp.write(content)
+        return filename
+
+    def test_store_fetch(self):
+        out = self._output("audio_sync.wav", b"samples")
+        self.assertFalse(self._cache.fetch("k1", [out]))
+        self._cache.store("k1", [out])
+        os.remove(out)
+        # another working directory: same base name
+        other = os.path.join(self._dir, "other")
+        os.mkdir(other)
+        restored = os.path.join(other, "audio_sync.wav")
+        self.assertTrue(self._cache.fetch("k1", [restored]))
+        with open(restored, "rb") as fp:
+            self.assertEqual(fp.read(), b"samples")
+        # not all the outputs are cached
+        self.assertFalse(self._cache.fetch("k1", [restored,
+                                                  self._output("b.wav")]))
+
+    def test_evict(self):
+        cache = OutputCache(self._cache.get_directory(), max_size=35)
+        for i, key in enumerate(("k1", "k2", "k3")):
+            cache.store(key, [self._output("{:s}.wav".format(key))])
+            os.utime(cache.entry(key), (1000 + i, 1000 + i))
+        # the least recently used entries are removed: "k1" was just used
+        self.assertTrue(cache.fetch("k1", [os.path.join(self._dir, "k1.wav")]))
+        cache.store("k4", [self._output("k4.wav")])
+        self.assertEqual(sorted(os.listdir(cache.get_directory())),
+                         ["k1", "k3", "k4"])
+
+
+if __name__ == "__main__":
+    unittest.main()
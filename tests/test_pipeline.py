@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Tests of the pipeline of steps and of their stamp files.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.pipeline import Step, Pipeline, stamp_filename
+from src.output_cache import OutputCache
+
+# ----------------------------------------------------------------------------
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._input = self._path("input.txt")
+        with open(self._input, "w") as fp:
+            fp.write("abc")
+        self._calls = list()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _path(self, name):
+        return os.path.join(self._dir, name)
+
+    def copy_upper(self, name, filename_in, filename_out):
+        """Function of the steps: copy a file in upper case."""
+        self._calls.append(name)
+        with open(filename_in, "r") as fp:
+            content = fp.read()
+        with open(filename_out, "w") as fp:
+            fp.write(content.upper())
+
+    def _step(self, name, filename_in, filename_out, params=None):
+        return Step(name, self.copy_upper, (name, filename_in, filename_out),
+                    [filename_in], [filename_out], params)
+
+    def _run(self, *steps):
+        pipeline = Pipeline()
+        for step in steps:
+            pipeline.add(step)
+        pipeline.run()
+
+    # -----------------------------------------------------------------------
+
+    def test_stamp(self):
+        out = self._path("out.txt")
+        self._run(self._step("a", self._input, out))
+        self.assertEqual(self._calls, ["a"])
+        self.assertTrue(os.path.exists(stamp_filename(out)))
+        self.assertEqual(stamp_filename(out), self._path(".out.txt.audeo"))
+        # nothing changed: skipped
+        self._run(self._step("a", self._input, out))
+        self.assertEqual(self._calls, ["a"])
+
+    def test_params_changed(self):
+        out = self._path("out.txt")
+        self._run(self._step("a", self._input, out, {"from": 1}))
+        self._run(self._step("a", self._input, out, {"from": 2}))
+        self.assertEqual(self._calls, ["a", "a"])
+        self._run(self._step("a", self._input, out, {"from": 2}))
+        self.assertEqual(self._calls, ["a", "a"])
+
+    def test_input_changed(self):
+        out = self._path("out.txt")
+        self._run(self._step("a", self._input, out))
+        with open(self._input, "w") as fp:
+            fp.write("abcd")
+        self._run(self._step("a", self._input, out))
+        self.assertEqual(self._calls, ["a", "a"])
+
+    def test_output_deleted(self):
+        out = self._path("out.txt")
+        self._run(self._step("a", self._input, out))
+        os.remove(out)
+        self._run(self._step("a", self._input, out))
+        self.assertEqual(self._calls, ["a", "a"])
+
+    def test_stamp_mismatch(self):
+        # the stamp of another run, ie. interrupted while writing the output
+        out = self._path("out.txt")
+        self._run(self._step("a", self._input, out))
+        with open(stamp_filename(out), "w") as fp:
+            fp.write("0" * 40)
+        self._run(self._step("a", self._input, out))
+        self.assertEqual(self._calls, ["a", "a"])
+        self._run(self._step("a", self._input, out))
+        self.assertEqual(self._calls, ["a", "a"])
+
+    def test_failure(self):
+        out = self._path("out.txt")
+        step = Step("fail", self.copy_upper,
+                    ("fail", self._path("missing.txt"), out), [], [out])
+        with self.assertRaises(IOError):
+            self._run(step)
+        self.assertFalse(os.path.exists(stamp_filename(out)))
+
+    # -----------------------------------------------------------------------
+
+    def test_dependencies(self):
+        # added in any order, run after the steps creating their inputs
+        out1, out2 = self._path("out1.txt"), self._path("out2.txt")
+        second = self._step("b", out1, out2)
+        first = self._step("a", self._input, out1)
+        pipeline = Pipeline(first_step=3)
+        pipeline.add(second)
+        pipeline.add(first)
+        self.assertEqual(pipeline.dependencies(second), [first])
+        self.assertEqual(pipeline.dependencies(first), [])
+        self.assertEqual(pipeline.get_next_step(), 5)
+        pipeline.run()
+        self.assertEqual(self._calls, ["a", "b"])
+        with open(out2, "r") as fp:
+            self.assertEqual(fp.read(), "ABC")
+
+        # the first output changed: the second step is run again
+        self._run(self._step("b", out1, out2), self._step("a", self._input,
+                                                          out1, {"x": 1}))
+        self.assertEqual(self._calls, ["a", "b", "a", "b"])
+
+    def test_duplicate_output(self):
+        out = self._path("out.txt")
+        pipeline = Pipeline()
+        pipeline.add(self._step("a", self._input, out))
+        with self.assertRaises(ValueError):
+            pipeline.add(self._step("b", self._input, out))
+
+    def test_cache(self):
+        cache = OutputCache(self._path("cache"))
+        out = self._path("out.txt")
+        for i in range(2):
+            pipeline = Pipeline(cache=cache)
+            pipeline.add(self._step("a", self._input, out))
+            pipeline.run()
+            os.remove(stamp_filename(out))
+        # the second run restored the output from the cache
+        self.assertEqual(self._calls, ["a"])
+        with open(out, "r") as fp:
+            self.assertEqual(fp.read(), "ABC")
+
+
+if __name__ == "__main__":
+    unittest.main()
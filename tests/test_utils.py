@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Tests of the utility functions.
+
+import sys
+import unittest
+from unittest import mock
+
+from src import utils
+
+# ----------------------------------------------------------------------------
+
+
+class TestCommand(unittest.TestCase):
+
+    def test_command(self):
+        self.assertTrue(utils.test_command(sys.executable))
+        self.assertFalse(utils.test_command("audeo-no-such-command"))
+
+    def test_cached(self):
+        # the result of the toolchain probe is used
+        with mock.patch("src.toolchain.get_command",
+                        return_value={"available": False}) as probe:
+            self.assertFalse(utils.test_command("ffmpeg"))
+        probe.assert_called_once_with("ffmpeg")
+
+
+if __name__ == "__main__":
+    unittest.main()
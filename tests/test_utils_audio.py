@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+# Brigitte Bigi
+# Tests of the reader, the writer and the synchronization of WAV files.
+
+import os
+import struct
+import shutil
+import tempfile
+import unittest
+import wave
+from unittest import mock
+
+from src.utils_audio import WaveReader, WaveWriter, read_wav_header
+from src.utils_audio import sync_audio, sync_audio_channels, audio_duration
+from src.utils_audio import trim_audio, trim_audio_from_to
+from src.utils_audio import add_silence_to_audio, sync_audio_sox
+from src.utils_audio import extract_channel, mix_channels
+from src.utils_audio import WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT
+from src.utils_audio import WAVE_FORMAT_EXTENSIBLE
+from src.utils_audio import W64_RIFF, W64_WAVE, W64_SUFFIX
+
+# ----------------------------------------------------------------------------
+
+
+def fmt_chunk(tag, nchannels, framerate, sampwidth, subformat=None):
+    """Return the content of a 'fmt ' chunk, extensible if subformat."""
+    framesize = nchannels * sampwidth
+    fmt = struct.pack("<HHIIHH", tag, nchannels, framerate,
+                      framerate * framesize, framesize, sampwidth * 8)
+    if subformat is not None:
+        # cbSize, valid bits, channel mask, sub-format GUID
+        fmt += struct.pack("<HHI", 22, sampwidth * 8, 0)
+        fmt += struct.pack("<H", subformat) + \
+            b"\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71"
+    return fmt
+
+
+def riff_file(filename, fmt, data, rf64=False):
+    """Write a RIFF file, or a RF64 file with the sizes in a 'ds64' chunk."""
+    with open(filename, "wb") as fp:
+        if rf64 is True:
+            fp.write(struct.pack("<4sI4s", b"RF64", 0xFFFFFFFF, b"WAVE"))
+            fp.write(struct.pack("<4sIQQQI", b"ds64", 28, 0, len(data), 0, 0))
+        else:
+            fp.write(struct.pack("<4sI4s", b"RIFF", 0, b"WAVE"))
+        # an unknown chunk of odd size, to be skipped with its padding
+        fp.write(struct.pack("<4sI", b"LIST", 3) + b"abc\x00")
+        fp.write(struct.pack("<4sI", b"fmt ", len(fmt)) + fmt)
+        size = 0xFFFFFFFF if rf64 is True else len(data)
+        fp.write(struct.pack("<4sI", b"data", size) + data)
+
+
+def w64_file(filename, fmt, data):
+    """Write a Sony Wave64 file."""
+    def chunk(name, content):
+        padding = b"\x00" * ((8 - len(content) % 8) % 8)
+        return name + W64_SUFFIX + struct.pack("<Q", 24 + len(content)) + \
+            content + padding
+    body = chunk(b"fmt ", fmt) + chunk(b"data", data)
+    with open(filename, "wb") as fp:
+        fp.write(W64_RIFF + struct.pack("<Q", 40 + len(body)) + W64_WAVE)
+        fp.write(body)
+
+# ----------------------------------------------------------------------------
+
+
+class TestWaveReader(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        # 5 stereo frames of 16 bits
+        self._data = struct.pack("<10h", *range(10))
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _check(self, filename, container, fmt=WAVE_FORMAT_PCM):
+        with WaveReader(filename) as fa:
+            self.assertEqual(fa.get_container(), container)
+            self.assertEqual(fa.get_format(), fmt)
+            self.assertEqual(fa.get_framerate(), 16000)
+            self.assertEqual(fa.get_nchannels(), 2)
+            self.assertEqual(fa.get_sampwidth(), 2)
+            self.assertEqual(fa.get_nframes(), 5)
+            self.assertAlmostEqual(fa.get_duration(), 5. / 16000)
+            buf = bytearray(3 * fa.get_framesize())
+            self.assertEqual(fa.readinto(buf), 3)
+            self.assertEqual(bytes(buf), self._data[:12])
+            self.assertEqual(fa.readinto(buf), 2)
+            self.assertEqual(bytes(buf[:8]), self._data[12:])
+            self.assertEqual(fa.readinto(buf), 0)
+            fa.seek(4)
+            self.assertEqual(fa.tell(), 4)
+            self.assertEqual(fa.readinto(buf), 1)
+
+    def test_riff(self):
+        filename = os.path.join(self._dir, "a.wav")
+        w = wave.open(filename, "wb")
+        w.setnchannels(2)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(self._data)
+        w.close()
+        self._check(filename, "RIFF")
+
+    def test_riff_chunks(self):
+        filename = os.path.join(self._dir, "a.wav")
+        riff_file(filename, fmt_chunk(WAVE_FORMAT_PCM, 2, 16000, 2),
+                  self._data)
+        self._check(filename, "RIFF")
+
+    def test_rf64(self):
+        filename = os.path.join(self._dir, "a.wav")
+        riff_file(filename, fmt_chunk(WAVE_FORMAT_PCM, 2, 16000, 2),
+                  self._data, rf64=True)
+        self._check(filename, "RF64")
+
+    def test_w64(self):
+        filename = os.path.join(self._dir, "a.w64")
+        w64_file(filename, fmt_chunk(WAVE_FORMAT_PCM, 2, 16000, 2), self._data)
+        self._check(filename, "W64")
+
+    def test_extensible(self):
+        filename = os.path.join(self._dir, "a.wav")
+        riff_file(filename, fmt_chunk(WAVE_FORMAT_EXTENSIBLE, 2, 16000, 2,
+                                      WAVE_FORMAT_PCM), self._data)
+        self._check(filename, "RIFF")
+        riff_file(filename, fmt_chunk(WAVE_FORMAT_EXTENSIBLE, 2, 16000, 2,
+                                      WAVE_FORMAT_IEEE_FLOAT), self._data)
+        self.assertEqual(read_wav_header(filename)["format"],
+                         WAVE_FORMAT_IEEE_FLOAT)
+
+    def test_truncated_data(self):
+        # the size of the data of an interrupted recording is too large
+        filename = os.path.join(self._dir, "a.wav")
+        riff_file(filename, fmt_chunk(WAVE_FORMAT_PCM, 2, 16000, 2),
+                  self._data)
+        with open(filename, "r+b") as fp:
+            fp.truncate(os.path.getsize(filename) - 6)
+        self.assertEqual(read_wav_header(filename)["nframes"], 3)
+
+    def test_invalid(self):
+        filename = os.path.join(self._dir, "a.wav")
+        with open(filename, "wb") as fp:
+            fp.write(b"not a wav file at all")
+        with self.assertRaises(IOError):
+            WaveReader(filename)
+        # unsupported format: A-law
+        riff_file(filename, fmt_chunk(6, 2, 16000, 2), self._data)
+        with self.assertRaises(IOError):
+            WaveReader(filename)
+
+    def test_truncated_header(self):
+        filename = os.path.join(self._dir, "a.wav")
+        riff_file(filename, fmt_chunk(WAVE_FORMAT_PCM, 2, 16000, 2)[:10],
+                  self._data)
+        with self.assertRaises(IOError):
+            WaveReader(filename)
+        # the other formats are read with SPPAS
+        with mock.patch("src.utils_audio.sppas_aio") as aio:
+            aio.return_value.open.return_value.get_duration.return_value = 1.5
+            self.assertEqual(audio_duration(filename), 1.5)
+        # no channel: no frame size
+        riff_file(filename, fmt_chunk(WAVE_FORMAT_PCM, 0, 16000, 2),
+                  self._data)
+        with self.assertRaises(IOError):
+            WaveReader(filename)
+
+# ----------------------------------------------------------------------------
+
+
+class TestWaveWriter(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_write(self):
+        filename = os.path.join(self._dir, "a.wav")
+        data = struct.pack("<6h", 1, -1, 2, -2, 3, -3)
+        with WaveWriter(filename, 8000, 2, 2) as fw:
+            fw.write(data)
+            fw.write_silence(2)
+        # readable by the standard library
+        w = wave.open(filename, "rb")
+        self.assertEqual(w.getnchannels(), 2)
+        self.assertEqual(w.getframerate(), 8000)
+        self.assertEqual(w.readframes(10), data + b"\x00" * 8)
+        w.close()
+        with WaveReader(filename) as fa:
+            self.assertEqual(fa.get_nframes(), 5)
+
+    def test_float(self):
+        filename = os.path.join(self._dir, "a.wav")
+        with WaveWriter(filename, 8000, 1, 4, WAVE_FORMAT_IEEE_FLOAT) as fw:
+            fw.write(struct.pack("<2f", 0.5, -0.5))
+        header = read_wav_header(filename)
+        self.assertEqual(header["format"], WAVE_FORMAT_IEEE_FLOAT)
+        self.assertEqual(header["nframes"], 2)
+
+    def test_odd_size(self):
+        # 8 bits samples are unsigned: the silence is 0x80. The data chunk
+        # is padded to an even size.
+        filename = os.path.join(self._dir, "a.wav")
+        with WaveWriter(filename, 8000, 1, 1) as fw:
+            fw.write(b"\x01\x02")
+            fw.write_silence(1)
+        self.assertEqual(os.path.getsize(filename) % 2, 0)
+        with WaveReader(filename) as fa:
+            self.assertEqual(fa.get_nframes(), 3)
+            buf = bytearray(3)
+            fa.readinto(buf)
+            self.assertEqual(bytes(buf), b"\x01\x02\x80")
+
+# ----------------------------------------------------------------------------
+
+
+def read_samples(filename):
+    """Return the 16 bits samples of a WAV file."""
+    with WaveReader(filename) as fa:
+        buf = bytearray(fa.get_nframes() * fa.get_framesize())
+        fa.readinto(buf)
+    return list(struct.unpack("<{:d}h".format(len(buf) // 2), bytes(buf)))
+
+
+class TestSyncAudio(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        # 30 stereo frames at 100Hz: left is i, right is -i
+        self._audio = os.path.join(self._dir, "in.wav")
+        with WaveWriter(self._audio, 100, 2, 2) as fw:
+            for i in range(30):
+                fw.write(struct.pack("<2h", i, -i))
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def _out(self, name):
+        return os.path.join(self._dir, name)
+
+    def test_insert_silence(self):
+        sync_audio(self._audio, 0.05, 0., 0.2, self._out("o.wav"), 1)
+        self.assertEqual(read_samples(self._out("o.wav")),
+                         [0] * 5 + list(range(15)))
+
+    def test_remove_beginning(self):
+        sync_audio(self._audio, -0.03, 0.01, 0.11, self._out("o.wav"), 2)
+        self.assertEqual(read_samples(self._out("o.wav")),
+                         [-i for i in range(4, 14)])
+
+    def test_pad_end(self):
+        # the input ends before the end of the output
+        sync_audio(self._audio, -0.25, 0., 0.1, self._out("o.wav"), 1)
+        self.assertEqual(read_samples(self._out("o.wav")),
+                         list(range(25, 30)) + [0] * 5)
+
+    def test_all_channels(self):
+        sync_audio(self._audio, 0.01, 0., 0.03, self._out("o.wav"))
+        with WaveReader(self._out("o.wav")) as fa:
+            self.assertEqual(fa.get_nchannels(), 2)
+        self.assertEqual(read_samples(self._out("o.wav")),
+                         [0, 0, 0, 0, 1, -1])
+
+    def test_channels(self):
+        outputs = [(2, self._out("right.wav")), (1, self._out("left.wav")),
+                   (None, self._out("all.wav"))]
+        sync_audio_channels(self._audio, 0., 0.1, 0.14, outputs)
+        self.assertEqual(read_samples(self._out("left.wav")),
+                         [10, 11, 12, 13])
+        self.assertEqual(read_samples(self._out("right.wav")),
+                         [-10, -11, -12, -13])
+        self.assertEqual(read_samples(self._out("all.wav")),
+                         [10, -10, 11, -11, 12, -12, 13, -13])
+
+    def test_24_bits(self):
+        audio = self._out("in24.wav")
+        with WaveWriter(audio, 100, 2, 3) as fw:
+            fw.write(b"\x01\x02\x03\x04\x05\x06" * 3)
+        sync_audio_channels(audio, 0., 0., 0.02, [(2, self._out("o.wav"))])
+        with WaveReader(self._out("o.wav")) as fa:
+            self.assertEqual(fa.get_sampwidth(), 3)
+            buf = bytearray(6)
+            fa.readinto(buf)
+        self.assertEqual(bytes(buf), b"\x04\x05\x06" * 2)
+
+    def test_invalid_channel(self):
+        with self.assertRaises(ValueError):
+            sync_audio_channels(self._audio, 0., 0., 0.1,
+                                [(3, self._out("o.wav"))])
+
+# ----------------------------------------------------------------------------
+
+
+class TestSoxEffects(unittest.TestCase):
+
+    def _args(self, function, *args):
+        with mock.patch("src.utils_audio.run_command") as run:
+            function(*args)
+        # a single process, without intermediate file
+        self.assertEqual(run.call_count, 1)
+        return run.call_args[0][0]
+
+    def test_trim(self):
+        self.assertEqual(self._args(trim_audio, "in.wav", 1.5, "o.wav"),
+                         ["sox", "in.wav", "o.wav", "trim", "1.500000"])
+        self.assertEqual(self._args(trim_audio, "in.wav", 1.5, "o.wav", False),
+                         ["sox", "in.wav", "o.wav", "trim", "0", "-1.500000"])
+        self.assertEqual(self._args(trim_audio_from_to, "in.wav", 1., 3.,
+                                    "o.wav"),
+                         ["sox", "in.wav", "o.wav",
+                          "trim", "1.000000", "2.000000"])
+
+    def test_silence(self):
+        self.assertEqual(self._args(add_silence_to_audio, "in.wav", 2.,
+                                    "o.wav"),
+                         ["sox", "in.wav", "o.wav", "pad", "2.000000", "0"])
+        self.assertEqual(self._args(add_silence_to_audio, "in.wav", 2.,
+                                    "o.wav", False),
+                         ["sox", "in.wav", "o.wav", "pad", "0", "2.000000"])
+
+    def test_channels(self):
+        self.assertEqual(self._args(extract_channel, "in.wav", 2, "o.wav"),
+                         ["sox", "in.wav", "-c", "1", "o.wav", "remix", "2"])
+        self.assertEqual(self._args(mix_channels, "in.wav", "o.wav"),
+                         ["sox", "in.wav", "o.wav", "remix", "1,2"])
+
+    def test_sync(self):
+        # delayed by 2s: silence is inserted, then the exact duration
+        self.assertEqual(self._args(sync_audio_sox, "in.wav", 2., 0., 10.,
+                                    "o.wav", 1),
+                         ["sox", "in.wav", "-c", "1", "o.wav", "remix", "1",
+                          "pad", "2.000000", "0", "pad", "0", "10.000000",
+                          "trim", "0", "10.000000"])
+        # advanced by 2s: the beginning is removed
+        self.assertEqual(self._args(sync_audio_sox, "in.wav", -2., 1., 5.,
+                                    "o.wav"),
+                         ["sox", "in.wav", "o.wav", "trim", "3.000000",
+                          "pad", "0", "4.000000", "trim", "0", "4.000000"])
+
+
+if __name__ == "__main__":
+    unittest.main()